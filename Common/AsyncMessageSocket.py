@@ -0,0 +1,210 @@
+import asyncio
+import numpy as np
+from numpy import dtype   #for eval of the array infos
+from fractions import Fraction
+
+from MessageSocket import LEN_STRUCT, BufferPool, bufferView
+from FrameHeader import *
+
+## Asyncio version of MessageSocket
+## Same messages (counted buffers, strings, objects, headers, arrays) over the transport of a
+## MessageProtocol. Receive and send methods are coroutines,
+## sending waits for the drain of the write buffer so the memory stays bounded
+## Received buffers come from a BufferPool, release them when done
+
+STAGING_SIZE = 256*1024     #Bytes received before they are asked for
+DIRECT_READ = 4096          #Reads at least this size go directly to the buffer of the reader
+
+## Receive side without allocation: the event loop reads the socket directly into the buffer
+## given to readInto (get_buffer) when it is waiting for DIRECT_READ bytes or more, the small
+## reads (lengths, headers) and the bytes arriving before they are asked for go to a
+## preallocated staging buffer. Reading is paused when the staging buffer is full and resumed
+## when there is room again (grown if the loop still asks for a buffer when it is full)
+class MessageProtocol(asyncio.BufferedProtocol) :
+    def __init__(self, stagingSize=STAGING_SIZE):
+        self.staging = memoryview(bytearray(stagingSize))
+        self.start = 0          #Bytes staged: staging[start:end]
+        self.end = 0
+        self.target = None      #View waited for by readInto and bytes already in it
+        self.filled = 0
+        self.direct = False     #The last buffer given is the target
+        self.waiter = None
+        self.closed = False
+        self.readPaused = False
+        self.writePaused = False
+        self.drainWaiter = None
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def get_buffer(self, sizehint):
+        if self.target != None and self.target.nbytes - self.filled >= DIRECT_READ :
+            self.direct = True
+            return self.target[self.filled:]
+        self.direct = False
+        if self.start == self.end :
+            self.start = self.end = 0
+        elif self.end == self.staging.nbytes and self.start > 0 :     #Room at the start only
+            n = self.end - self.start
+            self.staging[:n] = self.staging[self.start:self.end]
+            self.start, self.end = 0, n
+        elif self.end == self.staging.nbytes :     #Full, never an empty buffer to the loop
+            staging = memoryview(bytearray(2*self.staging.nbytes))
+            staging[:self.end] = self.staging
+            self.staging = staging
+        return self.staging[self.end:]
+
+    def buffer_updated(self, nbytes):
+        if self.direct :
+            self.filled += nbytes
+        else :
+            self.end += nbytes
+            if self.target != None :
+                self.unstage()
+        if self.target != None and self.filled == self.target.nbytes :
+            self.wake(True)
+        elif self.end - self.start == self.staging.nbytes and not self.readPaused :
+            self.readPaused = True
+            self.transport.pause_reading()
+
+#Staged bytes to the target
+    def unstage(self):
+        n = min(self.end - self.start, self.target.nbytes - self.filled)
+        self.target[self.filled:self.filled + n] = self.staging[self.start:self.start + n]
+        self.start += n
+        self.filled += n
+
+    def wake(self, result):
+        self.target = None
+        waiter = self.waiter
+        self.waiter = None
+        if waiter != None and not waiter.done() :
+            waiter.set_result(result)
+
+    def eof_received(self):
+        self.connection_lost(None)
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.wake(None)
+        self.resume_writing()
+
+    def pause_writing(self):
+        self.writePaused = True
+
+    def resume_writing(self):
+        self.writePaused = False
+        waiter = self.drainWaiter
+        self.drainWaiter = None
+        if waiter != None and not waiter.done() :
+            waiter.set_result(None)
+
+#Read view.nbytes bytes into view, None if the connection is closed
+    async def readInto(self, view):
+        self.target = view
+        self.filled = 0
+        self.unstage()
+        if self.readPaused and not self.closed and self.end - self.start < self.staging.nbytes :
+            self.readPaused = False
+            self.transport.resume_reading()
+        if self.filled == view.nbytes :
+            self.target = None
+            return True
+        if self.closed :
+            self.target = None
+            return None
+        self.waiter = asyncio.get_running_loop().create_future()
+        return await self.waiter
+
+    def write(self, buf):
+        self.transport.write(buf)
+
+    async def drain(self):
+        if self.closed :
+            raise ConnectionError('Connection closed')
+        if self.writePaused :
+            self.drainWaiter = asyncio.get_running_loop().create_future()
+            await self.drainWaiter
+
+class AsyncMessageSocket() :
+    def __init__(self, protocol, pool=None):
+        self.protocol = protocol
+        self.pool = pool if pool != None else BufferPool()
+        self.lenBuf = bytearray(LEN_STRUCT.size)
+
+    def close(self):
+        self.protocol.transport.close()
+
+    def shutdown(self):
+        if self.protocol.transport.can_write_eof() :
+            self.protocol.transport.write_eof()
+
+#Read view.nbytes bytes into view, None if the connection is closed
+    async def readInto(self, view):
+        return await self.protocol.readInto(view)
+
+    async def read(self, len):
+        buf = self.pool.acquire(len)
+        if await self.readInto(buf) == None :
+            self.pool.release(buf)
+            return None
+        return buf
+
+    def release(self, buf):
+        self.pool.release(buf)
+
+    async def sendMessages(self, bufs):
+        for buf in bufs :
+            view = bufferView(buf)
+            self.protocol.write(LEN_STRUCT.pack(view.nbytes))
+            self.protocol.write(view)
+        await self.protocol.drain()
+
+    async def sendMsg(self, buf):
+        await self.sendMessages((buf,))
+
+    async def receiveMsg(self):
+        if await self.readInto(memoryview(self.lenBuf)) == None :
+            return None
+        return await self.read(LEN_STRUCT.unpack(self.lenBuf)[0])
+
+    async def sendString(self, s):
+        await self.sendMsg(s.encode())
+
+    async def receiveString(self):
+        buf = await self.receiveMsg()
+        if buf == None :
+            return None
+        s = str(buf, 'utf-8')
+        self.release(buf)
+        return s
+
+    async def sendObject(self, obj):
+        await self.sendString(str((obj,'')))
+
+    async def receiveObject(self):
+        s = await self.receiveString()
+        if s == None :
+            return None
+        return eval(s)[0]
+
+    async def sendHeader(self, header, payload=None):
+        if payload is None :
+            await self.sendMsg(encodeHeader(header))
+        else :
+            await self.sendMessages((encodeHeader(header), payload))
+
+    async def receiveHeader(self):
+        buf = await self.receiveMsg()
+        if buf == None :
+            return None
+        header = decodeHeader(buf)
+        self.release(buf)
+        return header
+
+#Numpy array, a view on a pooled buffer (see release)
+    async def receiveArray(self):
+        infos = await self.receiveObject()
+        buf = await self.receiveMsg()
+        return np.frombuffer(buf, infos[2]).reshape(infos[1])
@@ -0,0 +1,208 @@
+import socket
+import asyncio
+from collections import deque
+from threading import Thread
+
+from Constants import *
+from MessageSocket import MessageSocket, BufferPool, bufferView
+from MultiplexSocket import FRAME_STRUCT, CHANNEL_PRIORITIES
+from AsyncMessageSocket import *
+
+## Asyncio version of MultiplexSocket, same frames on the wire
+## The reader task keeps reading the socket and queues the messages per channel,
+## the writer task sends the next chunk of the highest priority channel
+## AsyncConnection runs the event loop in its own thread, the coroutines use AsyncChannel,
+## the threads (commands, telemetry) use BlockingChannel with the MessageSocket interface
+
+STAGING_LIMIT = 4*1024*1024     #Staging buffer, reading goes on while the pipeline is busy
+
+class AsyncMultiplexSocket() :
+    chunkSize = 32768
+
+    def __init__(self, protocol, pool=None):
+        self.pool = pool if pool != None else BufferPool(32)
+        self.transport = AsyncMessageSocket(protocol, self.pool)
+        self.pending = {}   #priority -> deque of [channel, view, offset, event]
+        self.queues = {}    #channel -> asyncio.Queue of received messages
+        self.wakeup = asyncio.Event()
+        self.closed = False
+        self.writerTask = asyncio.create_task(self.writer())
+        self.readerTask = asyncio.create_task(self.reader())
+
+    def channel(self, sendId, receiveId=None):
+        return AsyncChannel(self, sendId, sendId if receiveId == None else receiveId)
+
+    def queue(self, channel):
+        q = self.queues.get(channel)
+        if q == None :
+            q = asyncio.Queue()
+            if self.closed :
+                q.put_nowait(None)
+            self.queues[channel] = q
+        return q
+
+#Queue messages on a channel, return the event set when the last one is sent
+    def send(self, channel, views):
+        event = asyncio.Event()
+        if self.closed :
+            event.set()
+            return event
+        messages = self.pending.setdefault(CHANNEL_PRIORITIES.get(channel, 0), deque())
+        for i, view in enumerate(views) :
+            messages.append([channel, view, 0, event if i == len(views) - 1 else None])
+        self.wakeup.set()
+        return event
+
+    async def writer(self):
+        try :
+            while not self.closed :
+                messages = None
+                for priority in sorted(self.pending) :
+                    if self.pending[priority] :
+                        messages = self.pending[priority]
+                        break
+                if messages == None :
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                    continue
+                message = messages[0]
+                channel, view, offset, event = message
+                chunk = view[offset:offset + self.chunkSize]
+                message[2] = offset + chunk.nbytes
+                done = message[2] >= view.nbytes
+                if done :
+                    messages.popleft()
+                self.transport.protocol.write(FRAME_STRUCT.pack(channel, chunk.nbytes, view.nbytes))
+                self.transport.protocol.write(chunk)
+                await self.transport.protocol.drain()
+                if done and event != None :
+                    event.set()
+        except Exception as e :
+            print('Multiplex writer', e)
+        finally :
+            self.terminate()
+
+    async def reader(self):
+        frame = bytearray(FRAME_STRUCT.size)
+        partial = {}  #channel -> [buffer, received]
+        try :
+            while await self.transport.readInto(memoryview(frame)) != None :
+                channel, chunkLength, length = FRAME_STRUCT.unpack(frame)
+                entry = partial.get(channel)
+                if entry == None :
+                    entry = [self.pool.acquire(length), 0]
+                    partial[channel] = entry
+                buf, received = entry
+                if await self.transport.readInto(buf[received:received + chunkLength]) == None :
+                    break
+                entry[1] = received + chunkLength
+                if entry[1] >= length :
+                    del partial[channel]
+                    self.queue(channel).put_nowait(buf)
+        except Exception as e :
+            print('Multiplex reader', e)
+        finally :
+            self.terminate()
+
+    def terminate(self):
+        if self.closed :
+            return
+        self.closed = True
+        for messages in self.pending.values() :
+            for message in messages :
+                if message[3] != None :
+                    message[3].set()
+            messages.clear()
+        self.wakeup.set()
+        for q in self.queues.values() :
+            q.put_nowait(None)
+
+    def shutdown(self):
+        self.transport.shutdown()
+
+    def close(self):
+        self.terminate()
+        self.transport.close()
+
+## One logical channel of an AsyncMultiplexSocket, for the coroutines
+class AsyncChannel(AsyncMessageSocket) :
+    def __init__(self, mux, sendId, receiveId):
+        self.mux = mux
+        self.pool = mux.pool
+        self.sendId = sendId
+        self.receiveId = receiveId
+        self.received = mux.queue(receiveId)
+
+    def close(self):
+        self.mux.close()
+
+    def shutdown(self):
+        self.mux.shutdown()
+
+#Return when the messages are on the wire, so the buffers can be reused
+    async def sendMessages(self, bufs):
+        await self.mux.send(self.sendId, [bufferView(buf) for buf in bufs]).wait()
+
+#None when the connection is closed (and for every later call)
+    async def receiveMsg(self):
+        buf = await self.received.get()
+        if buf == None :
+            self.received.put_nowait(None)
+        return buf
+
+## An AsyncChannel used from another thread, MessageSocket interface (blocking)
+class BlockingChannel(MessageSocket) :
+    def __init__(self, connection, channel):
+        self.connection = connection
+        self.channel = channel
+        self.socket = None
+        self.pool = channel.pool
+
+    def close(self):
+        self.connection.close()
+
+    def shutdown(self):
+        self.connection.call(self.channel.shutdown)
+
+    def sendMessages(self, bufs):
+        self.connection.run(self.channel.sendMessages(bufs))
+
+    def receiveMsg(self):
+        return self.connection.run(self.channel.receiveMsg())
+
+## The event loop thread owning the connection to the Pi
+class AsyncConnection() :
+    def __init__(self, host, port):
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        try :
+            self.mux = self.run(self.open(host, port))
+        except :
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            raise
+
+    async def open(self, host, port):
+        transport, protocol = await self.loop.create_connection(lambda : MessageProtocol(STAGING_LIMIT), host, port)
+        transport.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return AsyncMultiplexSocket(protocol)
+
+#Run a coroutine in the loop and wait for its result (from another thread)
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+#Call a function in the loop thread and wait for its result
+    def call(self, function, *args):
+        async def wrapper() :
+            return function(*args)
+        return self.run(wrapper())
+
+    def channel(self, sendId, receiveId=None):
+        return self.call(self.mux.channel, sendId, receiveId)
+
+    def blockingChannel(self, sendId, receiveId=None):
+        return BlockingChannel(self, self.channel(sendId, receiveId))
+
+    def close(self):
+        if self.loop.is_running() :
+            self.loop.call_soon_threadsafe(self.mux.close)
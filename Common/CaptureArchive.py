@@ -0,0 +1,173 @@
+import os
+import sys
+import mmap
+from struct import Struct
+from threading import Lock
+
+from SegmentFile import *
+from FrameHeader import *
+
+## Capture archive: the shots of a capture in a few large files instead of one file per shot
+## Each shot (binary header, jpeg as received) is a record of segment files (see SegmentFile)
+## The image processed on the PC (merged bracket, flat field calibration) is a record too,
+## of kind RECORD_PROCESSED, encoded in jpeg, with the header of the last shot of its frame
+## capture.idx is the index, one INDEX_STRUCT entry per record :
+##   session, count, bracket, kind, segment, offset of the record, header length, payload length
+## The archive can be continued by a later capture, the new records go to new segments
+## Each capture is a session (newSession), the counts restart at 0 in a session
+## ArchiveReader maps the segments (mmap) and finds a record by (session, count, bracket, kind) in O(1)
+## Usage: python CaptureArchive.py list archiveDirectory
+##        python CaptureArchive.py export archiveDirectory outputDirectory
+##        (image_%05d_%02d.jpg files for the shots, image_%05d.jpg for the processed images, the
+##        names of the files saved by the ImageThread, in a session_%03d directory per session
+##        when the archive has several sessions)
+
+ARCHIVE_PREFIX = 'capture'
+INDEX_NAME = 'capture.idx'
+INDEX_STRUCT = Struct('<HiBBHQII')
+RECORD_SHOT = 0         #A shot as received
+RECORD_PROCESSED = 1    #The image processed of a frame
+
+def readIndex(directory):
+    try :
+        with open(os.path.join(directory, INDEX_NAME), 'rb') as file :
+            data = file.read()
+    except FileNotFoundError :
+        return []
+    n = len(data)//INDEX_STRUCT.size    #An entry cut by a crash is ignored
+    return [INDEX_STRUCT.unpack_from(data, i*INDEX_STRUCT.size) for i in range(n)]
+
+class ArchiveWriter() :
+    def __init__(self, directory, segmentSize=1024*1024*1024):
+        entries = readIndex(directory)
+        first = entries[-1][4] + 1 if entries else 0
+        self.directory = directory
+        self.session = entries[-1][0] + 1 if entries else 0
+        self.segments = SegmentWriter(directory, ARCHIVE_PREFIX, segmentSize, first)
+        self.index = open(os.path.join(directory, INDEX_NAME), 'ab')
+        self.index.truncate(len(entries)*INDEX_STRUCT.size)
+        self.records = 0    #Records of the session
+        self.lock = Lock()
+
+#The next records are of a new capture, nothing to do if the session is empty
+    def newSession(self):
+        with self.lock :
+            if self.records > 0 :
+                self.session += 1
+                self.records = 0
+
+#Append a record, payload is the jpeg
+    def append(self, header, payload, kind=RECORD_SHOT):
+        self.appendRecords([(header, payload, kind)])
+
+#Append (header, payload, kind) records one after the other, the records of a frame are not
+#mixed with the ones of another frame written by another thread
+    def appendRecords(self, records):
+        bufs = [encodeHeader(header) for header, payload, kind in records]
+        with self.lock :
+            for buf, (header, payload, kind) in zip(bufs, records) :
+                segment, offset = self.segments.append(buf, payload)
+                self.index.write(INDEX_STRUCT.pack(self.session, header['count'], header['bracket'], kind, segment, offset, \
+                                                   len(buf), memoryview(payload).nbytes))
+                self.records += 1
+
+#sync : to the disk too (fsync)
+    def flush(self, sync=False):
+        with self.lock :
+            self.segments.flush(sync)
+            self.index.flush()
+            if sync :
+                os.fsync(self.index.fileno())
+
+    def close(self):
+        with self.lock :
+            self.segments.close()
+            self.index.close()
+
+## Random access to the shots of an archive
+## The payloads are views on the mapped segments, valid until close
+class ArchiveReader() :
+    def __init__(self, directory):
+        self.directory = directory
+        self.entries = readIndex(directory)
+        self.positions = {entry[:4]:i for i, entry in enumerate(self.entries)}
+        self.sessions = sorted(set(entry[0] for entry in self.entries))
+        self.maps = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        for i in range(len(self.entries)) :
+            yield self.record(i)
+
+    def segment(self, index):
+        segment = self.maps.get(index)
+        if segment == None :
+            with open(segmentName(self.directory, ARCHIVE_PREFIX, index), 'rb') as file :
+                segment = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[index] = segment
+        return segment
+
+#(header dict, jpeg view) of the i th record
+    def record(self, i):
+        session, count, bracket, kind, segment, offset, headerLength, payloadLength = self.entries[i]
+        view = memoryview(self.segment(segment))
+        start = offset + RECORD_STRUCT.size
+        header = decodeHeader(view[start:start + headerLength])
+        start += headerLength
+        return header, view[start:start + payloadLength]
+
+#A record of session, the last session by default
+    def shot(self, count, bracket=0, session=None, kind=RECORD_SHOT):
+        if session == None :
+            session = self.sessions[-1] if self.sessions else 0
+        return self.record(self.positions[(session, count, bracket, kind)])
+
+#(session, kind) of the i th record
+    def kind(self, i):
+        return self.entries[i][0], self.entries[i][3]
+
+    def close(self):
+        for segment in self.maps.values() :
+            try :
+                segment.close()
+            except BufferError :    #A payload view is still used
+                pass
+        self.maps.clear()
+
+#File name of the i th record, the names of the ImageThread
+def exportName(reader, i, header):
+    session, kind = reader.kind(i)
+    if kind == RECORD_PROCESSED :
+        name = "image_%#05d.jpg" % header['count']
+    else :
+        name = "image_%#05d_%#02d.jpg" % (header['count'], header['bracket'])
+    if len(reader.sessions) > 1 :
+        return os.path.join("session_%03d" % session, name)
+    return name
+
+def export(directory, output):
+    reader = ArchiveReader(directory)
+    for i, (header, jpeg) in enumerate(reader) :
+        path = os.path.join(output, exportName(reader, i, header))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file :
+            file.write(jpeg)
+    n = len(reader)
+    reader.close()
+    return n
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == 'list' :
+        reader = ArchiveReader(sys.argv[2])
+        for i, (header, jpeg) in enumerate(reader) :
+            session, kind = reader.kind(i)
+            print('session %3i  count %6i  bracket %i  %-9s  shutter %6i  gains %.3f %.3f  %8i bytes' % \
+                  (session, header['count'], header['bracket'], 'processed' if kind == RECORD_PROCESSED else 'shot', \
+                   header['shutter'], header['gains'][0], header['gains'][1], len(jpeg)))
+    elif len(sys.argv) == 4 and sys.argv[1] == 'export' :
+        print(export(sys.argv[2], sys.argv[3]), 'shots exported')
+    else :
+        print('Usage: python CaptureArchive.py list archiveDirectory\n' \
+              '       python CaptureArchive.py export archiveDirectory outputDirectory')
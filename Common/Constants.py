@@ -31,6 +31,7 @@ CAPTURE_ON_FRAME=2
 MERGE_NONE=0
 MERGE_MERTENS=1
 MERGE_DEBEVEC=2
+MERGE_FAST=3
 
 MOTOR_FORWARD=0
 MOTOR_BACKWARD=1
@@ -54,3 +55,9 @@ V1_RESOLUTIONS=('1920x1080','2592x1944','2592x1944','1296x972','1296*730','640*4
 CALIBRATION_NONE=1
 CALIBRATION_FLAT=2
 CALIBRATION_TABLE=3
+
+CHANNEL_COMMAND=0
+CHANNEL_REPLY=1
+CHANNEL_FRAME=2
+CHANNEL_TELEMETRY=3
+CHANNEL_CREDIT=4
@@ -0,0 +1,95 @@
+from struct import Struct
+from threading import Condition
+
+## Credit based flow control between the Pi (sender) and the PC (receiver)
+## The receiver grants credits in bytes on the credit channel:
+##   the whole window at start, then the size of each payload once processed
+## The sender consumes credits before sending a payload
+## Bytes captured but not yet sent are counted too, so the capture side knows
+## how much room is left and can slow the motor down before it has to stop
+
+CREDIT_WINDOW = 64*1024*1024
+CREDIT_STRUCT = Struct('<q')
+
+#Credit message
+def encodeCredit(n):
+    return CREDIT_STRUCT.pack(n)
+
+def decodeCredit(buf):
+    return CREDIT_STRUCT.unpack(buf)[0]
+
+class CreditGate() :
+    highWater = 0.5     #Full speed above this fraction of the window available
+    lowWater = 0.1      #Stop below
+    resumeWater = 0.25  #Restart after a stop above
+
+    def __init__(self, window=CREDIT_WINDOW):
+        self.window = window
+        self.credits = 0   #Granted and not consumed
+        self.queued = 0    #Captured and not sent
+        self.condition = Condition()
+        self.closed = False
+
+#Receiver grant
+    def grant(self, n):
+        with self.condition :
+            self.credits += n
+            self.condition.notify_all()
+
+#Capture side a payload of n bytes is waiting to be sent
+    def enqueue(self, n):
+        with self.condition :
+            self.queued += n
+
+#Send side wait for n bytes of credits, a payload bigger than the window
+#waits for the whole window. Return False if closed
+#dequeue False for a payload no more counted as queued (spooled)
+    def acquire(self, n, dequeue=True):
+        with self.condition :
+            while self.credits < min(n, self.window) and not self.closed :
+                self.condition.wait()
+            self.consume(n, dequeue)
+            return not self.closed
+
+#Same without waiting, return False if not enough credits or closed
+    def tryAcquire(self, n):
+        with self.condition :
+            if self.closed or self.credits < min(n, self.window) :
+                return False
+            self.consume(n, True)
+            return True
+
+    def consume(self, n, dequeue):
+        self.credits -= n
+        if dequeue :
+            self.dequeue(n)
+        self.condition.notify_all()
+
+#n bytes no more waiting in memory (spooled)
+    def dequeue(self, n):
+        with self.condition :
+            self.queued = self.queued - n if self.queued > n else 0
+
+#Fraction of the window still free : credits left minus bytes waiting to be sent
+    def available(self):
+        return (self.credits - self.queued)/self.window
+
+#Motor speed factor 0. (stop) to 1. (full speed)
+    def speedFactor(self):
+        available = self.available()
+        if available >= self.highWater :
+            return 1.
+        if available <= self.lowWater :
+            return 0.
+        return (available - self.lowWater)/(self.highWater - self.lowWater)
+
+#Block until enough room to restart after a stop
+    def waitResume(self):
+        with self.condition :
+            while self.available() < self.resumeWater and not self.closed :
+                self.condition.wait()
+
+    def close(self):
+        with self.condition :
+            self.closed = True
+            self.condition.notify_all()
@@ -0,0 +1,67 @@
+import time
+from struct import Struct
+from fractions import Fraction
+
+from Constants import *
+
+## Binary frame header
+## A fixed layout header replacing the str()/eval() encoding of the header dicts
+## Layout (little endian) :
+##   version, type, bracket, count, num, shutter, red gain, blue gain, timestamp
+## followed by an optional utf-8 message (HEADER_MESSAGE)
+## The first byte is the schema version so that both sides can detect a mismatch
+## Version 2 adds the monotonic times of the Pi pipeline stages (see Telemetry),
+## 'stages' in the header dict, 0 for a stage not reached
+## Version 3 uses the padding byte for 'shots', the number of shots of the frame
+## (adaptive bracketing), absent or 0 when not known
+
+HEADER_VERSION = 3
+HEADER_SCHEMAS = {1 : Struct('<BBBxiiIffd'), 2 : Struct('<BBBxiiIffd5d'), 3 : Struct('<BBBBiiIffd5d')}
+PI_STAGES = ('trigger', 'exposure', 'encode', 'enqueue', 'send')
+
+HEADER_KEYS = ('type', 'bracket', 'shots', 'count', 'num', 'shutter', 'gains', 'timestamp')
+
+#Encode a header dict to bytes
+def encodeHeader(header):
+    schema = HEADER_SCHEMAS[HEADER_VERSION]
+    gains = header.get('gains', (0., 0.))
+    stages = header.get('stages', {})
+    buf = schema.pack(HEADER_VERSION, header['type'], header.get('bracket', 0), header.get('shots', 0), header.get('count', 0), \
+                      header.get('num', 0), int(header.get('shutter', 0)), float(gains[0]), float(gains[1]), \
+                      header.get('timestamp', 0.), *[stages.get(stage, 0.) for stage in PI_STAGES])
+    msg = header.get('msg')
+    if msg != None :
+        buf += str(msg).encode()
+    return buf
+
+#Decode bytes to a header dict
+def decodeHeader(buf):
+    version = buf[0]
+    schema = HEADER_SCHEMAS.get(version)
+    if schema == None :
+        raise ValueError('Unknown header version %i' % version)
+    values = schema.unpack_from(buf)
+    shots = 0
+    if version >= 3 :
+        shots = values[3]
+        values = values[:3] + values[4:]
+    header = {'type':values[1], 'bracket':values[2], 'count':values[3], 'num':values[4], \
+              'shutter':values[5], 'gains':(values[6], values[7]), 'timestamp':values[8]}
+    if shots != 0 :
+        header['shots'] = shots
+    if version >= 2 :
+        header['stages'] = {stage:t for stage, t in zip(PI_STAGES, values[9:14]) if t != 0.}
+    if len(buf) > schema.size :
+        header['msg'] = bytes(buf[schema.size:]).decode()
+    return header
+
+#Micro benchmark encode + decode against the old str()/eval() encoding
+if __name__ == '__main__':
+    import timeit
+    header = {'type':HEADER_IMAGE, 'count':1234, 'bracket':3, 'shutter':12345, \
+              'gains':(Fraction(387, 256), Fraction(451, 256)), 'timestamp':time.monotonic()}
+    number = 20000
+    old = timeit.timeit(lambda : eval(str((header,'')).encode().decode())[0], number=number)
+    new = timeit.timeit(lambda : decodeHeader(encodeHeader(header)), number=number)
+    print('Size    str/eval %4i bytes    binary %4i bytes' % (len(str((header,'')).encode()), len(encodeHeader(header))))
+    print('Time    str/eval %7.2f us     binary %7.2f us     speedup %.1f' % (old*1e6/number, new*1e6/number, old/new))
@@ -1,55 +1,135 @@
 import socket
-from struct import *  
-from numpy import *    #for dtype
+from struct import *
+from numpy import dtype   #for eval of the array infos, not * : min max ... are the builtins
 import numpy as np
 from ast import literal_eval
-from fractions import Fraction 
+from fractions import Fraction
+from io import BytesIO
+from threading import Lock
+from FrameHeader import *
 ## A message oriented socket class
 ## Features on the socket :
 ## send a receive a messge ie a counted bytes buf
 ## On top of a message send a receive a Python string
 ## On top of a string send a receive a Python object
+## Sending is scatter-gather : length prefixes and buffers go out in one sendmsg call
+## without copying numpy arrays or BytesIO streams
+## Receiving fills buffers taken from a pool, release them when done
+
+LEN_STRUCT = Struct('<i')
+
+## A pool of reusable receive buffers
+## acquire returns a memoryview of the requested size on a pooled bytearray
+## release gives the bytearray back to the pool (thread safe)
+class BufferPool() :
+    granularity = 65536  #Round sizes so that jpegs of slightly different sizes share buffers
+
+    def __init__(self, maxBuffers=16):
+        self.maxBuffers = maxBuffers
+        self.free = []
+        self.lock = Lock()
+        self.allocated = 0
+
+    def acquire(self, size):
+        with self.lock :
+            best = None
+            for i, buf in enumerate(self.free) :
+                if len(buf) >= size and (best == None or len(buf) < len(self.free[best])) :
+                    best = i
+            if best != None :
+                return memoryview(self.free.pop(best))[:size]
+            self.allocated += 1
+        capacity = (size + self.granularity - 1)//self.granularity*self.granularity or self.granularity
+        return memoryview(bytearray(capacity))[:size]
+
+    def release(self, view):
+        buf = view.obj if isinstance(view, memoryview) else view
+        if not isinstance(buf, bytearray) :
+            return
+        with self.lock :
+            if len(self.free) < self.maxBuffers :
+                self.free.append(buf)
+
+#Flat byte view on a bytes like object, numpy array or BytesIO (any object with getbuffer) without copy
+def bufferView(buf):
+    if hasattr(buf, 'getbuffer') :
+        buf = buf.getbuffer()
+    return memoryview(buf).cast('B')
 
 class MessageSocket() :
     socket = None
-    
-    def __init__(self, sock):
+
+    def __init__(self, sock, pool=None):
         self.socket = sock
+        self.pool = pool if pool != None else BufferPool()
+        self.lenBuf = bytearray(LEN_STRUCT.size)
+        self.scatterGather = hasattr(sock, 'sendmsg') #Not available on Windows
 
     def close(self):
         self.socket.close()
-    
+
     def shutdown(self) :
         self.socket.shutdown(socket.SHUT_RDWR)
-    
-#Read len bytes on the socket
-    def read(self, len):
-        buf = bytearray(len)
-        view = memoryview(buf)
+
+#Read len bytes on the socket into view
+    def readInto(self, view):
+        len = view.nbytes
         while len :
             n = self.socket.recv_into(view, len)
             if n == 0 :
                 return None
             view = view[n:]
             len -= n
+        return True
+
+#Read len bytes on the socket in a pooled buffer
+    def read(self, len):
+        buf = self.pool.acquire(len)
+        if self.readInto(buf) == None :
+            self.pool.release(buf)
+            return None
         return buf
 
+#Give a received buffer back to the pool
+    def release(self, buf):
+        self.pool.release(buf)
 
-#Send len and bytes
-    def sendMsg(self,buf):
+#Send a list of buffers with one system call if possible
+    def sendParts(self, parts):
+        if not self.scatterGather :
+            for part in parts :
+                self.socket.sendall(part)
+            return
+        while parts :
+            n = self.socket.sendmsg(parts)
+            while parts and n >= parts[0].nbytes :
+                n -= parts[0].nbytes
+                parts.pop(0)
+            if n :
+                parts[0] = parts[0][n:]
+
+#Send several messages len and bytes, buf can be bytes, numpy array or BytesIO
+    def sendMessages(self, bufs):
+        parts = []
+        for buf in bufs :
+            view = bufferView(buf)
+            parts.append(memoryview(LEN_STRUCT.pack(view.nbytes)))
+            parts.append(view)
         try :
-            self.socket.sendall(pack('<i',len(buf)))
-            self.socket.sendall(buf)
+            self.sendParts(parts)
         except :
             print('Exception sending')
 
+#Send len and bytes
+    def sendMsg(self,buf):
+        self.sendMessages((buf,))
+
 #Receive len and bytes
-    def receiveMsg(self):    
-        buf = self.read(calcsize('<i'))
-        if buf != None :
-            len = unpack('<i',buf)[0]
-            buf = self.read(len)
-        return buf
+    def receiveMsg(self):
+        if self.readInto(memoryview(self.lenBuf)) == None :
+            return None
+        len = LEN_STRUCT.unpack(self.lenBuf)[0]
+        return self.read(len)
 
 #Send a string
     def sendString(self,s):
@@ -57,7 +137,12 @@ class MessageSocket() :
 
 #Receive a string
     def receiveString(self):
-        return self.receiveMsg().decode()
+        buf = self.receiveMsg()
+        if buf == None :
+            return None
+        s = str(buf, 'utf-8')
+        self.release(buf)
+        return s
 
 ##Send a receive a python object
 ## For sending the object is converted to its string representation
@@ -70,17 +155,34 @@ class MessageSocket() :
 #Receive an object
     def receiveObject(self):
         s = self.receiveString()
+        if s == None :
+            return None
         return eval(s)[0]
 
+#Send a frame header (binary encoding see FrameHeader) and its optional payload
+    def sendHeader(self,header, payload=None):
+        if payload is None :
+            self.sendMsg(encodeHeader(header))
+        else :
+            self.sendMessages((encodeHeader(header), payload))
+
+#Receive a frame header
+    def receiveHeader(self):
+        buf = self.receiveMsg()
+        if buf == None :
+            return None
+        header = decodeHeader(buf)
+        self.release(buf)
+        return header
+
 #Send a numpy array
     def sendArray(self,array):
-        self.sendObject((array.nbytes, array.shape, array.dtype))
-        self.socket.sendall(array.tobytes())
+        array = np.ascontiguousarray(array)
+        self.sendMessages((str(((array.nbytes, array.shape, array.dtype),'')).encode(), array))
 
-#Receive a numpy array        
+#Receive a numpy array, it is a view on a pooled buffer (see release)
     def receiveArray(self):
         infos = self.receiveObject()
         print (infos)
-        size = infos[0]
-        buf = self.read(size)
+        buf = self.receiveMsg()
         return np.frombuffer(buf, infos[2]).reshape(infos[1])
@@ -0,0 +1,171 @@
+import socket
+from struct import Struct
+from collections import deque
+from threading import Thread, Condition, Event, Lock
+from queue import Queue
+
+from Constants import *
+from MessageSocket import MessageSocket, BufferPool, bufferView
+
+## Several logical channels over one TCP connection
+## Each message is cut in chunks, each chunk is sent with a small frame header
+##   channel, chunk length, message length
+## The writer thread always sends the next chunk of the highest priority channel
+## so a command or a reply never waits behind a whole jpeg, only behind one chunk
+## The reader thread reassembles the messages per channel in pooled buffers
+## A Channel has the MessageSocket interface (sendObject, receiveHeader, ...)
+
+FRAME_STRUCT = Struct('<BxxxII')
+
+#Lower is sent first
+CHANNEL_PRIORITIES = {CHANNEL_COMMAND:0, CHANNEL_REPLY:0, CHANNEL_CREDIT:0, CHANNEL_TELEMETRY:1, CHANNEL_FRAME:2}
+
+class MultiplexSocket() :
+    chunkSize = 32768
+
+    def __init__(self, sock, pool=None):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.pool = pool if pool != None else BufferPool(32)
+        self.transport = MessageSocket(sock, self.pool)
+        self.condition = Condition()
+        self.pending = {}  #priority -> deque of [channel, view, offset, event]
+        self.queues = {}   #channel -> Queue of received messages
+        self.queuesLock = Lock()
+        self.closed = False
+        self.writerThread = Thread(target=self.writer, daemon=True)
+        self.readerThread = Thread(target=self.reader, daemon=True)
+        self.writerThread.start()
+        self.readerThread.start()
+
+#A channel sending on sendId and receiving on receiveId (default the same)
+    def channel(self, sendId, receiveId=None):
+        return Channel(self, sendId, sendId if receiveId == None else receiveId)
+
+    def queue(self, channel):
+        with self.queuesLock :
+            q = self.queues.get(channel)
+            if q == None :
+                q = Queue()
+                if self.closed :
+                    q.put(None)
+                self.queues[channel] = q
+            return q
+
+#Queue messages on a channel, return the event set when the last one is sent
+    def send(self, channel, views):
+        event = Event()
+        priority = CHANNEL_PRIORITIES.get(channel, 0)
+        with self.condition :
+            if self.closed :
+                event.set()
+                return event
+            messages = self.pending.setdefault(priority, deque())
+            for i, view in enumerate(views) :
+                messages.append([channel, view, 0, event if i == len(views) - 1 else None])
+            self.condition.notify()
+        return event
+
+    def writer(self):
+        try :
+            while True :
+                with self.condition :
+                    messages = None
+                    while not self.closed :
+                        for priority in sorted(self.pending) :
+                            if self.pending[priority] :
+                                messages = self.pending[priority]
+                                break
+                        if messages != None :
+                            break
+                        self.condition.wait()
+                    if self.closed :
+                        break
+                    message = messages[0]
+                    channel, view, offset, event = message
+                    chunk = view[offset:offset + self.chunkSize]
+                    message[2] = offset + chunk.nbytes
+                    done = message[2] >= view.nbytes
+                    if done :
+                        messages.popleft()
+                self.transport.sendParts([memoryview(FRAME_STRUCT.pack(channel, chunk.nbytes, view.nbytes)), chunk])
+                if done and event != None :
+                    event.set()
+        except Exception as e :
+            print('Multiplex writer', e)
+        finally :
+            self.terminate()
+
+    def reader(self):
+        frame = bytearray(FRAME_STRUCT.size)
+        partial = {}  #channel -> [buffer, received]
+        try :
+            while self.transport.readInto(memoryview(frame)) != None :
+                channel, chunkLength, length = FRAME_STRUCT.unpack(frame)
+                entry = partial.get(channel)
+                if entry == None :
+                    entry = [self.pool.acquire(length), 0]
+                    partial[channel] = entry
+                buf, received = entry
+                if self.transport.readInto(buf[received:received + chunkLength]) == None :
+                    break
+                entry[1] = received + chunkLength
+                if entry[1] >= length :
+                    del partial[channel]
+                    self.queue(channel).put(buf)
+        except Exception as e :
+            print('Multiplex reader', e)
+        finally :
+            self.terminate()
+
+#Connection lost or closed : wake up everybody
+    def terminate(self):
+        with self.condition :
+            if self.closed :
+                return
+            self.closed = True
+            for messages in self.pending.values() :
+                for message in messages :
+                    if message[3] != None :
+                        message[3].set()
+                messages.clear()
+            self.condition.notify_all()
+        with self.queuesLock :
+            for q in self.queues.values() :
+                q.put(None)
+
+    def shutdown(self):
+        try :
+            self.transport.shutdown()
+        except OSError :
+            pass
+
+    def close(self):
+        self.terminate()
+        self.transport.close()
+
+## One logical channel of a MultiplexSocket
+class Channel(MessageSocket) :
+    def __init__(self, mux, sendId, receiveId):
+        self.mux = mux
+        self.socket = None
+        self.pool = mux.pool
+        self.sendId = sendId
+        self.receiveId = receiveId
+        self.received = mux.queue(receiveId)
+
+    def close(self):
+        self.mux.close()
+
+    def shutdown(self):
+        self.mux.shutdown()
+
+#Return when the messages are on the wire, so the buffers can be reused
+    def sendMessages(self, bufs):
+        self.mux.send(self.sendId, [bufferView(buf) for buf in bufs]).wait()
+
+#None when the connection is closed (and for every later call)
+    def receiveMsg(self):
+        buf = self.received.get()
+        if buf == None :
+            self.received.put(None)
+        return buf
@@ -0,0 +1,105 @@
+import os
+from struct import Struct
+
+## Append only segment files of frame records
+## A segment starts with a magic, then records :
+##   header length, payload length, binary header (see FrameHeader), payload
+## A new segment is started when the current one is larger than segmentSize
+## Segments are named prefix_000000.seg, prefix_000001.seg ...
+
+SEGMENT_MAGIC = b'YSG1'
+RECORD_STRUCT = Struct('<II')
+
+def segmentName(directory, prefix, index):
+    return os.path.join(directory, '%s_%06d.seg' % (prefix, index))
+
+class SegmentWriter() :
+    def __init__(self, directory, prefix='segment', segmentSize=256*1024*1024, index=0):
+        self.directory = directory
+        self.prefix = prefix
+        self.segmentSize = segmentSize
+        self.index = index - 1
+        self.file = None
+        self.offset = 0
+        os.makedirs(directory, exist_ok=True)
+        self.nextSegment()
+
+    def nextSegment(self):
+        if self.file != None :
+            self.file.close()
+        self.index += 1
+        self.file = open(segmentName(self.directory, self.prefix, self.index), 'wb')
+        self.file.write(SEGMENT_MAGIC)
+        self.offset = len(SEGMENT_MAGIC)
+
+#Append a record, return its segment index and offset
+    def append(self, header, payload):
+        if self.offset >= self.segmentSize :
+            self.nextSegment()
+        position = (self.index, self.offset)
+        payloadLength = memoryview(payload).nbytes
+        self.file.write(RECORD_STRUCT.pack(len(header), payloadLength))
+        self.file.write(header)
+        self.file.write(payload)
+        self.offset += RECORD_STRUCT.size + len(header) + payloadLength
+        return position
+
+#sync : to the disk too (fsync)
+    def flush(self, sync=False):
+        self.file.flush()
+        if sync :
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file != None :
+            self.file.close()
+            self.file = None
+
+## Sequential reader of the records written by a SegmentWriter
+## The payload is read in a reusable buffer, it is valid until the next read
+class SegmentReader() :
+    def __init__(self, directory, prefix='segment', index=0, deleteRead=False):
+        self.directory = directory
+        self.prefix = prefix
+        self.index = index
+        self.deleteRead = deleteRead
+        self.file = None
+        self.buffer = bytearray(1024*1024)
+        self.recordBuf = bytearray(RECORD_STRUCT.size)
+
+    def open(self):
+        self.file = open(segmentName(self.directory, self.prefix, self.index), 'rb')
+        if self.file.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC :
+            raise ValueError('Not a segment file')
+
+    def nextSegment(self):
+        self.file.close()
+        self.file = None
+        if self.deleteRead :
+            os.remove(segmentName(self.directory, self.prefix, self.index))
+        self.index += 1
+
+#Next record (header bytes, payload view) or None at the end of the last segment
+    def read(self):
+        while True :
+            if self.file == None :
+                if not os.path.exists(segmentName(self.directory, self.prefix, self.index)) :
+                    return None
+                self.open()
+            if self.file.readinto(self.recordBuf) == RECORD_STRUCT.size :
+                break
+            if not os.path.exists(segmentName(self.directory, self.prefix, self.index + 1)) :
+                return None
+            self.nextSegment()
+        headerLength, payloadLength = RECORD_STRUCT.unpack(self.recordBuf)
+        header = self.file.read(headerLength)
+        if payloadLength > len(self.buffer) :
+            self.buffer = bytearray(payloadLength + payloadLength//4)
+        payload = memoryview(self.buffer)[:payloadLength]
+        self.file.readinto(payload)
+        return header, payload
+
+    def close(self):
+        if self.file != None :
+            self.file.close()
+            self.file = None
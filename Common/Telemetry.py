@@ -0,0 +1,137 @@
+import json
+import math
+import time
+from threading import Lock
+
+from FrameHeader import PI_STAGES
+
+## Pipeline telemetry
+## Each frame carries the monotonic time of the stages it went through ('stages' dict of the header)
+## On the Pi (FrameHeader.PI_STAGES) : trigger, exposure, encode, enqueue, send
+## On the PC : receive, decode, merge, write
+## The latency of a stage is the time since the previous stage reached on the same box
+## (the Pi and PC clocks are not the same, the network time is not measured here)
+## Latencies are aggregated in rolling histograms : log buckets, the current and the previous
+## period are kept so that the percentiles follow the last 1 to 2 periods
+## Counters (incomplete brackets, rejected shots...) are totals since the start,
+## values (queue depth, rate...) are the last ones set
+
+PC_STAGES = ('receive', 'decode', 'merge', 'write')
+
+BUCKETS = 80             #4 buckets per octave from 10 us to 10 s
+BUCKET_MIN = 0.00001
+
+def bucket(seconds):
+    if seconds <= BUCKET_MIN :
+        return 0
+    return min(BUCKETS - 1, int(4*math.log2(seconds/BUCKET_MIN)))
+
+#Upper bound in seconds of a bucket
+def bucketValue(index):
+    return BUCKET_MIN*2**((index + 1)/4.)
+
+class RollingHistogram() :
+    def __init__(self, period=10.):
+        self.period = period
+        self.current = [0]*BUCKETS
+        self.previous = [0]*BUCKETS
+        self.start = time.monotonic()
+
+    def rotate(self):
+        now = time.monotonic()
+        if now - self.start > self.period :
+            self.previous = self.current if now - self.start < 2*self.period else [0]*BUCKETS
+            self.current = [0]*BUCKETS
+            self.start = now
+
+    def add(self, seconds):
+        self.rotate()
+        self.current[bucket(seconds)] += 1
+
+    def count(self):
+        self.rotate()
+        return sum(self.current) + sum(self.previous)
+
+#Value in seconds below which p percent of the samples are
+    def percentile(self, p):
+        total = self.count()
+        if total == 0 :
+            return None
+        rank = p*total/100.
+        n = 0
+        for i in range(BUCKETS) :
+            n += self.current[i] + self.previous[i]
+            if n >= rank :
+                return bucketValue(i)
+        return bucketValue(BUCKETS - 1)
+
+class Telemetry() :
+    def __init__(self, period=10.):
+        self.period = period
+        self.lock = Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def add(self, name, seconds):
+        with self.lock :
+            histogram = self.histograms.get(name)
+            if histogram == None :
+                histogram = RollingHistogram(self.period)
+                self.histograms[name] = histogram
+            histogram.add(seconds)
+
+    def increment(self, name, n=1):
+        with self.lock :
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name, value):
+        with self.lock :
+            self.counters[name] = value
+
+#Latencies of the stages of a frame, per box
+    def record(self, stages):
+        for names in (PI_STAGES, PC_STAGES) :
+            previous = None
+            for name in names :
+                t = stages.get(name)
+                if t == None :
+                    continue
+                if previous != None :
+                    self.add(name, t - previous)
+                previous = t
+
+#Percentile of a stage in seconds, None if not enough samples
+    def percentile(self, name, p=99, minCount=10):
+        with self.lock :
+            histogram = self.histograms.get(name)
+            if histogram == None or histogram.count() < minCount :
+                return None
+            return histogram.percentile(p)
+
+#{stage : {'p50':ms, 'p99':ms, 'count':n}, counter : n}
+    def snapshot(self):
+        snapshot = {}
+        with self.lock :
+            snapshot.update(self.counters)
+            for name, histogram in self.histograms.items() :
+                count = histogram.count()
+                if count != 0 :
+                    snapshot[name] = {'p50':histogram.percentile(50)*1000., 'p99':histogram.percentile(99)*1000., 'count':count}
+        return snapshot
+
+def encodeTelemetry(snapshot):
+    return json.dumps(snapshot).encode()
+
+def decodeTelemetry(buf):
+    return json.loads(bytes(buf).decode())
+
+#One line for the GUI, stages in pipeline order
+def formatTelemetry(snapshot):
+    items = []
+    for name in PI_STAGES + PC_STAGES + tuple(sorted(set(snapshot) - set(PI_STAGES + PC_STAGES))) :
+        s = snapshot.get(name)
+        if isinstance(s, dict) :
+            items.append('%s %.0f/%.0f' % (name, s['p50'], s['p99']))
+        elif s != None :
+            items.append('%s %.4g' % (name, s))
+    return 'p50/p99 ms  ' + '  '.join(items)
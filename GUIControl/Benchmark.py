@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+from threading import Thread, Event
+
+from PyQt5.QtCore import Qt
+sys.path.append('../Common')
+from Constants import *
+from AsyncMultiplexSocket import AsyncConnection
+from Telemetry import Telemetry
+from ImageThread import ImageThread
+from FrameWriter import WRITER_THREADS, WRITER_QUEUE_SIZE
+from CommandClient import CommandClient
+
+## End to end benchmark of the capture chain on one box
+## The Controller runs in a subprocess with the simulated camera and pigpio (YART_BACKEND=sim),
+## the real MessageSocket, multiplexed connection, capture and send threads are used.
+## Here the ImageThread runs in a plain thread, frames are decoded, merged and written to a temp directory
+## For each capture method, bracket count and merge mode: fps, p50/p99 latency per stage and peak RSS
+## Latencies use the monotonic clock of the box, it is shared by the two processes
+## The per stage latencies (Telemetry) come from the stage times carried by the headers
+## Usage: python Benchmark.py --duration 10 --output bench.json
+
+METHODS = {'BASIC':CAPTURE_BASIC, 'ON_FRAME':CAPTURE_ON_FRAME, 'ON_TRIGGER':CAPTURE_ON_TRIGGER}
+MERGES = {'NONE':MERGE_NONE, 'MERTENS':MERGE_MERTENS, 'DEBEVEC':MERGE_DEBEVEC, 'FAST':MERGE_FAST}
+STAGES = ('network', 'process', 'total')
+
+def percentile(values, p):
+    if not values :
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p*len(values)/100.))]
+
+#Peak resident memory in MB of a process, this one if pid is None
+def peakRss(pid=None):
+    if pid == None :
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+    try :
+        with open('/proc/%i/status' % pid) as f :
+            for line in f :
+                if line.startswith('VmHWM:') :
+                    return int(line.split()[1]) / 1024.
+    except OSError :
+        pass
+    return None
+
+## ImageThread recording the latency of each shot at the end of the pipeline
+class BenchImageThread(ImageThread) :
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.terminated = Event()
+        self.headerSignal.connect(self.onHeader, Qt.DirectConnection)
+        self.imageSignal.connect(self.onImage, Qt.DirectConnection)
+        self.reset()
+
+    def reset(self):
+        self.latencies = {stage:[] for stage in STAGES}
+        self.frames = 0
+        self.shots = 0
+        self.bytes = 0
+        self.first = None
+        self.last = None
+        self.telemetry = Telemetry()
+        self.assembler.telemetry = self.telemetry
+        self.writer.telemetry = self.telemetry
+        self.terminated.clear()
+
+    def onHeader(self, header):
+        if header['type'] == HEADER_MESSAGE and header['msg'].startswith('Capture terminated') :
+            self.terminated.set()
+
+    def onImage(self, image):
+        self.previewDone()
+
+    def shotDone(self, header, jpeg):
+        self.bytes += len(jpeg)
+        return super().shotDone(header, jpeg)
+
+    def frameDone(self, header):
+        super().frameDone(header)
+        received = header['stages']['receive']
+        done = time.monotonic()
+        self.shots += 1
+        self.latencies['network'].append(received - header['timestamp'])
+        self.latencies['process'].append(done - received)
+        self.latencies['total'].append(done - header['timestamp'])
+        if header['bracket'] <= 1 :     #Last shot of the frame
+            self.frames += 1
+            if self.first == None :
+                self.first = done
+            self.last = done
+
+    def result(self):
+        duration = self.last - self.first if self.frames > 1 else 0.
+        latency = {}
+        for stage in STAGES :
+            values = self.latencies[stage]
+            latency[stage] = {'p50':percentile(values, 50)*1000., 'p99':percentile(values, 99)*1000.} if values else None
+        return {'frames':self.frames, 'shots':self.shots, \
+                'fps':(self.frames - 1)/duration if duration > 0 else 0., \
+                'mbps':self.bytes/duration/1000000. if duration > 0 else 0., \
+                'latency_ms':latency, 'stages_ms':self.telemetry.snapshot()}
+
+class Benchmark() :
+    def __init__(self, args):
+        self.args = args
+        self.directory = tempfile.mkdtemp(prefix='yart_bench_')
+        self.controller = None
+        self.sock = None
+        self.commands = None
+        self.imageThread = None
+
+#Controller with simulated backends, its working directory is a temp one (settings files)
+    def startController(self):
+        root = os.path.dirname(os.path.abspath(__file__))
+        env = dict(os.environ, YART_BACKEND='sim', YART_PORT=str(self.args.port), \
+                   PYTHONPATH=os.path.join(root, '..', 'Common'))
+        workDir = os.path.join(self.directory, 'pi')
+        os.makedirs(workDir)
+        self.controller = subprocess.Popen([sys.executable, os.path.join(root, '..', 'Raspberry', 'Controller.py')], \
+                                           cwd=workDir, env=env, stdout=subprocess.DEVNULL)
+
+    def connect(self):
+        deadline = time.monotonic() + 20
+        while True :
+            try :
+                connection = AsyncConnection('127.0.0.1', self.args.port)
+                break
+            except OSError :
+                if time.monotonic() > deadline or self.controller.poll() != None :
+                    raise
+                time.sleep(0.2)
+        self.sock = connection.blockingChannel(CHANNEL_COMMAND, CHANNEL_REPLY)
+        self.commands = CommandClient(self.sock)
+        self.imageThread = BenchImageThread(connection)
+        Thread(target=self.imageThread.run, daemon=True).start()
+        self.commands.call(OPEN_CAMERA, 2, tuple(self.args.resolution), CALIBRATION_NONE, False, False, timeout=30.)
+
+    def runCase(self, method, brackets, merge):
+        output = os.path.join(self.directory, 'images')
+        os.makedirs(output, exist_ok=True)
+        self.imageThread.reset()
+        self.imageThread.merge = MERGES[merge]
+        self.imageThread.setWriter(self.args.writers, self.args.writer_queue, self.args.sync_every)
+        self.imageThread.saveToFile(True, output, self.args.archive)
+        self.commands.call(SET_MOTOR_SETTINGS, {'speed':self.args.framerate/(self.args.auto_wait + 1)/2})
+        self.commands.call(SET_CAMERA_SETTINGS, {'framerate':self.args.framerate, \
+                                                 'bracket_steps':brackets, \
+                                                 'bracket_dark_coefficient':0.5, \
+                                                 'bracket_light_coefficient':2., \
+                                                 'shutter_speed_wait':self.args.speed_wait, \
+                                                 'shutter_auto_wait':self.args.auto_wait, \
+                                                 'capture_method':METHODS[method], \
+                                                 'adaptive_bracket':self.args.adaptive, \
+                                                 'predictive_exposure':self.args.predictive, \
+                                                 'record_mjpeg':self.args.mjpeg, \
+                                                 'spool_enabled':False})
+        self.commands.call(START_CAPTURE)
+        time.sleep(self.args.duration)
+        self.commands.call(STOP_CAPTURE)
+        if not self.imageThread.terminated.wait(60) :
+            print('Warning capture not terminated', file=sys.stderr)
+        result = {'method':method, 'brackets':brackets, 'merge':merge}
+        result.update(self.imageThread.result())
+        result['rss_pc_mb'] = peakRss()
+        result['rss_pi_mb'] = peakRss(self.controller.pid)
+        self.imageThread.saveToFile(False, output)
+        shutil.rmtree(output)
+        return result
+
+    def cases(self):
+        for method in self.args.methods :
+            for brackets in self.args.brackets :
+                merges = self.args.merges if brackets > 1 else ('NONE',)
+                for merge in merges :
+                    yield method, brackets, merge
+
+    def run(self):
+        results = []
+        try :
+            self.startController()
+            self.connect()
+            for method, brackets, merge in self.cases() :
+                result = self.runCase(method, brackets, merge)
+                print('%-10s brackets %i merge %-7s  %6.2f fps' % (method, brackets, merge, result['fps']), file=sys.stderr)
+                results.append(result)
+        finally :
+            self.close()
+        return {'config':vars(self.args), 'cases':results}
+
+    def close(self):
+        if self.sock != None :
+            self.commands.request(TERMINATE)
+            self.sock.close()
+        if self.controller != None :
+            try :
+                self.controller.wait(10)
+            except subprocess.TimeoutExpired :
+                self.controller.kill()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='YART capture chain benchmark')
+    parser.add_argument('--duration', type=float, default=10., help='Seconds of capture per case')
+    parser.add_argument('--resolution', type=int, nargs=2, default=(1640, 1232))
+    parser.add_argument('--framerate', type=int, default=30)
+    parser.add_argument('--auto-wait', type=int, default=2, help='shutter_auto_wait')
+    parser.add_argument('--speed-wait', type=int, default=1, help='shutter_speed_wait')
+    parser.add_argument('--methods', nargs='+', default=list(METHODS), choices=list(METHODS))
+    parser.add_argument('--brackets', type=int, nargs='+', default=[1, 3])
+    parser.add_argument('--merges', nargs='+', default=list(MERGES), choices=list(MERGES))
+    parser.add_argument('--archive', action='store_true', help='Save to a capture archive instead of image files')
+    parser.add_argument('--writers', type=int, default=WRITER_THREADS, help='Writer threads')
+    parser.add_argument('--writer-queue', type=int, default=WRITER_QUEUE_SIZE, help='Writes queued before the capture slows down')
+    parser.add_argument('--sync-every', type=int, default=0, help='Files flushed to the disk (fsync) by batches of, 0 no flush')
+    parser.add_argument('--adaptive', action='store_true', help='Adaptive bracketing')
+    parser.add_argument('--predictive', action='store_true', help='Predictive exposure (use with --auto-wait 0 or 1)')
+    parser.add_argument('--mjpeg', action='store_true', help='MJPEG recording (methods BASIC and ON_TRIGGER, brackets 1)')
+    parser.add_argument('--port', type=int, default=8010)
+    parser.add_argument('--output', help='JSON file, stdout if not given')
+    args = parser.parse_args()
+    report = Benchmark(args).run()
+    if args.output :
+        with open(args.output, 'w') as f :
+            json.dump(report, f, indent=2)
+    else :
+        json.dump(report, sys.stdout, indent=2)
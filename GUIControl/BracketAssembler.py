@@ -0,0 +1,92 @@
+import time
+from collections import deque
+
+## Gather the shots of the brackets to merge, keyed by frame count
+## A shot is (header, jpeg), the Pi numbers the shots of a frame from bracket_steps down to 1
+## A set is complete when it holds all the brackets from its size down to 1, the size is the number
+## of shots of the frame given by the Pi ('shots' of the header, adaptive bracketing), or without it
+## the largest bracket of the set and at least the size of the previous set (the first shot may be lost)
+## A set still incomplete after timeout seconds, or the oldest sets when more than maxBytes
+## of jpeg are held, is given back with the shots received and counted as incomplete
+## A duplicate shot or a shot of a frame already given back is rejected, the caller releases it
+## The sets are given back in count order: a complete set waits for the older sets (complete or
+## timed out), a set timing out times out the older sets too
+
+DONE_HISTORY = 256   #Counts of the frames given back remembered to reject late shots
+
+class BracketAssembler() :
+    def __init__(self, telemetry, timeout=2., maxBytes=256*1024*1024):
+        self.telemetry = telemetry
+        self.timeout = timeout
+        self.maxBytes = maxBytes
+        self.sets = {}      #count -> {bracket:(header, jpeg)}
+        self.started = {}   #count -> time of the first shot
+        self.ended = {}     #count -> set complete or timed out, waiting for the older sets
+        self.bytes = 0
+        self.size = 0       #Size of the last set given back
+        self.done = deque(maxlen=DONE_HISTORY)
+
+#Add a shot, return the sets given back (lists of shots, first bracket first) and the rejected shots
+    def add(self, header, jpeg):
+        count = header['count']
+        bracket = header['bracket']
+        shots = self.sets.get(count)
+        if count in self.done or (shots != None and bracket in shots) :
+            self.telemetry.increment('rejected')
+            return self.poll(), [(header, jpeg)]
+        if shots == None :
+            shots = {}
+            self.sets[count] = shots
+            self.started[count] = time.monotonic()
+        shots[bracket] = (header, jpeg)
+        self.bytes += len(jpeg)
+        size = header.get('shots') or max(max(shots), self.size)
+        if all(b in shots for b in range(1, size + 1)) :
+            self.end(count)
+        return self.poll(), []
+
+#Sets timed out or over the memory limit, with the sets ended before
+    def poll(self):
+        ready = self.release()
+        now = time.monotonic()
+        for count in sorted(self.sets, key=self.started.get) :
+            if count not in self.sets :      #Ended with a newer set
+                continue
+            if now - self.started[count] < self.timeout and self.bytes <= self.maxBytes :
+                break
+            for older in sorted(self.sets) :
+                if older > count :
+                    break
+                self.telemetry.increment('incomplete')
+                self.end(older)
+            ready.extend(self.release())
+        return ready
+
+#All the sets, at the end of the capture. The counts restart at 0 with the next capture
+    def flush(self):
+        for count in sorted(self.sets) :
+            self.telemetry.increment('incomplete')
+            self.end(count)
+        ready = self.release()
+        self.done.clear()
+        self.size = 0
+        return ready
+
+    def end(self, count):
+        shots = self.sets.pop(count)
+        del self.started[count]
+        self.done.append(count)
+        self.size = max(shots)
+        self.ended[count] = [shots[bracket] for bracket in sorted(shots, reverse=True)]
+
+#The sets ended older than all the sets not ended, in count order
+    def release(self):
+        ready = []
+        while self.ended :
+            count = min(self.ended)
+            if self.sets and min(self.sets) < count :
+                break
+            shots = self.ended.pop(count)
+            self.bytes -= sum(len(jpeg) for header, jpeg in shots)
+            ready.append(shots)
+        return ready
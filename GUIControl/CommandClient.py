@@ -0,0 +1,67 @@
+import sys
+from threading import Thread, Lock
+from concurrent.futures import Future
+from PyQt5.QtCore import QObject, pyqtSignal
+
+sys.path.append('../Common')
+from Constants import *
+
+#Commands to the Pi with request ids
+#A request is (requestId, command, *args), the Pi replies (requestId, result, error)
+#in any order: long commands run on a worker thread of the Pi, the others are answered at once
+#request returns a Future, the optional callback is called with the result in the GUI thread
+#call waits for the result, never from the GUI thread (Benchmark, scripts)
+
+class CommandClient(QObject):
+    replySignal = pyqtSignal([object, object, object])  #callback, result, error (to the GUI thread)
+    errorSignal = pyqtSignal([str,])                    #Error of a command without a waiting caller
+
+    def __init__(self, sock):
+        QObject.__init__(self)
+        self.sock = sock
+        self.lock = Lock()
+        self.nextId = 1
+        self.pending = {}   #requestId -> (future, callback)
+        self.replySignal.connect(self.deliver)
+        self.readerThread = Thread(target=self.reader, daemon=True)
+        self.readerThread.start()
+
+    def request(self, command, *args, callback=None):
+        future = Future()
+        with self.lock :
+            requestId = self.nextId
+            self.nextId += 1
+            self.pending[requestId] = (future, callback)
+        self.sock.sendObject((requestId, command) + args)
+        return future
+
+    def call(self, command, *args, timeout=10.):
+        return self.request(command, *args).result(timeout)
+
+    def reader(self):
+        while True :
+            reply = self.sock.receiveObject()
+            if reply == None :
+                break
+            requestId, result, error = reply
+            with self.lock :
+                future, callback = self.pending.pop(requestId, (None, None))
+            if future == None :
+                continue
+            if error != None :
+                future.set_exception(RuntimeError(error))
+            else :
+                future.set_result(result)
+            if callback != None or error != None :
+                self.replySignal.emit(callback, result, error)
+        with self.lock :
+            pending = list(self.pending.values())
+            self.pending.clear()
+        for future, callback in pending :
+            future.set_exception(ConnectionError('Connection closed'))
+
+    def deliver(self, callback, result, error):
+        if error != None :
+            self.errorSignal.emit(error)
+        elif callback != None :
+            callback(result)
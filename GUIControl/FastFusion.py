@@ -0,0 +1,130 @@
+import sys
+import time
+import numpy as np
+import cv2
+
+## Exposure fusion (Mertens) faster than cv2.MergeMertens (MERGE_FAST)
+## Same weights (contrast, saturation, well exposedness) and Laplacian pyramid blending, but :
+##   the weights are computed at WEIGHT_LEVEL of the pyramid (1/4 of the size) then resized for the
+##   finer levels, instead of at full size and pyramided
+##   the blending is accumulated shot by shot, the pyramids of the shots are not all kept
+##   the buffers of the pyramids are allocated once per image size and reused
+## The weights being smooth the result is close to cv2.MergeMertens (PSNR, see below)
+## process() gives a float32 image (0-1 like cv2.MergeMertens) that is a buffer of the
+## engine, valid until the next call
+## Benchmark against cv2.MergeMertens: python FastFusion.py [width height]
+
+WEIGHT_LEVEL = 2        #Level of the pyramid where the weights are computed
+SIGMA = 0.2             #Well exposedness
+EPSILON = 1e-12
+
+class FastFusion() :
+    def __init__(self, weightLevel=WEIGHT_LEVEL):
+        self.weightLevel = weightLevel
+        self.shape = None
+
+#Buffers of the pyramids for an image shape
+    def allocate(self, shape):
+        h, w = shape[:2]
+        levels = int(np.log2(min(w, h)))
+        self.sizes = [(w, h)]
+        for l in range(levels) :
+            w, h = (w + 1)//2, (h + 1)//2
+            self.sizes.append((w, h))
+        self.gauss = [np.empty((h, w, 3), np.float32) for w, h in self.sizes]   #Pyramid of a shot
+        self.up = [np.empty((h, w, 3), np.float32) for w, h in self.sizes]      #Laplacian of a level
+        self.result = [np.empty((h, w, 3), np.float32) for w, h in self.sizes]  #Blended pyramid
+        self.weight = [np.empty((h, w), np.float32) for w, h in self.sizes]     #Weights of a shot
+        self.weight3 = [np.empty((h, w, 3), np.float32) for w, h in self.sizes]
+        w, h = self.sizes[min(self.weightLevel, levels)]
+        self.small = np.empty((h, w, 3), np.uint8)
+        self.shape = shape
+
+#Mertens weights of the shots at the weight level, normalized
+    def weights(self, images):
+        level = min(self.weightLevel, len(self.sizes) - 1)
+        weights = []
+        for image in images :
+            small = cv2.resize(image, self.sizes[level], dst=self.small, interpolation=cv2.INTER_AREA)
+            small = small.astype(np.float32)*np.float32(1./255.)
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+            weight = np.abs(cv2.Laplacian(gray, cv2.CV_32F))             #Contrast
+            b, g, r = cv2.split(small)
+            mean = (b + g + r)*np.float32(1./3.)
+            weight *= np.sqrt((np.square(b - mean) + np.square(g - mean) + np.square(r - mean))*np.float32(1./3.))  #Saturation
+            exposedness = np.square(b - 0.5) + np.square(g - 0.5) + np.square(r - 0.5)
+            weight *= np.exp(exposedness*np.float32(-0.5/SIGMA**2))      #Well exposedness
+            weights.append(weight + np.float32(EPSILON))
+        total = sum(weights)
+        return level, [weight/total for weight in weights]
+
+#images : the uint8 BGR shots of a bracket, of the same size
+    def process(self, images):
+        if images[0].shape != self.shape :
+            self.allocate(images[0].shape)
+        level, weights = self.weights(images)
+        top = len(self.sizes) - 1
+        for result in self.result :
+            result.fill(0.)
+        for image, weight in zip(images, weights) :
+            #Weights pyramid: resized below the weight level, pyramided above
+            self.weight[level][...] = weight
+            for l in range(level - 1, -1, -1) :
+                cv2.resize(weight, self.sizes[l], dst=self.weight[l], interpolation=cv2.INTER_LINEAR)
+            for l in range(level, top) :
+                cv2.pyrDown(self.weight[l], dst=self.weight[l + 1])
+            #Gaussian pyramid of the shot then its Laplacian pyramid weighted into the result
+            np.multiply(image, np.float32(1./255.), out=self.gauss[0])
+            for l in range(top) :
+                cv2.pyrDown(self.gauss[l], dst=self.gauss[l + 1])
+            for l in range(top + 1) :
+                cv2.cvtColor(self.weight[l], cv2.COLOR_GRAY2BGR, dst=self.weight3[l])
+                if l == top :
+                    cv2.accumulateProduct(self.gauss[l], self.weight3[l], self.result[l])
+                else :
+                    cv2.pyrUp(self.gauss[l + 1], dst=self.up[l], dstsize=self.sizes[l])
+                    cv2.subtract(self.gauss[l], self.up[l], dst=self.up[l])
+                    cv2.accumulateProduct(self.up[l], self.weight3[l], self.result[l])
+        #Collapse
+        for l in range(top - 1, -1, -1) :
+            cv2.pyrUp(self.result[l + 1], dst=self.up[l], dstsize=self.sizes[l])
+            cv2.add(self.result[l], self.up[l], dst=self.result[l])
+        return self.result[0]
+
+#Synthetic bracket: a scene with detail and a wide range, under, normal and over exposed
+def syntheticBracket(w, h):
+    random = np.random.RandomState(0)
+    y, x = np.mgrid[:h, :w].astype(np.float32)
+    radiance = np.empty((h, w, 3), np.float32)
+    radiance[:,:,0] = 0.05 + 2.*x/w
+    radiance[:,:,1] = 0.05 + 2.*y/h
+    radiance[:,:,2] = 0.05 + (x + y)/(w + h)
+    radiance *= (1. + 0.3*np.sin(x/7.)*np.cos(y/11.))[..., None]
+    radiance *= random.uniform(0.9, 1.1, (h, w, 1)).astype(np.float32)
+    return [np.clip(255.*(radiance*exposure)**(1/2.2), 0, 255).astype(np.uint8) for exposure in (0.25, 1., 4.)]
+
+def psnr(image, reference):
+    mse = np.mean((np.clip(image, 0., 1.) - np.clip(reference, 0., 1.))**2)
+    return 10.*np.log10(1./max(mse, 1e-20))
+
+#Quality and speedup against cv2.MergeMertens: python FastFusion.py [width height]
+if __name__ == '__main__':
+    w, h = (int(v) for v in sys.argv[1:3]) if len(sys.argv) > 2 else (1640, 1232)
+    cv2.setNumThreads(1)    #As in the FrameProcessor pool
+    images = syntheticBracket(w, h)
+    mertens = cv2.createMergeMertens(1., 1., 1.)
+    fast = FastFusion()
+    reference = mertens.process(images)
+    result = fast.process(images).copy()
+    n = 5
+    start = time.perf_counter()
+    for i in range(n) :
+        mertens.process(images)
+    mertens_ms = (time.perf_counter() - start)*1000./n
+    start = time.perf_counter()
+    for i in range(n) :
+        fast.process(images)
+    fast_ms = (time.perf_counter() - start)*1000./n
+    print('%ix%i bracket of %i' % (w, h, len(images)))
+    print('cv2 MergeMertens  %8.1f ms' % mertens_ms)
+    print('FastFusion        %8.1f ms    speedup %.2f    PSNR %.1f dB' % (fast_ms, mertens_ms/fast_ms, psnr(result, reference)))
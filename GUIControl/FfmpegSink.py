@@ -0,0 +1,87 @@
+import os
+import queue
+import subprocess
+from threading import Thread
+
+## Encoding of the frames during the capture by a long lived ffmpeg subprocess fed on its stdin
+## The video is ready at the end of the scan, the images are not read back from the disk
+## input 'bgr' : the processed images (merged, calibrated) as raw bgr24 frames, the size of the
+##               video is the one of the first frame, a frame of another size is skipped
+## input 'jpeg' : the jpegs as received (image2pipe), the preset 'copy' keeps them as is (MJPEG)
+## The frames are written in order by a thread from a bounded queue, when ffmpeg is slower
+## than the capture add() blocks the caller like the FrameWriter
+## The FFMPEG environment variable gives the ffmpeg executable, ffmpeg of the PATH by default
+
+FFMPEG = os.environ.get('FFMPEG', 'ffmpeg')
+VIDEO_FRAMERATE = 18
+VIDEO_QUEUE_SIZE = 8
+
+#preset : (file extension, ffmpeg output options)
+PRESETS = {'ffv1':('.mkv', ['-c:v', 'ffv1', '-level', '3', '-g', '1', '-slices', '16', '-slicecrc', '1']), \
+           'prores':('.mov', ['-c:v', 'prores_ks', '-profile:v', '3', '-pix_fmt', 'yuv422p10le']), \
+           'h264':('.mp4', ['-c:v', 'libx264', '-preset', 'medium', '-crf', '16', '-pix_fmt', 'yuv420p']), \
+           'copy':('.mkv', ['-c:v', 'copy'])}
+
+class FfmpegSink() :
+    def __init__(self, path, preset, input='bgr', framerate=VIDEO_FRAMERATE):
+        if preset == 'copy' and input != 'jpeg' :
+            raise ValueError('The copy preset needs the jpegs')
+        extension, self.options = PRESETS[preset]
+        self.path = path + extension
+        self.input = input
+        self.framerate = framerate
+        self.process = None
+        self.size = None
+        self.frames = queue.Queue(VIDEO_QUEUE_SIZE)
+        self.closed = False
+        self.written = 0
+        self.skipped = 0
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def command(self):
+        command = [FFMPEG, '-hide_banner', '-loglevel', 'error', '-y']
+        if self.input == 'bgr' :
+            command += ['-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', '%ix%i' % self.size]
+        else :
+            command += ['-f', 'image2pipe', '-c:v', 'mjpeg']
+        return command + ['-framerate', str(self.framerate), '-i', '-'] + self.options + [self.path]
+
+#frame : BGR image (input 'bgr') or jpeg bytes (input 'jpeg')
+    def add(self, frame):
+        if not self.closed :
+            self.frames.put(frame)
+
+    def run(self):
+        try :
+            while True :
+                frame = self.frames.get()
+                if frame is None :
+                    break
+                if self.process == None :
+                    if self.input == 'bgr' :
+                        self.size = (frame.shape[1], frame.shape[0])
+                    self.process = subprocess.Popen(self.command(), stdin=subprocess.PIPE)
+                if self.input == 'bgr' and (frame.shape[1], frame.shape[0]) != self.size :
+                    self.skipped += 1
+                    continue
+                self.process.stdin.write(frame)
+                self.written += 1
+        except (OSError, ValueError) as e :
+            print('ffmpeg', self.path, e)
+            self.closed = True
+            while self.frames.get() is not None :   #Unblock add until close
+                pass
+        finally :
+            if self.process != None :
+                try :
+                    self.process.stdin.close()
+                except OSError :
+                    pass
+                self.process.wait()
+
+#End of the video, wait for ffmpeg to finish the file
+    def close(self):
+        self.closed = True
+        self.frames.put(None)
+        self.thread.join()
@@ -0,0 +1,75 @@
+import numpy as np
+import cv2
+
+## Flat field (lens shading) correction of the PC
+## The gains are kept as a low resolution grid (one gain per GRID_STEP x GRID_STEP pixels
+## and per channel, float32), saved in calibrate.npz. The vignetting is smooth, the grid is enough.
+## For a frame size the grid is upsampled once (bilinear) to 8 bits gains (255 is a gain of 1),
+## cached, and applied in place with cv2.multiply. The gains are at most 1, the error of the
+## 8 bits gains is below half a level of a 8 bits image
+
+GRID_STEP = 16
+CALIBRATION_FILE = 'calibrate.npz'
+
+#Grid size of an image: the image averaged on GRID_STEP x GRID_STEP blocks
+def toGrid(image):
+    h, w = image.shape[:2]
+    size = ((w + GRID_STEP - 1)//GRID_STEP, (h + GRID_STEP - 1)//GRID_STEP)
+    return cv2.resize(image.astype(np.float32), size, interpolation=cv2.INTER_AREA)
+
+#The grid of calibrate.npz, None if not calibrated
+#A full size table of the previous versions is reduced to a grid
+def loadGrid(path=CALIBRATION_FILE):
+    try:
+        npz = np.load(path)
+    except Exception as e:
+        return None
+    if 'grid' in npz :
+        return npz['grid']
+    if 'table' in npz :
+        return toGrid(npz['table'])
+    return None
+
+def saveGrid(grid, path=CALIBRATION_FILE):
+    np.savez(path, grid = grid.astype(np.float32))
+
+class FlatField() :
+    def __init__(self, grid):
+        self.grid = grid
+        self.shape = None
+        self.gains = None
+
+    def gainsFor(self, shape):
+        if shape != self.shape :
+            gains = cv2.resize(self.grid, (shape[1], shape[0]), interpolation=cv2.INTER_LINEAR)
+            self.gains = np.clip(gains*255. + 0.5, 0, 255).astype(np.uint8)
+            self.shape = shape
+        return self.gains
+
+#uint8 image corrected in place, float32 image (merge 0-1) corrected in a new image
+    def apply(self, image):
+        gains = self.gainsFor(image.shape)
+        if image.dtype == np.uint8 :
+            return cv2.multiply(image, gains, dst=image, scale=1./255.)
+        return cv2.multiply(image, gains, scale=1./255., dtype=cv2.CV_32F)
+
+#Cost per frame and memory against the full size float64 table: python FlatField.py [width height]
+if __name__ == '__main__':
+    import sys
+    import time
+    w, h = (int(v) for v in sys.argv[1:3]) if len(sys.argv) > 2 else (3280, 2464)
+    image = np.random.randint(0, 256, (h, w, 3), np.uint8)
+    table = np.random.uniform(0.6, 1., (h, w, 3))
+    flatField = FlatField(toGrid(table))
+    flatField.apply(image.copy())
+    n = 20
+    start = time.perf_counter()
+    for i in range(n) :
+        (image * table).astype(np.uint8)
+    table_ms = (time.perf_counter() - start)*1000./n
+    start = time.perf_counter()
+    for i in range(n) :
+        flatField.apply(image)
+    grid_ms = (time.perf_counter() - start)*1000./n
+    print('table  %6.1f MB  %6.2f ms per frame' % (table.nbytes/1e6, table_ms))
+    print('grid   %6.1f MB  %6.2f ms per frame (gains of the frame size %.1f MB)' % (flatField.grid.nbytes/1e6, grid_ms, flatField.gains.nbytes/1e6))
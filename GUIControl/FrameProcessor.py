@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import numpy as np
+import cv2
+from concurrent.futures import ProcessPoolExecutor
+sys.path.append('../Common')
+from Constants import *
+from FlatField import FlatField
+from FastFusion import FastFusion
+
+## Decode and merge of the shots in a pool of processes, one per core
+## A job is a complete set of shots: one shot, or all the exposures of a bracket to merge
+## The jobs run in parallel, the caller keeps their futures in the order of the frames
+## and waits for them in that order (see ImageThread.pipeline)
+## The functions run in the worker processes, the flat field grid and the camera response curve
+## (see ResponseCurve) are given to each process at its start (a new pool is started when a
+## calibration changes)
+
+REDUCED_FLAGS = {1:cv2.IMREAD_COLOR, 2:cv2.IMREAD_REDUCED_COLOR_2, 4:cv2.IMREAD_REDUCED_COLOR_4, \
+                 8:cv2.IMREAD_REDUCED_COLOR_8}
+
+flatField = None    #Flat field correction of the worker process
+mergers = None      #Merge objects of the worker process
+response = None     #Camera response curve of the Debevec merge, None for a linear response
+
+def initWorker(grid, curve=None):
+    global flatField, mergers, response
+    flatField = FlatField(grid) if grid is not None else None
+    response = curve
+    mergers = {MERGE_MERTENS:cv2.createMergeMertens(1.,1.,1.), \
+               MERGE_DEBEVEC:cv2.createMergeDebevec(), MERGE_FAST:FastFusion()}
+    mergers['tonemap'] = cv2.createTonemapReinhard()
+    cv2.setNumThreads(1)    #The parallelism is the pool
+
+#Largest scale of the jpeg decoder (DCT scaling) not above a preview reduce factor
+def decodeScale(reduceFactor):
+    return max(scale for scale in REDUCED_FLAGS if scale <= reduceFactor)
+
+#Decode the jpegs, merge them if more than one, apply the calibration
+#scale 2, 4 or 8 decodes directly at 1/scale of the size (preview only, no merge nor calibration)
+#Return the BGR image and the stage times
+def processSet(jpegs, shutters, merge, calibrate, scale=1):
+    stages = {}
+    images = [cv2.imdecode(np.frombuffer(jpeg, np.uint8), REDUCED_FLAGS[scale]) for jpeg in jpegs]
+    stages['decode'] = time.monotonic()
+    calibrate = calibrate and flatField != None
+    if merge == MERGE_NONE :
+        image = images[0]
+        if calibrate :
+            image = flatField.apply(image)
+        return image, stages
+    if merge == MERGE_MERTENS or merge == MERGE_FAST :
+        image = mergers[merge].process(images)
+    else :
+        times = np.asarray(shutters,dtype=np.float32)/1000000.
+        if response is None :
+            image = mergers[MERGE_DEBEVEC].process(images, times)
+        else :
+            image = mergers[MERGE_DEBEVEC].process(images, times, response)
+        image = mergers['tonemap'].process(image)
+    stages['merge'] = time.monotonic()
+    if calibrate :
+        image = flatField.apply(image)
+    image = np.clip(image*255, 0, 255).astype('uint8')
+    return image, stages
+
+class FrameProcessor() :
+    def __init__(self, grid=None, workers=None, response=None):
+        self.workers = workers if workers != None else os.cpu_count() or 1
+        self.pool = None
+        self.grid = grid
+        self.response = response
+        self.start()
+
+#New pool with the calibrations, the jobs already submitted finish with the previous ones
+    def start(self):
+        if self.pool != None :
+            self.pool.shutdown(wait=False)
+        self.pool = ProcessPoolExecutor(self.workers, initializer=initWorker, initargs=(self.grid, self.response))
+
+#New flat field grid
+    def setGrid(self, grid):
+        self.grid = grid
+        self.start()
+
+#New camera response curve, None for a linear response
+    def setResponse(self, response):
+        self.response = response
+        self.start()
+
+#jpegs are copied, the buffers can be released before the job is done
+    def submit(self, jpegs, shutters, merge, calibrate, scale=1):
+        return self.pool.submit(processSet, [bytes(jpeg) for jpeg in jpegs], shutters, merge, calibrate, scale)
+
+    def shutdown(self):
+        self.pool.shutdown()
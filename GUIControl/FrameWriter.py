@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+import queue
+import cv2
+from threading import Thread
+from concurrent.futures import Future
+sys.path.append('../Common')
+from CaptureArchive import ArchiveWriter, RECORD_SHOT, RECORD_PROCESSED
+
+## Writing of the saved frames by a pool of threads, off the receive and processing path
+## A job is the jpeg as received (written as is from its receive buffer), a decoded image (encoded
+## by cv2.imwrite directly in the file) or the shots of a frame appended to a capture archive
+## (see CaptureArchive) in one piece with the image processed of the frame if any (encoded)
+## The queue is bounded: when the disk is slower than the capture, write() blocks the caller
+## which stops granting credits, so the Pi slows down instead of the memory growing
+## write() returns a Future set to the time the file is written, the caller then releases the buffers
+## syncEvery > 0 : the files are flushed to the disk (fsync) by batches of syncEvery, or of the jobs
+## done when the queue is empty, the futures are set once on the disk
+## The queue depth and the MB/s are given to the telemetry
+
+WRITER_THREADS = 2
+WRITER_QUEUE_SIZE = 16
+RATE_PERIOD = 1.    #Seconds between two MB/s measures
+
+class FrameWriter() :
+    def __init__(self, telemetry, threads=WRITER_THREADS, queueSize=WRITER_QUEUE_SIZE, syncEvery=0):
+        self.telemetry = telemetry
+        self.config = (threads, queueSize, syncEvery)
+        self.syncEvery = syncEvery
+        self.jobs = queue.Queue(queueSize)
+        self.bytes = 0
+        self.rateStart = time.monotonic()
+        self.closed = False
+        self.threads = [Thread(target=self.run, daemon=True) for i in range(threads)]
+        for thread in self.threads :
+            thread.start()
+
+#data : bytes like jpeg, or image : BGR image to encode
+    def write(self, path, data=None, image=None):
+        return self.put((path, data, image, None))
+
+#shots : (header, jpeg) list, image : BGR image processed of the frame or None
+    def append(self, archive, shots, image=None):
+        return self.put((None, shots, image, archive))
+
+    def put(self, job):
+        future = Future()
+        if self.closed :
+            future.set_exception(RuntimeError('Writer closed'))
+            return future
+        self.jobs.put(job + (future,))
+        self.telemetry.set('write_queue', self.jobs.qsize())
+        return future
+
+    def run(self):
+        pending = []    #(file or archive, future) written not yet flushed to the disk
+        while True :
+            if pending and self.jobs.empty() :
+                self.sync(pending)
+            job = self.jobs.get()
+            if job == None :
+                break
+            path, data, image, archive, future = job
+            try :
+                if archive != None :
+                    target, n = archive, self.appendSet(archive, data, image)
+                elif image is not None :
+                    if not cv2.imwrite(path, image) :
+                        raise OSError('Cannot write ' + path)
+                    target, n = None, os.path.getsize(path)
+                    if self.syncEvery > 0 :
+                        target = open(path, 'r+b')
+                else :
+                    target = open(path, 'wb')
+                    n = target.write(data)
+                    if self.syncEvery == 0 :
+                        target.close()
+                self.measure(n)
+                if self.syncEvery > 0 :
+                    pending.append((target, future))
+                    if len(pending) >= self.syncEvery :
+                        self.sync(pending)
+                    continue
+                future.set_result(time.monotonic())
+            except Exception as e :
+                future.set_exception(e)
+        self.sync(pending)
+
+#The shots and the processed image of a frame, return the bytes written
+    def appendSet(self, archive, shots, image):
+        records = [(header, jpeg, RECORD_SHOT) for header, jpeg in shots]
+        if image is not None :
+            ok, jpeg = cv2.imencode('.jpg', image)
+            records.append((shots[-1][0], jpeg, RECORD_PROCESSED))
+        archive.appendRecords(records)
+        if self.syncEvery == 0 :
+            archive.flush()
+        return sum(memoryview(payload).nbytes for header, payload, kind in records)
+
+#Flush to the disk, then the futures are set
+    def sync(self, pending):
+        synced = set()
+        for target, future in pending :
+            try :
+                if id(target) not in synced :
+                    synced.add(id(target))
+                    if isinstance(target, ArchiveWriter) :
+                        target.flush(sync=True)
+                    else :
+                        target.flush()
+                        os.fsync(target.fileno())
+                        target.close()
+                future.set_result(time.monotonic())
+            except Exception as e :
+                future.set_exception(e)
+        pending.clear()
+
+    def measure(self, n):
+        self.bytes += n     #Not exact with several threads, only a measure
+        now = time.monotonic()
+        if now - self.rateStart >= RATE_PERIOD :
+            self.telemetry.set('write_mbps', self.bytes/(now - self.rateStart)/1000000.)
+            self.bytes = 0
+            self.rateStart = now
+        self.telemetry.set('write_queue', self.jobs.qsize())
+
+#Write the jobs queued and stop the threads, a later write fails
+    def close(self):
+        self.closed = True
+        for thread in self.threads :
+            self.jobs.put(None)
+        for thread in self.threads :
+            thread.join()
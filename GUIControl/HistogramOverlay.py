@@ -0,0 +1,72 @@
+import sys
+import time
+import numpy as np
+import cv2
+
+## Histograms of the three channels drawn over the top left corner of the preview
+## Computed with cv2.calcHist on a sample of fixed size of the image (nearest pixels, resized into a
+## preallocated contiguous buffer, the cost does not depend on the resolution), drawn with numpy
+## into a preallocated buffer
+## one column per level. The levels 0 and 255 are left out of the scaling, when more than
+## CLIP_THRESHOLD of the pixels of a channel are at 0 (or 255) a stripe of the color of the channel
+## is drawn on the left (or right) side: shadows (or highlights) are clipped
+
+WIDTH = 256
+HEIGHT = 100
+SAMPLE_SIZE = (320, 240)    #Pixels sampled for the histograms
+CLIP_THRESHOLD = 0.005
+CLIP_WIDTH = 4
+BACKGROUND = 32
+
+class HistogramOverlay() :
+    def __init__(self, height=HEIGHT):
+        self.height = height
+        self.buffer = np.empty((height, WIDTH, 3), np.uint8)
+        self.filled = np.empty((height, WIDTH, 3), bool)
+        self.rows = np.arange(height, dtype=np.float32).reshape(height, 1, 1)
+        self.colors = np.full(256, BACKGROUND, np.uint8)   #Filled (1) or not (0) to color
+        self.colors[1] = 255
+        self.histos = np.empty((WIDTH, 3), np.float32)
+        self.sample = np.empty((SAMPLE_SIZE[1], SAMPLE_SIZE[0], 3), np.uint8)
+
+    def compute(self, image):
+        cv2.resize(image, SAMPLE_SIZE, dst=self.sample, interpolation=cv2.INTER_NEAREST)
+        for i in range(3):
+            self.histos[:,i] = cv2.calcHist([self.sample],[i],None,[256],[0,256]).ravel()   #(256,1) or (256,) depending on the OpenCV version
+        return self.histos
+
+    def render(self, histos):
+        total = histos.sum(axis=0)
+        peak = histos[1:255].max(axis=0)
+        heights = histos*(self.height/np.maximum(peak, 1.))
+        np.greater_equal(self.rows, self.height - heights, out=self.filled)
+        cv2.LUT(self.filled.view(np.uint8), self.colors, dst=self.buffer)
+        for i in range(3):
+            if histos[0,i] > CLIP_THRESHOLD*total[i] :
+                self.buffer[:, :CLIP_WIDTH, i] = 255
+            if histos[255,i] > CLIP_THRESHOLD*total[i] :
+                self.buffer[:, -CLIP_WIDTH:, i] = 255
+        return self.buffer
+
+#Draw the histograms of image over image, width a quarter of the image at most
+    def draw(self, image):
+        buffer = self.render(self.compute(image))
+        ww = min(WIDTH, image.shape[1]//4)
+        hh = self.height*ww//WIDTH
+        if ww == WIDTH :
+            image[:hh,:ww] = buffer
+        else :
+            image[:hh,:ww] = cv2.resize(buffer, dsize=(ww,hh), interpolation=cv2.INTER_NEAREST)
+        return image
+
+#Cost per frame: python HistogramOverlay.py [width height]
+if __name__ == '__main__':
+    w, h = (int(v) for v in sys.argv[1:3]) if len(sys.argv) > 2 else (1640, 1232)
+    image = np.random.randint(0, 256, (h, w, 3), np.uint8)
+    overlay = HistogramOverlay()
+    overlay.draw(image)
+    n = 200
+    start = time.perf_counter()
+    for i in range(n) :
+        overlay.draw(image)
+    print('%ix%i %.3f ms per frame' % (w, h, (time.perf_counter() - start)*1000./n))
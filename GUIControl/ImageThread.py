@@ -1,39 +1,56 @@
 import numpy as np
 import cv2
 import sys
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import matplotlib.pyplot as plt
 from PyQt5.QtCore import QThread, pyqtSignal
 sys.path.append('../Common')
 from Constants import *
 from MessageSocket import *
+from AsyncMultiplexSocket import *
+from FlowControl import *
+from Telemetry import *
+from FrameProcessor import FrameProcessor, decodeScale
+from FlatField import *
+from BracketAssembler import BracketAssembler
+from HistogramOverlay import HistogramOverlay
+from FrameWriter import FrameWriter, WRITER_THREADS, WRITER_QUEUE_SIZE
+from CaptureArchive import ArchiveWriter
+from FfmpegSink import FfmpegSink, VIDEO_FRAMERATE
+from ResponseCurve import *
 
 #Receive and process header and images
 #Non concluding experiments
 #   linearize = true : Revert gamma corection of Jpeg before merging
 #   crf = True : Precalculate the camera response forDebevec merge
 #It seems that the Debevec merge without the camera response (ie a linear response) gives the best result
+#The response is now calibrated once per camera and sensor mode (CALIBRATE_HDR, see ResponseCurve)
+#and used by the Debevec merge when present
 #it seems also that Durand's Tonemap gives the best result
 #Note: sharpness is useful for focusing
 #Focus your lens to have the maximum sharpness  
+
+STAGE_QUEUE_SIZE = 4   #Processed sets waiting for the write task
+END_OF_CAPTURE = 'end'  #Write queue item after the last set of a capture
+PREVIEW_FPS = 10       #Default maximum preview rate
+PREVIEW_TIMEOUT = 1.   #A preview not acknowledged by the GUI after this time is considered lost
  
 class ImageThread (QThread):
     imageSignal = pyqtSignal([object,])   #Signal to the GUI display histo
     headerSignal = pyqtSignal([object,])  #Signal to the GUI display header
     merge = MERGE_NONE
+    bracketSteps = 1    #Shots of a frame without adaptive bracketing
     sharpness = False
     saveToFile = False
     histos = False
-    images = []
-    shutters = []
-    def __init__(self, ip_pi):
+    def __init__(self, connection):
         QThread.__init__(self)
         self.threadID = 1
         self.name = "ImgThread"
         self.window = None
         self.saveOn = False
-        self.mergeMertens = cv2.createMergeMertens(1.,1.,1.)
-        self.mergeDebevec = cv2.createMergeDebevec()
-        self.toneMap = cv2.createTonemapReinhard()
 #        self.claheProc = cv2.createCLAHE(clipLimit=1, tileGridSize=(8,8))
 #        self.simpleWB = cv2.xphoto.createSimpleWB()
 #        self.simpleWB = cv2.xphoto.createGrayworldWB()
@@ -42,16 +59,29 @@ class ImageThread (QThread):
 #         self.clahe = False
 #        self.clipLimit = 1.
         self.reduceFactor = 1;
-        self.ip_pi = ip_pi
+        self.connection = connection
+        self.imageSock = connection.channel(CHANNEL_FRAME)
+        self.creditSock = connection.channel(CHANNEL_CREDIT)
+        self.executor = ThreadPoolExecutor(1)   #Queueing of the writes and calibration
+        self.previewExecutor = ThreadPoolExecutor(1)
+        self.histogramOverlay = HistogramOverlay()
+        self.previewFps = PREVIEW_FPS
+        self.previewStart = 0.     #Time of the last preview, 0 when the GUI has displayed it
+        self.lastPreview = 0.
         self.hflip = False
         self.vflip = False
-        self.table=None
+        self.grid = loadGrid()     #Flat field gains (see FlatField)
         self.doCalibrate = False
-        try:
-            npz = np.load("calibrate.npz")
-            self.table = npz['table']
-        except Exception as e:
-            pass
+        self.telemetry = Telemetry()
+        self.assembler = BracketAssembler(self.telemetry)
+        self.writerConfig = (WRITER_THREADS, WRITER_QUEUE_SIZE, 0)  #threads, queueSize, syncEvery
+        self.writer = FrameWriter(self.telemetry, *self.writerConfig)
+        self.finishing = set()  #Tasks waiting for the write of a set
+        self.archive = None
+        self.video = None
+        self.responseKey = None    #Camera and sensor mode of the response curve (see ResponseCurve)
+        self.hdrShots = []         #(shutter, jpeg) of the CALIBRATE_HDR series
+        self.processor = FrameProcessor(self.grid)
 
 
 #     def simplest_cb(self, img, percent):
@@ -66,101 +96,54 @@ class ImageThread (QThread):
 #             out_channels.append(cv2.LUT(channel, lut))
 #         return cv2.merge(out_channels)
 
-    def calcHistogram(self, image) :
-        histos = []
-        for i in range(3):
-            histo = cv2.calcHist([image],[i],None,[256],[0,256])
-            histos.append(histo)
-        self.displayHistogramOverImage(histos, image)
-        
-    def displayHistogramOverImage(self, histos, image) :
-        figure = plt.figure()
-        axe = figure.add_subplot(111)
-        colors = ('b','g','r')
-        for i,col in enumerate(colors):
-            axe.plot(histos[i],color = col)
-        axe.set_xlim([0,256])
-        axe.get_yaxis().set_visible(False)
-        figure.tight_layout()
-        figure.canvas.draw()
-        w, h  = figure.canvas.get_width_height()
-        buf = np.fromstring ( figure.canvas.tostring_rgb(), dtype=np.uint8 ).reshape(h,w,3)
-        ww = int(image.shape[0]/4)
-        hh = int(h*ww/w)
-        resized = cv2.resize(buf, dsize=(ww,hh), interpolation=cv2.INTER_CUBIC)
-        image[:hh,:ww] = resized
-            
-    def processImage(self, header, jpeg):
-        bracket = header['bracket']
+#Queue the file of a processed set to the FrameWriter, None when not saving
+#To an archive the shots are saved as received (all the exposures of a bracket) with the image
+#merged or calibrated
+#Blocks when the writer queue is full
+    def saveImage(self, shots, image):
+        if not self.saveOn :
+            return None
+        if self.writer.config != self.writerConfig :   #Changed by setWriter
+            writer = self.writer
+            self.writer = FrameWriter(self.telemetry, *self.writerConfig)
+            writer.close()
+        if self.archive != None :
+            processed = shots[-1][0]['merged'] or self.doCalibrate
+            return self.writer.append(self.archive, shots, image if processed else None)
+        header, jpeg = shots[-1]
         count = header['count']
-        jpeg = np.frombuffer(jpeg, np.uint8,count = len(jpeg)) 
-        image = cv2.imdecode(jpeg, 1)   #Jpeg decoded
-        if self.merge != MERGE_NONE and bracket != 0 : #Merge
-            self.images.append(image)
-            self.shutters.append(header['shutter'])
-            if bracket != 1 :
-                return
-            else :
-                if self.merge == MERGE_MERTENS:
-                    image = self.mergeMertens.process(self.images)
-                else :
-                    image = self.mergeDebevec.process(self.images, np.asarray(self.shutters,dtype=np.float32)/1000000.)
-                    image = self.toneMap.process(image)
-                if self.doCalibrate :
-                    image = image * self.table
-                image = np.clip(image*255, 0, 255).astype('uint8')
-#                 if self.equalize :
-#                     H, S, V = cv2.split(cv2.cvtColor(image, cv2.COLOR_BGR2HSV))
-#                     low, high = np.percentile(V, (1, 99))
-#                     eq_V = np.interp(V, (low,high), (V.min(), V.max())).astype(np.uint8)
-#                     image = cv2.cvtColor(cv2.merge([H, S, eq_V]), cv2.COLOR_HSV2BGR)
-#                 if self.clahe :
-#                     H, S, V = cv2.split(cv2.cvtColor(image, cv2.COLOR_BGR2HSV))
-#                     self.claheProc.setClipLimit(self.clipLimit)
-#                     eq_V = self.claheProc.apply(V)
-#                     image = cv2.cvtColor(cv2.merge([H, S, eq_V]), cv2.COLOR_HSV2BGR)
-#                 if self.wb :
-#                     image = self.simpleWB.balanceWhite(image)
-#                     image = self.simplest_cb(image, 1)
-                if self.saveOn :
-                    cv2.imwrite(self.directory + "/image_%#05d.jpg" % count, image)
-                self.images.clear()
-                self.shutters.clear()
-        else :
-#            saveJpeg = bracket == 0 and self.wb == False and self.doCalibrate  == False
-            saveJpeg = bracket == 0 and self.doCalibrate  == False
+#        saveJpeg = header['bracket'] == 0 and self.wb == False and self.doCalibrate  == False
+        saveJpeg = not header['merged'] and header['bracket'] == 0 and self.doCalibrate  == False
 
-            if self.doCalibrate :
-                image = image * self.table
-                image = image.astype(np.uint8)
+#         if self.wb and bracket == 0:
+#             image = self.simplest_cb(image, 1)
+         
+        if saveJpeg :
+            return self.writer.write(self.directory + "/image_%#05d_%#02d.jpg" % (count, header['bracket']), data=jpeg)
+        return self.writer.write(self.directory + "/image_%#05d.jpg" % count, image=image)
 
-#             if self.wb and bracket == 0:
-#                 image = self.simplest_cb(image, 1)
-             
-            if self.saveOn :
-                if saveJpeg :
-                    file = open(self.directory + "/image_%#05d_%#02d.jpg" % (header['count'], header['bracket']),'wb')
-                    file.write(jpeg)
-                    file.close()
-                else :
-                    cv2.imwrite(self.directory + "/image_%#05d.jpg" % count, image)
-            if self.sharpness :
-                sharpness = cv2.Laplacian(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), cv2.CV_64F).var()
-                cv2.putText(image, str(sharpness), (200,200), cv2.FONT_HERSHEY_SIMPLEX,3,(255,255,255),2)
-        if self.histos :            
-            self.calcHistogram(image)
-        if self.reduceFactor != 1 :
-            newShape = (int(image.shape[1]/self.reduceFactor),int(image.shape[0]/self.reduceFactor))
+#scale : the image was decoded at 1/scale of the size, only the rest of the reduction is done here
+#The image may be being written, it is not modified
+    def displayImage(self, image, scale=1):
+        if self.sharpness :
+            sharpness = cv2.Laplacian(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), cv2.CV_64F).var()
+        if self.reduceFactor != scale :
+            newShape = (int(image.shape[1]*scale/self.reduceFactor),int(image.shape[0]*scale/self.reduceFactor))
             image = cv2.resize(image, dsize=newShape, interpolation=cv2.INTER_CUBIC)            
+        elif self.sharpness or self.histos :
+            image = image.copy()
+        if self.sharpness :
+            size = scale/self.reduceFactor
+            cv2.putText(image, str(sharpness), (int(200*size),int(200*size)), cv2.FONT_HERSHEY_SIMPLEX,3*size,(255,255,255),2)
+        if self.histos :            
+            self.histogramOverlay.draw(image)
         self.imageSignal.emit(image) #«display image in the GUI
 #        cv2.imshow("PiCamera", image)
 #        cv2.waitKey(1)
 
-    def lensAnalyze(self, header) :
-        image = self.imageSock.receiveArray()  #bgr
-        if self.doCalibrate :
-            image = image * self.table
-            image = image.astype(np.uint8)
+    def lensAnalyze(self, header, image) :
+        if self.doCalibrate and self.grid is not None :
+            image = FlatField(self.grid).apply(image.copy())
         x = image.shape[0]/image.shape[1]
         diag = np.empty((image.shape[1],3))
         print(diag.shape)
@@ -185,79 +168,252 @@ class ImageThread (QThread):
 #        figure.subplots_adjust(top=0.85)
         plt.show()
 
-#Normalize each channel toward the Min
-    def calibrate(self, header) :
-        image = self.imageSock.receiveArray()  #bgr
+#Normalize each channel toward the Min, on the grid of the flat field
+    def calibrate(self, header, image) :
         i = header['num']
         count = header['count']
+        image = toGrid(image)
         if i != 0 :
-            image = image * self.table
-        gains = np.copy(image).astype(np.float)
-        ih, iw, nc = image.shape
+            image = image * self.grid
         centre = np.min(image, axis=(0,1))
-        gains = centre/gains
+        gains = centre/np.maximum(image, 1.)
         if i  == 0 :    #Firts one
-            self.table = gains
+            self.grid = gains
         else :
-            self.table = self.table*gains
-        self.table[self.table>1.] = 1.
+            self.grid = self.grid*gains
+        self.grid[self.grid>1.] = 1.
         if i == count -1 :
-            np.savez('calibrate.npz',   table = self.table)
+            saveGrid(self.grid)
+            self.processor.setGrid(self.grid)
             
-    def saveToFile(self, saveFlag, directory) :
+#Camera opened: the Debevec merge uses its response curve if calibrated
+    def setCamera(self, key) :
+        self.responseKey = key
+        self.processor.setResponse(loadResponse(key))
+
+#Camera response curve from the bracket series of CALIBRATE_HDR, saved for the camera and sensor mode
+    def calibrateResponse(self, header, jpeg) :
+        if header['num'] == 0 :
+            self.hdrShots = []
+        self.hdrShots.append((header['shutter'], jpeg))
+        if header['num'] == header['count'] - 1 :
+            images = [cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR) for shutter, jpeg in self.hdrShots]
+            response = estimateResponse(images, [shutter for shutter, jpeg in self.hdrShots])
+            self.hdrShots = []
+            if self.responseKey != None :
+                saveResponse(self.responseKey, response)
+            self.processor.setResponse(response)
+            self.headerSignal.emit({'type':HEADER_MESSAGE, 'msg':'Camera response calibrated'})
+
+#Give back credits to the Pi for n bytes processed
+    async def grant(self, n) :
+        await self.creditSock.sendMsg(encodeCredit(n))
+
+#Writer threads, queue size and fsync batch (see FrameWriter) of the next capture
+#The writer is replaced by the next saveImage, on the thread of the writes and in their order,
+#the old one ends its writes before it is closed
+    def setWriter(self, threads=WRITER_THREADS, queueSize=WRITER_QUEUE_SIZE, syncEvery=0):
+        self.writerConfig = (threads, queueSize, syncEvery)
+
+#Encode the frames of the capture in a video (see FfmpegSink), until the end of the capture
+#The jpegs are given to ffmpeg when they are not merged nor calibrated here
+    def startVideo(self, path, preset, framerate=VIDEO_FRAMERATE):
+        self.stopVideo()
+        input = 'bgr' if self.merge != MERGE_NONE or self.doCalibrate else 'jpeg'
+        self.video = FfmpegSink(path, preset, input, framerate)
+
+    def stopVideo(self):
+        video = self.video
+        self.video = None
+        if video != None :
+            video.close()
+
+#archive : the shots are appended to a capture archive in directory instead of one file each
+#Called at the start of each capture, a capture is a new session of the archive
+    def saveToFile(self, saveFlag, directory, archive=False) :
         self.saveOn = saveFlag
         self.directory = directory
+        if self.archive != None and (not (saveFlag and archive) or self.archive.directory != directory) :
+            self.archive.close()
+            self.archive = None
+        if saveFlag and archive and self.archive == None :
+            self.archive = ArchiveWriter(directory)
+        elif self.archive != None :
+            self.archive.newSession()
             
     def run(self):
         print('ImageThread started')
-        self.imageSock = None
         try:
-            sock = socket.socket()
-            sock.connect((self.ip_pi, 8000))
-            print('ImageThread connected')
-            self.imageSock = MessageSocket(sock)
-            while True:
-                header = self.imageSock.receiveObject()
-                if header == None :
-                    print('Closed connection')
-                    cv2.destroyAllWindows()
-                    if self.imageSock != None:
-                        self.imageSock.close()
-                    break
-                typ = header['type']
-                if typ == HEADER_STOP:
-                    break
-                self.headerSignal.emit(header) #«display header info in GUI if necessary (count,...)
-                if  typ == HEADER_IMAGE :
-                    image = self.imageSock.receiveMsg()
-                    self.processImage(header, image)
-                elif typ == HEADER_BGR :
-                    self.processBgr()
-                elif typ == HEADER_CALIBRATE :
-                    self.calibrate(header)
-                elif typ == HEADER_ANALYZE :
-                    self.lensAnalyze(header)
-#                if  typ == HEADER_HDR :
-#                    image = self.imageSock.receiveMsg()
-#                    self.processHdrImage(header, image)
-                
+            self.connection.run(self.pipeline())
         finally:
             print('ImageThread terminated')
-            cv2.destroyAllWindows()
-            if self.imageSock != None:
-                self.imageSock.shutdown()
-                self.imageSock.close()
+            try :
+                cv2.destroyAllWindows()
+            except cv2.error :      #Headless OpenCV (Benchmark)
+                pass
+            self.connection.close()
+
+#Ingest and write are tasks of the connection event loop
+#The ingest task keeps reading the socket, it submits each complete set of shots (one shot, or
+#a bracket to merge) to the FrameProcessor pool where the sets are decoded and merged in parallel.
+#The futures are queued in the order of the frames, the write task waits for them in that order
+#so the frames are written and displayed in count order. The bounded queue limits the sets in the pool
+    async def pipeline(self):
+        writeQueue = asyncio.Queue(self.processor.workers + STAGE_QUEUE_SIZE)
+        writer = asyncio.create_task(self.writeTask(writeQueue))
+        try:
+            await self.grant(CREDIT_WINDOW)
+            await self.ingest(writeQueue)
+            for shots in self.assembler.flush() :
+                await self.submit(shots, writeQueue)
+        finally:
+            await writeQueue.put(None)  #End of the write stage
+            await asyncio.gather(writer, return_exceptions=True)
+            await asyncio.gather(*self.finishing, return_exceptions=True)
+            self.writer.close()
+            if self.archive != None :
+                self.archive.close()
+            self.stopVideo()
+            self.executor.shutdown()
+            self.previewExecutor.shutdown()
+            self.processor.shutdown()
+
+    async def ingest(self, writeQueue):
+        loop = asyncio.get_running_loop()
+        while True:
+            header = await self.imageSock.receiveHeader()
+            if header == None :
+                print('Closed connection')
+                break
+            typ = header['type']
+            if typ == HEADER_STOP:
+                break
+            self.headerSignal.emit(header) #«display header info in GUI if necessary (count,...)
+            for shots in self.assembler.poll() :   #Timed out brackets
+                await self.submit(shots, writeQueue)
+            if  typ == HEADER_IMAGE :
+                image = await self.imageSock.receiveMsg()
+                header.setdefault('stages', {})['receive'] = time.monotonic()
+                await self.collect(header, image, writeQueue)
+            elif typ == HEADER_MESSAGE and header['msg'].startswith('Capture terminated') :
+                for shots in self.assembler.flush() :
+                    await self.submit(shots, writeQueue)
+                await writeQueue.put(END_OF_CAPTURE)
+            elif typ == HEADER_BGR :
+                self.processBgr()
+            elif typ == HEADER_CALIBRATE or typ == HEADER_ANALYZE :
+                image = await self.imageSock.receiveArray()  #bgr
+                await self.grant(image.nbytes)
+                process = self.calibrate if typ == HEADER_CALIBRATE else self.lensAnalyze
+                await loop.run_in_executor(self.executor, process, header, image)
+            elif typ == HEADER_HDR :
+                jpeg = await self.imageSock.receiveMsg()
+                data = bytes(jpeg)
+                await self.grant(len(jpeg))
+                self.imageSock.release(jpeg)
+                await loop.run_in_executor(self.executor, self.calibrateResponse, header, data)
+
+#Gather the shots of the brackets to merge, submit each set given back by the assembler
+    async def collect(self, header, jpeg, writeQueue):
+        header['merged'] = self.merge != MERGE_NONE and header['bracket'] != 0
+        if not header['merged'] :
+            await self.submit([(header, jpeg)], writeQueue)
+            return
+        sets, rejected = self.assembler.add(header, jpeg)
+        for header, jpeg in rejected :
+            await self.grant(len(jpeg))
+            self.imageSock.release(jpeg)
+        for shots in sets :
+            await self.submit(shots, writeQueue)
+
+    async def submit(self, shots, writeQueue):
+        header = shots[-1][0]
+        if len(shots) == 1 and header['merged'] :  #One shot of a bracket (adaptive bracketing or lost shots)
+            header['merged'] = False
+        merge = self.merge if header['merged'] else MERGE_NONE
+        header['scale'] = self.previewScale(header)
+        future = self.processor.submit([shot[1] for shot in shots], [shot[0]['shutter'] for shot in shots], merge, self.doCalibrate, header['scale'])
+        await writeQueue.put((shots, asyncio.wrap_future(future)))
+
+#A shot only previewed is decoded directly at the preview size (DCT scaled decode)
+#The full image is needed to merge, calibrate, measure the sharpness or save it decoded
+    def previewScale(self, header):
+        if header['merged'] or self.doCalibrate or self.sharpness :
+            return 1
+        video = self.video
+        if video != None and video.input == 'bgr' :   #Encoded at full size
+            return 1
+        if self.saveOn and header['bracket'] != 0 :  #Saved with imwrite
+            return 1
+        return decodeScale(self.reduceFactor)
+
+#Queue the writes and display the processed sets in order, None ends the stage
+    async def writeTask(self, writeQueue):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await writeQueue.get()
+            if item == None :
+                break
+            if item == END_OF_CAPTURE :
+                await loop.run_in_executor(None, self.stopVideo)
+                continue
+            shots, future = item
+            header, jpeg = shots[-1]
+            written = None
+            try :
+                image, stages = await future
+                for shot in shots :
+                    shot[0]['stages']['decode'] = stages['decode']
+                header['stages'].update(stages)
+                written = await loop.run_in_executor(self.executor, self.saveImage, shots, image)
+                video = self.video
+                if video != None and (header['merged'] or self.normalShot(header)) :
+                    frame = image if video.input == 'bgr' else bytes(jpeg)
+                    await loop.run_in_executor(self.executor, video.add, frame)
+                self.preview(header, image)
+            except Exception as e :
+                print('Process', header['count'], e)
+            task = asyncio.create_task(self.finish(shots, written))
+            self.finishing.add(task)
+            task.add_done_callback(self.finishing.discard)
+
+#A shot not merged is in the video if it is the normal exposure: one shot, or the first shot
+#of a bracket (numbered from the number of shots of the frame down to 1)
+    def normalShot(self, header):
+        bracket = header['bracket']
+        return bracket == 0 or bracket == (header.get('shots') or self.bracketSteps)
+
+#The set is written, its buffers and credits are given back
+    async def finish(self, shots, written):
+        header = shots[-1][0]
+        if written != None :
+            try :
+                header['stages']['write'] = await asyncio.wrap_future(written)
+            except Exception as e :
+                print('Write', header['count'], e)
+        for shot in shots :
+            await self.shotDone(*shot)
 
-#Experimental Receive a set of exposures not used
-    def processHdrImage(self, header, jpeg):
-        jpeg = np.frombuffer(jpeg, np.uint8,count = len(jpeg))
-        file = open(self.directory + "/ldr_%#05d.jpg" % (header['shutter']) ,'wb')
-        file.write(jpeg)
-        file.close()
-        image = cv2.imdecode(jpeg, 1)   #Jpeg decode
-        cv2.imshow("PiCamera", image)
-        cv2.waitKey(1)
+#The preview is dropped when the GUI has not displayed the previous one or above previewFps
+#it runs on its own thread, the writing never waits for the display
+    def preview(self, header, image):
+        now = time.monotonic()
+        if now - self.previewStart < PREVIEW_TIMEOUT or now - self.lastPreview < 1./self.previewFps :
+            self.telemetry.increment('preview_dropped')
+            return
+        self.previewStart = now
+        self.lastPreview = now
+        self.previewExecutor.submit(self.displayImage, image, header['scale'])
 
+#Called by the GUI when the preview is displayed
+    def previewDone(self):
+        self.previewStart = 0.
 
+#The shot went through the pipeline (or ended in a bracket), its buffer and credits are given back
+    async def shotDone(self, header, jpeg):
+        await self.grant(len(jpeg))
+        self.imageSock.release(jpeg)
+        self.frameDone(header)
 
-        
+    def frameDone(self, header):
+        self.telemetry.record(header['stages'])
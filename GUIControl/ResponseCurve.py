@@ -0,0 +1,47 @@
+import sys
+import numpy as np
+import cv2
+
+## Camera response curve for the Debevec merge
+## Estimated once with cv2.CalibrateDebevec from a bracket series of a still frame taken by the Pi
+## (CALIBRATE_HDR, see ImageThread.calibrateResponse) instead of a linear response
+## Saved in response.npz next to calibrate.npz, one curve per camera and sensor mode
+## The curve is a 256 entries table per channel: the merge linearizes the shots with it (LUT),
+## the cost per frame is the one of the merge with a linear response
+## Usage: python ResponseCurve.py  (the curves saved)
+
+RESPONSE_FILE = 'response.npz'
+RESPONSE_SAMPLES = 100      #Pixels sampled by CalibrateDebevec
+HDR_CALIBRATION_SHOTS = 9   #Shots of the calibration series
+HDR_CALIBRATION_STOPS = 3   #From -3 EV to +3 EV around the auto exposure
+
+#Key of a curve: camera version and sensor mode
+def responseKey(cameraVersion, mode):
+    return 'v%i_mode%i' % (cameraVersion, mode)
+
+def loadResponses(path=RESPONSE_FILE):
+    try:
+        with np.load(path) as npz :
+            return dict(npz)
+    except Exception as e:
+        return {}
+
+#The curve of key, None if not calibrated
+def loadResponse(key, path=RESPONSE_FILE):
+    return loadResponses(path).get(key)
+
+def saveResponse(key, response, path=RESPONSE_FILE):
+    responses = loadResponses(path)
+    responses[key] = response.astype(np.float32)
+    np.savez(path, **responses)
+
+#images : BGR shots of the same frame, shutters in us
+def estimateResponse(images, shutters):
+    calibrate = cv2.createCalibrateDebevec(RESPONSE_SAMPLES)
+    return calibrate.process(images, np.asarray(shutters, dtype=np.float32)/1000000.)
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else RESPONSE_FILE
+    for key, response in sorted(loadResponses(path).items()) :
+        levels = (16, 64, 128, 192, 240)
+        print(key, '  '.join('%i: %s' % (level, ' '.join('%.3f' % v for v in response[level, 0])) for level in levels))
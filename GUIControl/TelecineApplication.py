@@ -1,4 +1,3 @@
-import socket
 import logging
 from struct import *
 import sys
@@ -13,12 +12,17 @@ from PyQt5.QtCore import QObject, pyqtSignal, QTimer, Qt
 
 from TelecineDialogUI import Ui_TelecineDialog
 from ImageThread import ImageThread
+from TelemetryThread import TelemetryThread
+from CommandClient import CommandClient
+from ResponseCurve import responseKey, HDR_CALIBRATION_SHOTS, HDR_CALIBRATION_STOPS
 
 sys.path.append('../Common')
 from Constants import *
 from MessageSocket import *
+from AsyncMultiplexSocket import *
 
 localSettings = ('ip_pi', 'root_directory','hflip', 'vflip', 'mode')
+VIDEO_PRESETS = (None, 'ffv1', 'prores', 'h264', 'copy')   #Items of videoBox
 
 #Generic methods to set/get object attributes from a dictionary
 def getSettings(object, keys):
@@ -39,11 +43,13 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
         super(TelecineDialog, self).__init__()
         self.setupUi(self)
         self.sock = None
+        self.commands = None
         self.connected = False
         self.paused = False
         self.saveTofile = False
         self.directory = ''
         self.imageThread = None
+        self.telemetryThread = None
         self.connectButton.setStyleSheet("background-color: red")
         self.ip_pi = ''
         self.hflip = False
@@ -68,6 +74,7 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
         self.autoPauseCheckBox.setEnabled(False)
         self.lensAnalyseButton.setEnabled(False)
         self.calibrateLocalButton.setEnabled(False)
+        self.calibrateHdrButton.setEnabled(False)
         self.imageDialog = None
 
 #        self.whiteBalanceButton.setEnabled(False)
@@ -76,30 +83,30 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
 #Lamp
     def setLamp(self):
         if self.lampCheckBox.isChecked() :
-            self.sock.sendObject((SET_LAMP, LAMP_ON))
+            self.commands.request(SET_LAMP, LAMP_ON)
         else :
-            self.sock.sendObject((SET_LAMP, LAMP_OFF))
+            self.commands.request(SET_LAMP, LAMP_OFF)
         
 #Motor Control
     def motorOn(self) :
-        self.sock.sendObject((MOTOR_ON,))
+        self.commands.request(MOTOR_ON)
         self.motorControlGroupBox.setEnabled(True)
         self.motorOnButton.setEnabled(False)
         self.motorOffButton.setEnabled(True)
     def motorOff(self) :
-        self.sock.sendObject((MOTOR_OFF,))
+        self.commands.request(MOTOR_OFF)
         self.motorControlGroupBox.setEnabled(False)
         self.motorOnButton.setEnabled(True)
         self.motorOffButton.setEnabled(False)
     def forwardOne(self):
         self.setMotorSettings({'speed':self.motorSpeedBox.value()})
-        self.sock.sendObject((MOTOR_ADVANCE_ONE,MOTOR_FORWARD))
+        self.commands.request(MOTOR_ADVANCE_ONE,MOTOR_FORWARD)
     def backwardOne(self) :
         self.setMotorSettings({'speed':self.motorSpeedBox.value()})
-        self.sock.sendObject((MOTOR_ADVANCE_ONE,MOTOR_BACKWARD))
+        self.commands.request(MOTOR_ADVANCE_ONE,MOTOR_BACKWARD)
     def forward(self):
         self.setMotorSettings({'speed':self.motorSpeedBox.value()})
-        self.sock.sendObject((MOTOR_ADVANCE, MOTOR_FORWARD))
+        self.commands.request(MOTOR_ADVANCE, MOTOR_FORWARD)
         self.motorStopButton.setEnabled(True)
         self.forwardOneButton.setEnabled(False)
         self.backwardOneButton.setEnabled(False)
@@ -108,7 +115,7 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
         self.motorOnTriggerButton.setEnabled(False)
     def backward(self):
         self.setMotorSettings({'speed':self.motorSpeedBox.value()})
-        self.sock.sendObject((MOTOR_ADVANCE, MOTOR_BACKWARD))
+        self.commands.request(MOTOR_ADVANCE, MOTOR_BACKWARD)
         self.motorStopButton.setEnabled(True)
         self.forwardOneButton.setEnabled(False)
         self.backwardOneButton.setEnabled(False)
@@ -116,7 +123,7 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
         self.backwardButton.setEnabled(False)
         self.motorOnTriggerButton.setEnabled(False)
     def motorStop(self):
-        self.sock.sendObject((MOTOR_STOP,))
+        self.commands.request(MOTOR_STOP)
         self.motorStopButton.setEnabled(False)
         self.forwardOneButton.setEnabled(True)
         self.backwardOneButton.setEnabled(True)
@@ -126,14 +133,14 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
 
     def motorOnTrigger(self):
         self.setMotorSettings({'speed':self.motorSpeedBox.value()})
-        self.sock.sendObject((MOTOR_ON_TRIGGER,))
+        self.commands.request(MOTOR_ON_TRIGGER)
 
 
     def setMotorSettings(self, settings) :
-        self.sock.sendObject((SET_MOTOR_SETTINGS, settings))
+        self.commands.request(SET_MOTOR_SETTINGS, settings)
         
     def setMotorInitSettings(self) :
-        self.sock.sendObject((SET_MOTOR_SETTINGS, {\
+        self.commands.request(SET_MOTOR_SETTINGS, {\
             'steps_per_rev':self.stepsPerRevBox.value(),\
             'pulley_ratio':self.pulleyRatioBox.value(),\
             'ena_pin':int(self.enaEdit.text()),\
@@ -144,14 +151,15 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
             'pulse_level': 1 if self.pulseLevelCheckBox.isChecked() else 0, \
             'ena_level': 1 if self.enaLevelCheckBox.isChecked() else 0, \
             'trigger_level': 1 if self.triggerLevelCheckBox.isChecked() else 0 \
-            }))
+            })
 
 
 
-#Get and display motor settings
+#Get and display motor settings, displayed when the Pi replies
     def getMotorSettings(self) :
-        self.sock.sendObject((GET_MOTOR_SETTINGS,))
-        settings = self.sock.receiveObject()
+        self.commands.request(GET_MOTOR_SETTINGS, callback=self.showMotorSettings)
+
+    def showMotorSettings(self, settings) :
         self.stepsPerRevBox.setValue(settings['steps_per_rev'])
         self.pulleyRatioBox.setValue(settings['pulley_ratio'])
         self.enaEdit.setText(str(settings['ena_pin']))
@@ -185,21 +193,35 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
             calibrationMode = CALIBRATION_FLAT
         elif self.calibrateTableButton.isChecked() :
             calibrationMode = CALIBRATION_TABLE
-        self.sock.sendObject((OPEN_CAMERA, self.mode, requestedResolution, \
-                             calibrationMode, self.hflip, self.vflip))
-        maxResolution = self.getCameraSetting('MAX_RESOLUTION')
+        self.defaultResolution = hres == 0 and vres == 0
+        self.messageLabel.setText('Opening camera please wait')
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        self.openCameraButton.setEnabled(False)
+        self.commands.request(OPEN_CAMERA, self.mode, requestedResolution, \
+                              calibrationMode, self.hflip, self.vflip, callback=self.cameraOpened)
+
+#Reply of the Pi, the GUI is not blocked while the camera opens
+    def cameraOpened(self, result) :
+        self.commands.request(GET_CAMERA_SETTINGS, callback=self.cameraReady)
+
+    def cameraReady(self, settings) :
+        QApplication.restoreOverrideCursor()
+        self.messageLabel.setText('Camera open')
+        maxResolution = settings['MAX_RESOLUTION']
         if maxResolution[0] == 3280 :
             self.cameraVersion = 2
         else :
             self.cameraVersion = 1
-        if hres== 0 and vres==0 and self.mode != 0 :
+        self.resolution = settings['resolution']
+        if self.defaultResolution and self.mode != 0 :
             if self.cameraVersion == 2 :
                 res=V2_RESOLUTIONS[self.mode-1]
             else :
                 res=V1_RESOLUTIONS[self.mode-1]
-            self.sock.sendObject((SET_CAMERA_SETTINGS, {'resolution':res}))
+            self.commands.request(SET_CAMERA_SETTINGS, {'resolution':res})
+            self.resolution = res
         self.cameraVersionLabel.setText('Picamera V' + str(self.cameraVersion))
-        self.resolution = self.getCameraSetting('resolution')
+        self.imageThread.setCamera(responseKey(self.cameraVersion, settings['sensor_mode']))
         self.hresLineEdit.setText(str(self.resolution[0]))
         self.vresLineEdit.setText(str(self.resolution[1]))
         self.cameraControlGroupBox.setEnabled(True)
@@ -208,15 +230,16 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
         self.closeCameraButton.setEnabled(True)
         self.openCameraButton.setEnabled(False)
         self.calibrateButton.setEnabled(False)
-        self.getCameraSettings()
+        self.showCameraSettings(settings)
         self.lensAnalyseButton.setEnabled(True)
         self.calibrateLocalButton.setEnabled(True)
+        self.calibrateHdrButton.setEnabled(True)
 #        self.whiteBalanceButton.setEnabled(True)
 
 
 
     def closeCamera(self) :
-        self.sock.sendObject((CLOSE_CAMERA,))
+        self.commands.request(CLOSE_CAMERA)
         self.cameraControlGroupBox.setEnabled(False)
         self.frameProcessingGroupBox.setEnabled(False)
         self.cameraSettingsGroupBox.setEnabled(False)
@@ -225,14 +248,18 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
         self.calibrateButton.setEnabled(True)
         self.lensAnalyseButton.setEnabled(False)
         self.calibrateLocalButton.setEnabled(False)
+        self.calibrateHdrButton.setEnabled(False)
 #        self.whiteBalanceButton.setEnabled(False)
 
 #Calibrate remote    
     def calibrate(self) :
         self.messageLabel.setText('Calibrating please wait')
         QApplication.setOverrideCursor(Qt.WaitCursor)
-        self.sock.sendObject((CALIBRATE_CAMERA,self.hflipCheckBox.isChecked(), self.vflipCheckBox.isChecked()))
-        done = self.sock.receiveObject()
+        self.commands.request(CALIBRATE_CAMERA,self.hflipCheckBox.isChecked(), self.vflipCheckBox.isChecked(), \
+                              callback=self.calibrateDone)
+
+#Reply of the Pi, the GUI is not blocked meanwhile
+    def calibrateDone(self, done) :
         QApplication.restoreOverrideCursor()
         self.messageLabel.setText(done)
         print(done)
@@ -240,14 +267,22 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
 #Calibrate Local        
     def calibrateLocal (self):
         self.setResize()
-        self.sock.sendObject((TAKE_BGR,HEADER_CALIBRATE,1) )  #Calibrate on 1 image
+        self.commands.request(TAKE_BGR,HEADER_CALIBRATE,1)  #Calibrate on 1 image
+
+#Camera response curve of the Debevec merge, estimated by the ImageThread from a bracket series
+#The frame must not move during the series
+    def calibrateHDR(self) :
+        self.setResize()
+        self.messageLabel.setText('Calibrating the camera response')
+        self.commands.request(CALIBRATE_HDR, HDR_CALIBRATION_SHOTS, HDR_CALIBRATION_STOPS)
 
     def doCalibrateLocal (self):
         self.imageThread.doCalibrate = self.calibrateLocalCheckBox.isChecked()
         
     def setWhiteBalance(self)  :      
-        self.sock.sendObject((WHITE_BALANCE,))
-        gains = self.sock.receiveObject()
+        self.commands.request(WHITE_BALANCE, callback=self.whiteBalanceDone)
+
+    def whiteBalanceDone(self, gains) :
         self.redGainBox.setValue(float(gains[0])*100.)
         self.blueGainBox.setValue(float(gains[1])*100.)
 
@@ -296,7 +331,7 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
     def setROI(self) :
         roi = (self.ROIxBox.value()/self.resolution[0],self.ROIyBox.value()/self.resolution[1],self.ROIwBox.value()/self.resolution[0],self.ROIhBox.value()/self.resolution[1])
         print(roi)
-        self.sock.sendObject((SET_CAMERA_SETTINGS, {'zoom' : roi}))
+        self.commands.request(SET_CAMERA_SETTINGS, {'zoom' : roi})
 
     def resetROI(self):
         self.keepRatioCheckBox.setChecked(False)
@@ -311,9 +346,9 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
         doResize = self.resizeCheckBox.isChecked()
         if doResize:
             resize = (int(self.resizewBox.value()),int(self.resizehBox.value()))
-            self.sock.sendObject((SET_CAMERA_SETTINGS, {'doResize':doResize, 'resize' : resize}))
+            self.commands.request(SET_CAMERA_SETTINGS, {'doResize':doResize, 'resize' : resize})
         else :
-            self.sock.sendObject((SET_CAMERA_SETTINGS, {'doResize':doResize}))
+            self.commands.request(SET_CAMERA_SETTINGS, {'doResize':doResize})
         
 #Capture
 #CAPTURE_BASIC play with ot without motor
@@ -334,11 +369,15 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
             frameRate = self.playFramerateBox.value()
         if method != CAPTURE_BASIC :
             self.motorControlGroupBox.setEnabled(False)
-            self.sock.sendObject((SET_MOTOR_SETTINGS, {'speed':self.captureMotorSpeedBox.value()}))
+            self.commands.request(SET_MOTOR_SETTINGS, {'speed':self.captureMotorSpeedBox.value()})
 
         self.setMerge()
         self.setSave()
+        self.setVideo()
+        self.imageThread.bracketSteps = brackets
+        self.imageThread.setWriter(self.writersBox.value(), syncEvery=self.syncEveryBox.value())
         self.imageThread.reduceFactor = self.reduceFactorBox.value()
+        self.imageThread.previewFps = self.previewFpsBox.value()
         self.captureStopButton.setEnabled(True)
         self.captureStartButton.setEnabled(False)
         self.capturePauseButton.setEnabled(True)
@@ -348,12 +387,16 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
         self.initGroupBox.setEnabled(False)
         self.lensAnalyseButton.setEnabled(False)
         self.calibrateLocalButton.setEnabled(False)
+        self.calibrateHdrButton.setEnabled(False)
 
         self.setResize()
         
-        self.sock.sendObject((SET_CAMERA_SETTINGS, {\
+        self.commands.request(SET_CAMERA_SETTINGS, {\
                                                     'framerate':frameRate,\
                                                     'bracket_steps':brackets, \
+                                                    'adaptive_bracket':self.adaptiveCheckBox.isChecked(), \
+                                                    'predictive_exposure':self.predictiveCheckBox.isChecked(), \
+                                                    'record_mjpeg':self.mjpegCheckBox.isChecked(), \
                                                     'bracket_dark_coefficient':self.darkCoefficientBox.value(),\
                                                     'bracket_light_coefficient':self.lightCoefficientBox.value(),\
                                                     'shutter_speed_wait':self.shutterSpeedWaitBox.value(),\
@@ -362,9 +405,10 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
                                                     'use_video_port' : True,\
                                                     'capture_method' : method,\
                                                     'pause_pin':int(self.pauseEdit.text()),\
-                                                    'pause_level': 1 if self.pauseLevelCheckBox.isChecked() else 0
-        }))
-        self.sock.sendObject((START_CAPTURE,))
+                                                    'pause_level': 1 if self.pauseLevelCheckBox.isChecked() else 0,\
+                                                    'spool_enabled' : self.spoolCheckBox.isChecked()
+        })
+        self.commands.request(START_CAPTURE)
 
     def setMerge(self) :
         merge = None
@@ -372,6 +416,8 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
             merge = MERGE_NONE
         elif self.mergeMertensRadioButton.isChecked() :
             merge = MERGE_MERTENS
+        elif self.mergeFastRadioButton.isChecked() :
+            merge = MERGE_FAST
         else :
             merge = MERGE_DEBEVEC
         self.imageThread.merge = merge
@@ -389,13 +435,14 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
         self.autoPauseCheckBox.setEnabled(False)
         self.lensAnalyseButton.setEnabled(True)
         self.calibrateLocalButton.setEnabled(True)
+        self.calibrateHdrButton.setEnabled(True)
 
         self.initGroupBox.setEnabled(True)
-        self.sock.sendObject((STOP_CAPTURE,))
+        self.commands.request(STOP_CAPTURE)
         
 #Pausing capture        
     def capturePause(self) :
-        self.sock.sendObject((PAUSE_CAPTURE,))
+        self.commands.request(PAUSE_CAPTURE)
         if self.paused :
             self.capturePauseButton.setText('Pause')
             self.captureStopButton.setEnabled(True)
@@ -406,19 +453,20 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
 
 
     def setAutoPause(self):
-        self.sock.sendObject((SET_CAMERA_SETTINGS, {'auto_pause': self.autoPauseCheckBox.isChecked()}))
+        self.commands.request(SET_CAMERA_SETTINGS, {'auto_pause': self.autoPauseCheckBox.isChecked()})
 
 #Take one image
     def takeImage(self):
         self.imageThread.reduceFactor = self.reduceFactorBox.value()
         self.setResize()
-        self.sock.sendObject((SET_CAMERA_SETTINGS, {'use_video_port' : True}))
-        self.sock.sendObject((TAKE_IMAGE,))
+        self.commands.request(SET_CAMERA_SETTINGS, {'use_video_port' : True})
+        self.commands.request(TAKE_IMAGE)
 
-#Get all camera settings
+#Get all camera settings, displayed when the Pi replies
     def getCameraSettings(self) :
-        self.sock.sendObject((GET_CAMERA_SETTINGS,))
-        settings = self.sock.receiveObject()
+        self.commands.request(GET_CAMERA_SETTINGS, callback=self.showCameraSettings)
+
+    def showCameraSettings(self, settings) :
         self.redGainBox.setValue(int(float(settings['awb_gains'][0])*100.))
         self.blueGainBox.setValue(int(float(settings['awb_gains'][1])*100.))
         self.awbModeBox.setCurrentIndex(self.awbModeBox.findText(settings['awb_mode']))
@@ -426,8 +474,7 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
         self.shutterSpeedBox.setValue(shutterSpeed)
         self.autoExposureCheckBox.setChecked(shutterSpeed == 0)
         self.framerateBox.setValue(int(settings['framerate']))
-        exposureSpeed = self.getCameraSetting('exposure_speed')
-        self.exposureSpeedLabel.setText(str(exposureSpeed))
+        self.exposureSpeedLabel.setText(str(settings['exposure_speed']))
         self.analogGainLabel.setText(str(float(settings['analog_gain'])))
         self.digitalGainLabel.setText(str(float(settings['digital_gain'])))
         self.exposureModeBox.setCurrentIndex(self.exposureModeBox.findText(settings['exposure_mode']))
@@ -437,6 +484,9 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
         self.isoBox.setValue(settings['iso'])
         self.exposureCompensationBox.setValue(settings['exposure_compensation'])
         self.bracketCheckBox.setChecked(settings['bracket_steps'] != 1)
+        self.adaptiveCheckBox.setChecked(settings['adaptive_bracket'])
+        self.predictiveCheckBox.setChecked(settings['predictive_exposure'])
+        self.mjpegCheckBox.setChecked(settings['record_mjpeg'])
         self.lightCoefficientBox.setValue(settings['bracket_light_coefficient'])
         self.darkCoefficientBox.setValue(settings['bracket_dark_coefficient'])
 #        self.videoPortButton.setChecked(settings['use_video_port'])
@@ -446,6 +496,7 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
         self.pauseEdit.setText(str(settings['pause_pin']))
         self.pauseLevelCheckBox.setChecked(settings['pause_level'] == 1)
         self.autoPauseCheckBox.setChecked(settings['auto_pause'])
+        self.spoolCheckBox.setChecked(settings['spool_enabled'])
         roi = settings['zoom']
         if roi == None :
             roi = (0.,0.,1.,1.)
@@ -464,13 +515,8 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
         self.resizeCheckBox.setChecked(settings['doResize'])
         return settings
 
-#Get one camera setting
-    def getCameraSetting(self, key):
-        self.sock.sendObject((GET_CAMERA_SETTING, key))
-        return self.sock.receiveObject()
-        
     def saveSettings(self):
-        self.sock.sendObject((SAVE_SETTINGS,))
+        self.commands.request(SAVE_SETTINGS)
 
     def setColors(self) :
         blue = self.blueGainBox.value()
@@ -478,18 +524,18 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
         gains = (red/100., blue/100.)
         mode = str(self.awbModeBox.currentText())
         settings = {'awb_gains': gains, 'awb_mode':mode}
-        self.sock.sendObject((SET_CAMERA_SETTINGS, settings))
+        self.commands.request(SET_CAMERA_SETTINGS, settings)
     
     def setShutterSpeed(self):
         print("Shuuter")
-        self.sock.sendObject((SET_CAMERA_SETTINGS, {'shutter_speed':self.shutterSpeedBox.value(), 'exposure_compensation':self.exposureCompensationBox.value()}))
+        self.commands.request(SET_CAMERA_SETTINGS, {'shutter_speed':self.shutterSpeedBox.value(), 'exposure_compensation':self.exposureCompensationBox.value()})
                  
 
     def setIso(self):
-         self.sock.sendObject((SET_CAMERA_SETTINGS, {'iso':self.isoBox.value()}))
+         self.commands.request(SET_CAMERA_SETTINGS, {'iso':self.isoBox.value()})
 
     def setFrameRate(self):
-         self.sock.sendObject((SET_CAMERA_SETTINGS, {'framerate':self.framerateBox.value()}))
+         self.commands.request(SET_CAMERA_SETTINGS, {'framerate':self.framerateBox.value()})
         
     def setSharpness(self) :
         self.imageThread.sharpness = self.sharpnessCheckBox.isChecked()
@@ -499,39 +545,51 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
 
     def setReduce(self) :
         self.imageThread.reduceFactor = self.reduceFactorBox.value()
+
+    def setPreviewFps(self) :
+        self.imageThread.previewFps = self.previewFpsBox.value()
         
         
     def setAutoExposure(self):
         if self.autoExposureCheckBox.isChecked() :
-            self.sock.sendObject((SET_CAMERA_SETTINGS, {'shutter_speed':0}))
+            self.commands.request(SET_CAMERA_SETTINGS, {'shutter_speed':0})
             self.shutterSpeedBox.setValue(0)
         else :
-            exposureSpeed = self.getCameraSetting('exposure_speed')
-            self.exposureSpeedLabel.setText(str(exposureSpeed))  # ms display
-            self.sock.sendObject((SET_CAMERA_SETTINGS, {'shutter_speed':exposureSpeed}))
-            self.shutterSpeedBox.setValue(exposureSpeed)
+            self.commands.request(GET_CAMERA_SETTING, 'exposure_speed', callback=self.fixExposure)
+
+#Manual exposure from the current auto exposure
+    def fixExposure(self, exposureSpeed):
+        self.exposureSpeedLabel.setText(str(exposureSpeed))  # ms display
+        self.commands.request(SET_CAMERA_SETTINGS, {'shutter_speed':exposureSpeed})
+        self.shutterSpeedBox.setValue(exposureSpeed)
             
     def setAutoGetSettings(self):
         if self.autoGetSettingsCheckBox.isChecked() :
             self.timer = QTimer()
-            self.timer.timeout.connect(self.getSettings)
+            self.timer.timeout.connect(self.getCameraSettings)
             self.timer.start(5000)
         else :
             self.timer.stop()
             
     def setCorrections(self):
-        self.sock.sendObject((SET_CAMERA_SETTINGS, {'brightness':self.brightnessBox.value(), 'contrast':self.contrastBox.value(),'saturation':self.saturationBox.value()}))
+        self.commands.request(SET_CAMERA_SETTINGS, {'brightness':self.brightnessBox.value(), 'contrast':self.contrastBox.value(),'saturation':self.saturationBox.value()})
 
     def setGains(self):
         mode = str(self.exposureModeBox.currentText())
         settings = {'exposure_mode':mode,}
-        self.sock.sendObject((SET_CAMERA_SETTINGS, settings))
+        self.commands.request(SET_CAMERA_SETTINGS, settings)
 
     def lensAnalyse(self):
-        self.sock.sendObject((TAKE_BGR,HEADER_ANALYZE, 1) )
+        self.commands.request(TAKE_BGR,HEADER_ANALYZE, 1)
 
     def setSave(self) :
-        self.imageThread.saveToFile(self.saveCheckBox.isChecked(), self.directory)
+        self.imageThread.saveToFile(self.saveCheckBox.isChecked(), self.directory, self.archiveCheckBox.isChecked())
+
+#Video of the capture in the directory, closed at the end of the capture
+    def setVideo(self) :
+        preset = VIDEO_PRESETS[self.videoBox.currentIndex()]
+        if preset != None and self.saveCheckBox.isChecked() :
+            self.imageThread.startVideo(os.path.join(self.directory, time.strftime('video_%Y%m%d_%H%M%S')), preset)
 
     def setDirectory(self) :
         self.directory = self.root_directory  + "/%#02d_%#02d" % (self.tapeBox.value(), self.clipBox.value())
@@ -554,11 +612,18 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
         elif typ == HEADER_MESSAGE :
             self.messageLabel.setText(str(header['msg']))
 
+    def displayError(self, error) :
+        QApplication.restoreOverrideCursor()
+        self.messageLabel.setText('Error: ' + error)
+        if not self.closeCameraButton.isEnabled() :     #The camera did not open
+            self.openCameraButton.setEnabled(self.connected)
+
     def displayImage(self, image) :
         if self.imageDialog == None :
             self.imageDialog = ImageDialog(self)
         self.imageDialog.show()
         self.imageDialog.displayImage(image)
+        self.imageThread.previewDone()
             
     def connectDisconnect(self) :
         if self.connected :
@@ -574,14 +639,18 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
 
     
     def connect(self) :
-        socke = socket.socket()
         self.ip_pi = self.ipLineEdit.text()
-        socke.connect((self.ip_pi, 8000))
-        self.sock = MessageSocket(socke)
-        self.imageThread = ImageThread(self.ip_pi)
+        connection = AsyncConnection(self.ip_pi, 8000)
+        self.sock = connection.blockingChannel(CHANNEL_COMMAND, CHANNEL_REPLY)
+        self.commands = CommandClient(self.sock)
+        self.commands.errorSignal.connect(self.displayError)
+        self.imageThread = ImageThread(connection)
         self.imageThread.headerSignal.connect(self.displayHeader)
         self.imageThread.imageSignal.connect(self.displayImage)
         self.imageThread.start()
+        self.telemetryThread = TelemetryThread(connection.blockingChannel(CHANNEL_TELEMETRY), self.imageThread)
+        self.telemetryThread.telemetrySignal.connect(self.telemetryLabel.setText)
+        self.telemetryThread.start()
         self.getMotorSettings()
         self.cameraGroupBox.setEnabled(True)
         self.openCameraButton.setEnabled(True)
@@ -596,7 +665,7 @@ class TelecineDialog(QDialog, Ui_TelecineDialog):
 
     def disconnect(self) :
         if self.connected :
-            self.sock.sendObject((TERMINATE,))
+            self.commands.request(TERMINATE)
             self.sock.shutdown()
             self.sock.close()
             self.cameraGroupBox.setEnabled(False)
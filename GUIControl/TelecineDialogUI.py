@@ -11,7 +11,7 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 class Ui_TelecineDialog(object):
     def setupUi(self, TelecineDialog):
         TelecineDialog.setObjectName("TelecineDialog")
-        TelecineDialog.resize(671, 1019)
+        TelecineDialog.resize(671, 1055)
         self.cameraControlGroupBox = QtWidgets.QGroupBox(TelecineDialog)
         self.cameraControlGroupBox.setGeometry(QtCore.QRect(20, 250, 631, 261))
         self.cameraControlGroupBox.setStyleSheet("QGroupBox#cameraControlGroupBox { \n"
@@ -85,6 +85,9 @@ class Ui_TelecineDialog(object):
         self.autoPauseCheckBox = QtWidgets.QCheckBox(self.groupBox_5)
         self.autoPauseCheckBox.setGeometry(QtCore.QRect(510, 50, 81, 17))
         self.autoPauseCheckBox.setObjectName("autoPauseCheckBox")
+        self.spoolCheckBox = QtWidgets.QCheckBox(self.groupBox_5)
+        self.spoolCheckBox.setGeometry(QtCore.QRect(510, 20, 81, 17))
+        self.spoolCheckBox.setObjectName("spoolCheckBox")
         self.label_24 = QtWidgets.QLabel(self.groupBox_5)
         self.label_24.setGeometry(QtCore.QRect(340, 50, 61, 16))
         self.label_24.setObjectName("label_24")
@@ -100,6 +103,15 @@ class Ui_TelecineDialog(object):
         self.bracketCheckBox = QtWidgets.QCheckBox(self.groupBox_5)
         self.bracketCheckBox.setGeometry(QtCore.QRect(10, 80, 70, 17))
         self.bracketCheckBox.setObjectName("bracketCheckBox")
+        self.adaptiveCheckBox = QtWidgets.QCheckBox(self.groupBox_5)
+        self.adaptiveCheckBox.setGeometry(QtCore.QRect(210, 20, 111, 17))
+        self.adaptiveCheckBox.setObjectName("adaptiveCheckBox")
+        self.predictiveCheckBox = QtWidgets.QCheckBox(self.groupBox_5)
+        self.predictiveCheckBox.setGeometry(QtCore.QRect(330, 20, 91, 17))
+        self.predictiveCheckBox.setObjectName("predictiveCheckBox")
+        self.mjpegCheckBox = QtWidgets.QCheckBox(self.groupBox_5)
+        self.mjpegCheckBox.setGeometry(QtCore.QRect(430, 20, 71, 17))
+        self.mjpegCheckBox.setObjectName("mjpegCheckBox")
         self.label_12 = QtWidgets.QLabel(self.groupBox_5)
         self.label_12.setGeometry(QtCore.QRect(90, 80, 47, 13))
         self.label_12.setObjectName("label_12")
@@ -362,6 +374,17 @@ class Ui_TelecineDialog(object):
         self.saveCheckBox = QtWidgets.QCheckBox(self.frameProcessingGroupBox)
         self.saveCheckBox.setGeometry(QtCore.QRect(10, 80, 61, 20))
         self.saveCheckBox.setObjectName("saveCheckBox")
+        self.archiveCheckBox = QtWidgets.QCheckBox(self.frameProcessingGroupBox)
+        self.archiveCheckBox.setGeometry(QtCore.QRect(62, 80, 58, 20))
+        self.archiveCheckBox.setObjectName("archiveCheckBox")
+        self.videoBox = QtWidgets.QComboBox(self.frameProcessingGroupBox)
+        self.videoBox.setGeometry(QtCore.QRect(255, 78, 66, 22))
+        self.videoBox.setObjectName("videoBox")
+        self.videoBox.addItem("")
+        self.videoBox.addItem("")
+        self.videoBox.addItem("")
+        self.videoBox.addItem("")
+        self.videoBox.addItem("")
         self.chooseDirectoryButton = QtWidgets.QPushButton(self.frameProcessingGroupBox)
         self.chooseDirectoryButton.setGeometry(QtCore.QRect(10, 20, 61, 23))
         self.chooseDirectoryButton.setObjectName("chooseDirectoryButton")
@@ -391,6 +414,17 @@ class Ui_TelecineDialog(object):
         self.setDirectoryButton = QtWidgets.QPushButton(self.frameProcessingGroupBox)
         self.setDirectoryButton.setGeometry(QtCore.QRect(260, 20, 61, 23))
         self.setDirectoryButton.setObjectName("setDirectoryButton")
+        self.writersBox = QtWidgets.QSpinBox(self.frameProcessingGroupBox)
+        self.writersBox.setGeometry(QtCore.QRect(325, 20, 42, 22))
+        self.writersBox.setMinimum(1)
+        self.writersBox.setMaximum(16)
+        self.writersBox.setProperty("value", 2)
+        self.writersBox.setObjectName("writersBox")
+        self.syncEveryBox = QtWidgets.QSpinBox(self.frameProcessingGroupBox)
+        self.syncEveryBox.setGeometry(QtCore.QRect(325, 50, 42, 22))
+        self.syncEveryBox.setMaximum(99)
+        self.syncEveryBox.setProperty("value", 0)
+        self.syncEveryBox.setObjectName("syncEveryBox")
         self.calibrateLocalCheckBox = QtWidgets.QCheckBox(self.frameProcessingGroupBox)
         self.calibrateLocalCheckBox.setGeometry(QtCore.QRect(120, 80, 131, 20))
         self.calibrateLocalCheckBox.setObjectName("calibrateLocalCheckBox")
@@ -398,15 +432,18 @@ class Ui_TelecineDialog(object):
         self.groupBox_14.setGeometry(QtCore.QRect(370, 10, 101, 91))
         self.groupBox_14.setObjectName("groupBox_14")
         self.mergeNoneRadioButton = QtWidgets.QRadioButton(self.groupBox_14)
-        self.mergeNoneRadioButton.setGeometry(QtCore.QRect(20, 20, 61, 17))
+        self.mergeNoneRadioButton.setGeometry(QtCore.QRect(20, 16, 61, 17))
         self.mergeNoneRadioButton.setChecked(True)
         self.mergeNoneRadioButton.setObjectName("mergeNoneRadioButton")
         self.mergeMertensRadioButton = QtWidgets.QRadioButton(self.groupBox_14)
-        self.mergeMertensRadioButton.setGeometry(QtCore.QRect(20, 40, 61, 17))
+        self.mergeMertensRadioButton.setGeometry(QtCore.QRect(20, 34, 61, 17))
         self.mergeMertensRadioButton.setObjectName("mergeMertensRadioButton")
         self.mergeDebevecRadioButton = QtWidgets.QRadioButton(self.groupBox_14)
-        self.mergeDebevecRadioButton.setGeometry(QtCore.QRect(20, 60, 71, 17))
+        self.mergeDebevecRadioButton.setGeometry(QtCore.QRect(20, 52, 71, 17))
         self.mergeDebevecRadioButton.setObjectName("mergeDebevecRadioButton")
+        self.mergeFastRadioButton = QtWidgets.QRadioButton(self.groupBox_14)
+        self.mergeFastRadioButton.setGeometry(QtCore.QRect(20, 70, 71, 17))
+        self.mergeFastRadioButton.setObjectName("mergeFastRadioButton")
         self.groupBox_12 = QtWidgets.QGroupBox(self.frameProcessingGroupBox)
         self.groupBox_12.setGeometry(QtCore.QRect(480, 10, 141, 91))
         self.groupBox_12.setObjectName("groupBox_12")
@@ -416,6 +453,15 @@ class Ui_TelecineDialog(object):
         self.sharpnessCheckBox = QtWidgets.QCheckBox(self.groupBox_12)
         self.sharpnessCheckBox.setGeometry(QtCore.QRect(10, 40, 121, 20))
         self.sharpnessCheckBox.setObjectName("sharpnessCheckBox")
+        self.previewFpsBox = QtWidgets.QSpinBox(self.groupBox_12)
+        self.previewFpsBox.setGeometry(QtCore.QRect(72, 20, 37, 20))
+        self.previewFpsBox.setMinimum(1)
+        self.previewFpsBox.setMaximum(60)
+        self.previewFpsBox.setProperty("value", 10)
+        self.previewFpsBox.setObjectName("previewFpsBox")
+        self.previewFpsLabel = QtWidgets.QLabel(self.groupBox_12)
+        self.previewFpsLabel.setGeometry(QtCore.QRect(112, 22, 25, 16))
+        self.previewFpsLabel.setObjectName("previewFpsLabel")
         self.reduceFactorBox = QtWidgets.QSpinBox(self.groupBox_12)
         self.reduceFactorBox.setGeometry(QtCore.QRect(10, 60, 37, 20))
         self.reduceFactorBox.setMinimum(1)
@@ -432,6 +478,12 @@ class Ui_TelecineDialog(object):
         self.messageLabel.setFrameShape(QtWidgets.QFrame.Box)
         self.messageLabel.setText("")
         self.messageLabel.setObjectName("messageLabel")
+        self.telemetryLabel = QtWidgets.QLabel(TelecineDialog)
+        self.telemetryLabel.setGeometry(QtCore.QRect(20, 1010, 631, 31))
+        self.telemetryLabel.setFrameShape(QtWidgets.QFrame.Box)
+        self.telemetryLabel.setText("")
+        self.telemetryLabel.setWordWrap(True)
+        self.telemetryLabel.setObjectName("telemetryLabel")
         self.motorSettingsGroupBox = QtWidgets.QGroupBox(TelecineDialog)
         self.motorSettingsGroupBox.setGeometry(QtCore.QRect(20, 640, 631, 81))
         self.motorSettingsGroupBox.setStyleSheet("QGroupBox#motorSettingsGroupBox { \n"
@@ -512,6 +564,9 @@ class Ui_TelecineDialog(object):
         self.calibrateLocalButton = QtWidgets.QPushButton(self.lensAnalyseGroupBox)
         self.calibrateLocalButton.setGeometry(QtCore.QRect(180, 20, 91, 23))
         self.calibrateLocalButton.setObjectName("calibrateLocalButton")
+        self.calibrateHdrButton = QtWidgets.QPushButton(self.lensAnalyseGroupBox)
+        self.calibrateHdrButton.setGeometry(QtCore.QRect(280, 20, 91, 23))
+        self.calibrateHdrButton.setObjectName("calibrateHdrButton")
         self.cameraSettingsGroupBox = QtWidgets.QGroupBox(TelecineDialog)
         self.cameraSettingsGroupBox.setGeometry(QtCore.QRect(20, 730, 631, 171))
         self.cameraSettingsGroupBox.setStyleSheet("QGroupBox#cameraSettingsGroupBox { \n"
@@ -695,6 +750,7 @@ class Ui_TelecineDialog(object):
         self.motorStopButton.clicked.connect(TelecineDialog.motorStop)
         self.setCorrectionsButton.clicked['bool'].connect(TelecineDialog.setCorrections)
         self.saveCheckBox.stateChanged['int'].connect(TelecineDialog.setSave)
+        self.archiveCheckBox.stateChanged['int'].connect(TelecineDialog.setSave)
         self.setIsoButton.clicked.connect(TelecineDialog.setIso)
         self.getCameraSettingsButton.clicked.connect(TelecineDialog.getCameraSettings)
         self.chooseDirectoryButton.clicked.connect(TelecineDialog.chooseDirectory)
@@ -708,6 +764,7 @@ class Ui_TelecineDialog(object):
         self.setDirectoryButton.clicked.connect(TelecineDialog.setDirectory)
         self.closeCameraButton.clicked.connect(TelecineDialog.closeCamera)
         self.reduceFactorBox.valueChanged['int'].connect(TelecineDialog.setReduce)
+        self.previewFpsBox.valueChanged['int'].connect(TelecineDialog.setPreviewFps)
         self.calibrateButton.clicked.connect(TelecineDialog.calibrate)
         self.motorOnButton.clicked.connect(TelecineDialog.motorOn)
         self.motorOffButton.clicked.connect(TelecineDialog.motorOff)
@@ -716,6 +773,7 @@ class Ui_TelecineDialog(object):
         self.mergeDebevecRadioButton.toggled['bool'].connect(TelecineDialog.setMerge)
         self.mergeNoneRadioButton.toggled['bool'].connect(TelecineDialog.setMerge)
         self.mergeMertensRadioButton.toggled['bool'].connect(TelecineDialog.setMerge)
+        self.mergeFastRadioButton.toggled['bool'].connect(TelecineDialog.setMerge)
         self.setGainsButton.clicked.connect(TelecineDialog.setGains)
         self.setColorsButton.clicked.connect(TelecineDialog.setColors)
         self.motorOnTriggerButton.clicked.connect(TelecineDialog.motorOnTrigger)
@@ -725,6 +783,7 @@ class Ui_TelecineDialog(object):
         self.setROIButton.clicked.connect(TelecineDialog.setROI)
         self.resetROIButton.clicked.connect(TelecineDialog.resetROI)
         self.calibrateLocalButton.clicked.connect(TelecineDialog.calibrateLocal)
+        self.calibrateHdrButton.clicked.connect(TelecineDialog.calibrateHDR)
         self.calibrateLocalCheckBox.stateChanged['int'].connect(TelecineDialog.doCalibrateLocal)
         QtCore.QMetaObject.connectSlotsByName(TelecineDialog)
 
@@ -745,9 +804,18 @@ class Ui_TelecineDialog(object):
         self.label_33.setText(_translate("TelecineDialog", "PIN"))
         self.pauseLevelCheckBox.setText(_translate("TelecineDialog", "High"))
         self.autoPauseCheckBox.setText(_translate("TelecineDialog", "Auto pause"))
+        self.spoolCheckBox.setToolTip(_translate("TelecineDialog", "Spool frames on the Pi disk when the network is behind"))
+        self.telemetryLabel.setToolTip(_translate("TelecineDialog", "Stage latencies p50/p99 in ms, updated every second while capturing"))
+        self.spoolCheckBox.setText(_translate("TelecineDialog", "Spool"))
         self.label_24.setText(_translate("TelecineDialog", "Wait before"))
         self.label_34.setText(_translate("TelecineDialog", "frames"))
         self.bracketCheckBox.setText(_translate("TelecineDialog", "Bracket "))
+        self.adaptiveCheckBox.setToolTip(_translate("TelecineDialog", "Take the light and dark shots of a bracket only when the auto exposure clips the shadows or the highlights"))
+        self.adaptiveCheckBox.setText(_translate("TelecineDialog", "Adaptive bracket"))
+        self.predictiveCheckBox.setToolTip(_translate("TelecineDialog", "Compute the exposure of the next frame from the previous one instead of waiting for the auto exposure, the waits can be 0 or 1"))
+        self.predictiveCheckBox.setText(_translate("TelecineDialog", "Predictive AE"))
+        self.mjpegCheckBox.setToolTip(_translate("TelecineDialog", "Continuous MJPEG recording on the video port, the Pi splits the stream into frames (capture basic and on trigger, without bracket)"))
+        self.mjpegCheckBox.setText(_translate("TelecineDialog", "MJPEG"))
         self.label_12.setText(_translate("TelecineDialog", "Dark"))
         self.label_21.setText(_translate("TelecineDialog", "Light"))
         self.label_23.setText(_translate("TelecineDialog", "Wait between"))
@@ -795,6 +863,14 @@ class Ui_TelecineDialog(object):
         self.motorOffButton.setText(_translate("TelecineDialog", "Off"))
         self.frameProcessingGroupBox.setTitle(_translate("TelecineDialog", "Frame processing"))
         self.saveCheckBox.setText(_translate("TelecineDialog", "Save"))
+        self.archiveCheckBox.setToolTip(_translate("TelecineDialog", "Save the shots in a capture archive (capture.idx and segment files) instead of one file per shot"))
+        self.archiveCheckBox.setText(_translate("TelecineDialog", "Archive"))
+        self.videoBox.setToolTip(_translate("TelecineDialog", "Encode a video with ffmpeg while capturing (saved in the directory)"))
+        self.videoBox.setItemText(0, _translate("TelecineDialog", "No video"))
+        self.videoBox.setItemText(1, _translate("TelecineDialog", "FFV1"))
+        self.videoBox.setItemText(2, _translate("TelecineDialog", "ProRes"))
+        self.videoBox.setItemText(3, _translate("TelecineDialog", "H.264"))
+        self.videoBox.setItemText(4, _translate("TelecineDialog", "MJPEG"))
         self.chooseDirectoryButton.setText(_translate("TelecineDialog", "Directory"))
         self.label_27.setText(_translate("TelecineDialog", "Tape"))
         self.label_28.setText(_translate("TelecineDialog", "Clip"))
@@ -804,10 +880,18 @@ class Ui_TelecineDialog(object):
         self.mergeNoneRadioButton.setText(_translate("TelecineDialog", "None"))
         self.mergeMertensRadioButton.setText(_translate("TelecineDialog", "Mertens"))
         self.mergeDebevecRadioButton.setText(_translate("TelecineDialog", "Debevec"))
+        self.mergeFastRadioButton.setToolTip(_translate("TelecineDialog", "Mertens fusion with the weights at a reduced resolution, faster"))
+        self.mergeFastRadioButton.setText(_translate("TelecineDialog", "Fast"))
         self.groupBox_12.setTitle(_translate("TelecineDialog", "Display"))
         self.histosCheckBox.setText(_translate("TelecineDialog", "Histos"))
         self.sharpnessCheckBox.setText(_translate("TelecineDialog", "Sharpness"))
         self.label_32.setText(_translate("TelecineDialog", "Reduce "))
+        self.previewFpsBox.setToolTip(_translate("TelecineDialog", "Maximum preview frames per second, the other frames are only saved"))
+        self.previewFpsLabel.setText(_translate("TelecineDialog", "fps"))
+        self.writersBox.setToolTip(_translate("TelecineDialog", "Writer threads saving the frames"))
+        self.writersBox.setPrefix(_translate("TelecineDialog", "W"))
+        self.syncEveryBox.setToolTip(_translate("TelecineDialog", "Frames written between two flushes to the disk (fsync), 0 no flush"))
+        self.syncEveryBox.setPrefix(_translate("TelecineDialog", "S"))
         self.motorSettingsGroupBox.setTitle(_translate("TelecineDialog", "Motor settings"))
         self.label_18.setText(_translate("TelecineDialog", "Steps per Rev"))
         self.label_20.setText(_translate("TelecineDialog", "Frame/Motor ratio"))
@@ -824,6 +908,7 @@ class Ui_TelecineDialog(object):
         self.lensAnalyseButton.setText(_translate("TelecineDialog", "Analyse"))
         self.calibrateButton.setText(_translate("TelecineDialog", "Calibrate"))
         self.calibrateLocalButton.setText(_translate("TelecineDialog", "Calibrate Local"))
+        self.calibrateHdrButton.setText(_translate("TelecineDialog", "Calibrate HDR"))
         self.cameraSettingsGroupBox.setTitle(_translate("TelecineDialog", "Camera settings"))
         self.label.setText(_translate("TelecineDialog", "Color"))
         self.awbModeBox.setItemText(4, _translate("TelecineDialog", "shade"))
@@ -0,0 +1,40 @@
+import os
+import sys
+import json
+import time
+from PyQt5.QtCore import QThread, pyqtSignal
+sys.path.append('../Common')
+from Telemetry import *
+
+#Receive the telemetry sent every second by the Pi while capturing
+#Merged with the latencies measured by the ImageThread, displayed in the GUI
+#and appended to telemetry.jsonl in the capture directory when saving
+
+class TelemetryThread (QThread):
+    telemetrySignal = pyqtSignal([str,])   #Signal to the GUI display latencies
+
+    def __init__(self, telemetrySock, imageThread):
+        QThread.__init__(self)
+        self.telemetrySock = telemetrySock
+        self.imageThread = imageThread
+
+    def run(self):
+        while True:
+            buf = self.telemetrySock.receiveMsg()
+            if buf == None :
+                break
+            pi = decodeTelemetry(buf)
+            self.telemetrySock.release(buf)
+            pc = self.imageThread.telemetry.snapshot()
+            snapshot = dict(pi)
+            snapshot.update(pc)   #The PC sees the Pi stages of every frame received
+            self.telemetrySignal.emit(formatTelemetry(snapshot))
+            if self.imageThread.saveOn :
+                self.save({'time':time.time(), 'pi':pi, 'pc':pc})
+
+    def save(self, record):
+        try :
+            with open(os.path.join(self.imageThread.directory, 'telemetry.jsonl'), 'a') as file :
+                file.write(json.dumps(record) + '\n')
+        except OSError as e :
+            print(e)
@@ -0,0 +1,16 @@
+import os
+
+## Hardware backends
+## YART_BACKEND=sim selects a simulated camera and a simulated pigpio
+## so that the whole capture pipeline runs on a plain Linux box (benchmarks)
+## Otherwise the real picamera and pigpio libraries are used
+
+SIMULATED = os.environ.get('YART_BACKEND') == 'sim'
+
+if SIMULATED :
+    import FakeCamera as picamera
+    import FakePigpio as pigpio
+else :
+    import picamera
+    import picamera.array
+    import pigpio
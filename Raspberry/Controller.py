@@ -1,38 +1,56 @@
+import os
 import socket
 from struct import *
-import copy
 import time
 import sys
 from threading import Thread, Event
 from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from fractions import Fraction 
 
 import numpy as np
-from picamera import PiCamera
-from picamera import array
-
-import pigpio
+from Backend import picamera, pigpio
+PiCamera = picamera.PiCamera
 
 from recalibrate import *
+from ExposureAnalysis import ExposureAnalysis
+from ExposureController import ExposureController, EXPOSURE_DELAY, MAX_EXTRA_FRAMES
+from MjpegOutput import MjpegOutput
 
 sys.path.append('../Common')
 from Constants import *
 from MessageSocket import *
+from MultiplexSocket import *
+from FlowControl import *
+from FrameRing import *
+from Spool import *
+from Telemetry import *
 from TelecineMotor import *
 
 ## Todo More object oriented and avoid globals !
 
 initSettings = ("sensor_mode",)
 controlSettings = ("awb_mode","awb_gains","shutter_speed","brightness","contrast","saturation", "framerate","exposure_mode","iso", "exposure_compensation", "zoom")
-addedSettings = ("bracket_steps","use_video_port", "bracket_dark_coefficient", "bracket_light_coefficient","capture_method", "shutter_speed_wait", "shutter_auto_wait","pause_pin","pause_level","auto_pause","resize","doResize")
+addedSettings = ("bracket_steps","use_video_port", "bracket_dark_coefficient", "bracket_light_coefficient","capture_method", "shutter_speed_wait", "shutter_auto_wait","pause_pin","pause_level","auto_pause","resize","doResize","spool_enabled","spool_directory","adaptive_bracket","predictive_exposure","exposure_delay","record_mjpeg")
 motorSettings = ("speed","pulley_ratio","steps_per_rev","ena_pin","dir_pin","pulse_pin","trigger_pin","capture_speed","play_speed","ena_level","dir_level","pulse_level","trigger_level")
-readOnlySettings = ("analog_gain", "digital_gain")
+readOnlySettings = ("analog_gain", "digital_gain", "exposure_speed", "resolution", "MAX_RESOLUTION")
 commandSock = None
 imageSock = None
+creditSock = None
+telemetrySock = None
 listenSock = None
 camera = None
 queue = None
+flow = None
+ring = None
+spool = None
+telemetry = None
+telemetryStop = None
+CAPTURE_MARGIN = 1.2  #Motor period / capture time of a frame (p99)
+RING_BUDGET = 128*1024*1024  #Bytes of jpeg waiting to be sent
+RECORDING_PERIOD = 0.05  #Seconds between two flow controls of a recording
+PORT = int(os.environ.get('YART_PORT', 8000))
 captureEvent = None
 restartEvent = None
 motor = None
@@ -41,6 +59,7 @@ triggerEvent= None
 exitFlag = False
 
 sendImageThread = None
+worker = None
 captureImageThread = None
 
 def getSetting(object, key):
@@ -54,10 +73,7 @@ def getSetting(object, key):
 def getSettings(object, keys):
     settings = {}
     for k in keys :
-        value = getattr(object, k)
-        if k == 'framerate' :
-           value = Fraction(value[0],value[1])
-        settings[k] = value
+        settings[k] = getSetting(object, k)
     return settings
 
 def setSettings(object, settings) :
@@ -77,6 +93,14 @@ class TelecineCamera(PiCamera) :
         self.pause_pin=25
         self.pause_level=1
         self.auto_pause = False
+        self.spool_enabled = False
+        self.spool_directory = 'spool'
+        self.adaptive_bracket = False
+        self.predictive_exposure = False
+        self.exposure_delay = EXPOSURE_DELAY
+        self.record_mjpeg = False
+        self.analysis = None
+        self.exposure = None
         self.capturing = False
         self.pausing = False
         self.doROI = False
@@ -105,19 +129,30 @@ class TelecineCamera(PiCamera) :
 #Warning very sensitive code !!
         
     def captureGenerator(self):
-        stream = BytesIO()
-        header = {'type':HEADER_IMAGE}
+        stream = ring.start()  #The encoder writes directly in the frame ring
         for foo in range(self.shutter_auto_wait) : 
             yield stream
             stream.seek(0)
             stream.truncate(0)
+        n = 0
+        while self.exposure != None and self.analysis.luminance() == None and n < MAX_EXTRA_FRAMES :
+            yield stream        #The reference of the exposure controller is the analysis of a frame
+            stream.seek(0)
+            stream.truncate(0)
+            n += 1
+        if self.exposure != None and not self.exposure.start() :
+            print('No frame analysis, auto exposure')
+            self.exposure = None
         if self.capture_method == CAPTURE_BASIC :
             pass
         elif self.capture_method == CAPTURE_ON_FRAME :
             motor.direction = MOTOR_FORWARD     
         elif self.capture_method == CAPTURE_ON_TRIGGER :
             if self.bracket_steps != 1 : #Reduce motor speed
-                frames = 3*self.shutter_auto_wait + self.shutter_speed_wait
+                autoWait, speedWait = self.shutter_auto_wait, self.shutter_speed_wait
+                if self.exposure != None :  #The exposure controller settles in at least its delay
+                    autoWait, speedWait = max(autoWait, self.exposure.delay), max(speedWait, self.exposure.delay)
+                frames = max(1, 3*autoWait + speedWait)
                 motor.speed = self.framerate / frames
                 print('Capture on trigger with bracket reducing motor speed to', motor.speed)
             motor.direction = MOTOR_FORWARD     
@@ -136,68 +171,232 @@ class TelecineCamera(PiCamera) :
                 motor.advanceUntilTrigger()
 #            self.awb_mode = 'auto'
 #            if self.bracket_steps != 1 :
-            for foo in range(self.shutter_auto_wait) : 
-                yield stream
-                stream.seek(0)
-                stream.truncate(0)
-#Wait if queue is full          
-            if queue.qsize() > 20 :
-                if self.capture_method == CAPTURE_ON_TRIGGER :
-                    motor.stop()
-                print('Warning queue > 20')
-                while queue.qsize() > 1 :
-                      time.sleep(1)
-                if self.capture_method == CAPTURE_ON_TRIGGER :
-                    motor.advance()
-            header['count'] = self.frameCounter
+            yield from self.settle(stream, self.shutter_auto_wait)
+            self.flowControl()
+            count = self.frameCounter
             self.frameCounter = self.frameCounter + 1 
             autoExposureSpeed = self.exposure_speed 
+            trigger = motor.triggerTime if self.capture_method != CAPTURE_BASIC else None
             if self.bracket_steps == 1 :
-                header['bracket'] = 0
-                header['shutter'] = autoExposureSpeed
-                header['gains'] = self.awb_gains
+                header = {'type':HEADER_IMAGE, 'count':count, 'bracket':0, 'shutter':autoExposureSpeed, 'gains':self.awb_gains}
                 yield stream
-                stream.seek(0)
-                queue.put(copy.deepcopy(header))
-                queue.put(stream.getvalue())
-                stream.truncate(0)
+                if self.exposure != None :    #Exposure of the next frame
+                    self.exposure.frame()
+                    self.exposure.program(self.exposure.predict(autoExposureSpeed))
+                self.queueShot(header, stream, trigger, True)
+                stream = ring.start()
             else :
 #First shot image #3 Normal (auto) 
 #Second shot image #2 light auto*light coeff
 #Third shot image #1 dark auto*dark coeff
-                coef = (self.bracket_light_coefficient, self.bracket_dark_coefficient,0) #normal clair sombre
-                exposureSpeed = autoExposureSpeed              #First shoot
-                for i in range(self.bracket_steps) :
-                    header['bracket'] = self.bracket_steps - i  #First is 3 Last  is 1
-                    header['shutter'] = exposureSpeed
-                    header['gains'] = self.awb_gains
-                    queue.put(copy.deepcopy(header))
-                    exposureSpeed =  int(autoExposureSpeed * coef[i]) #Exposure for next shot last is 0 (auto)
+#Adaptive bracketing: the light and dark shots only if the analysis of the auto exposed shot needs them,
+#decided once it is taken, the exposure of the next shot is programmed then (one more frame to settle)
+#the shots taken are numbered from their number ('shots' of the header) down to 1
+                adaptive = self.adaptive_bracket and self.analysis != None
+                speeds = self.bracketSpeeds(autoExposureSpeed, True, True)     #normal clair sombre
+                shots = len(speeds)
+                i = 0
+                while i < shots :
 #                    self.awb_mode = 'off'
-                    self.shutter_speed = exposureSpeed
+                    decide = adaptive and i == 0
+                    if not decide :
+                        self.programShot(speeds, i)
                     yield stream                        
-                    stream.seek(0)
-                    queue.put(stream.getvalue())
-                    stream.truncate(0)
-                    for foo in range(self.shutter_speed_wait) :
-                        yield stream
-                        stream.seek(0)
-                        stream.truncate(0)
+                    if self.exposure != None :
+                        self.exposure.frame()
+                        if i == 0 :
+                            nextSpeed = self.exposure.predict(speeds[0])
+                    if decide :
+                        speeds = self.bracketSpeeds(autoExposureSpeed, *self.analysis.needs())
+                        shots = len(speeds)
+                        if shots < self.bracket_steps :
+                            telemetry.increment('shots_skipped', self.bracket_steps - shots)
+                        self.programShot(speeds, i)
+                    if self.exposure != None and i == shots - 1 :     #Exposure of the next frame
+                        self.exposure.program(nextSpeed)
+                    header = {'type':HEADER_IMAGE, 'count':count, 'bracket':shots - i, 'shots':shots, 'shutter':speeds[i], 'gains':self.awb_gains} #First is 3 Last  is 1
+                    self.queueShot(header, stream, trigger, i == shots - 1)
+                    stream = ring.start()
+#Wait for the exposure of the next shot, after the last one for the auto exposure (not changed for one shot)
+                    if i < shots - 1 or (self.exposure == None and shots > 1) :
+                        yield from self.settle(stream, self.shutter_speed_wait + (1 if decide else 0))
+                    i += 1
 #            self.awb_mode = current_awb_mode
         if self.capture_method == CAPTURE_ON_TRIGGER :
             motor.stop()
 
+#Shutter speeds of the shots of a bracket: normal (auto exposure), light and dark if needed
+    def bracketSpeeds(self, autoExposureSpeed, light, dark):
+        speeds = [autoExposureSpeed]
+        if self.bracket_steps >= 2 and light :
+            speeds.append(int(autoExposureSpeed * self.bracket_light_coefficient))
+        if self.bracket_steps >= 3 and dark :
+            speeds.append(int(autoExposureSpeed * self.bracket_dark_coefficient))
+        return speeds
+
+#Exposure for the shot after the shot i, after the last one 0 (auto) or the exposure controller's
+    def programShot(self, speeds, i):
+        if self.exposure == None :
+            self.shutter_speed = speeds[i + 1] if i < len(speeds) - 1 else 0
+        elif i < len(speeds) - 1 :
+            self.exposure.program(speeds[i + 1])
+
+#Frames thrown away before a shot: waits frames, and with the exposure controller
+#until the exposure programmed is applied
+    def settle(self, stream, waits):
+        n = 0
+        while n < waits or (self.exposure != None and not self.exposure.applied()) :
+            yield stream
+            stream.seek(0)
+            stream.truncate(0)
+            if self.exposure != None :
+                self.exposure.frame()
+            n += 1
+
+#Continuous MJPEG recording (CAPTURE_BASIC and CAPTURE_ON_TRIGGER without bracket)
+#The encoder runs at the sensor rate without a Python round trip per frame, MjpegOutput splits
+#the stream into frames written in the ring. BASIC: every frame, ON_TRIGGER: the first frame
+#exposed after each trigger. A frame is tagged with the motor frame counter ('num') and the
+#monotonic time of its exposure from the encoder timestamp ('timestamp')
+    def recordSequence(self, resize) :
+        self.lastTrigger = motor.triggerTime
+        self.clockOffset = time.monotonic() - self.timestamp/1000000.   #Camera clock to monotonic
+        output = MjpegOutput(ring, self.selectFrame, self.recordFrame)
+        if self.capture_method == CAPTURE_ON_TRIGGER :
+            motor.direction = MOTOR_FORWARD
+            motor.advance()
+        self.start_recording(output, format='mjpeg', resize=resize, quality=85, bitrate=0)
+        overflows = 0
+        try :
+            while captureEvent.isSet() :
+                if not restartEvent.isSet() :
+                    msgheader = {'type':HEADER_MESSAGE, 'msg': 'Pausing capture'}
+                    queue.put(msgheader)
+                    restartEvent.wait()
+                    msgheader = {'type':HEADER_MESSAGE, 'msg': 'Resuming capture'}
+                    queue.put(msgheader)
+                self.wait_recording(RECORDING_PERIOD)
+                self.flowControl(False)     #Here and not in the encoder callback
+                if output.overflows != overflows :
+                    telemetry.increment('frames_dropped', output.overflows - overflows)
+                    overflows = output.overflows
+        finally :
+            self.stop_recording()
+            output.close()
+            if self.capture_method == CAPTURE_ON_TRIGGER :
+                motor.stop()
+
+#Start of a frame of the recording: monotonic time of its exposure, None to drop it
+#Called by the encoder thread, it must not block: without room to send the frame is dropped
+    def selectFrame(self) :
+        if not captureEvent.isSet() or not restartEvent.isSet() :
+            return None
+        if spool == None and flow.speedFactor() == 0. :
+            telemetry.increment('frames_dropped')
+            return None
+        frame = self.frame
+        if frame != None and frame.timestamp != None :
+            exposure = frame.timestamp/1000000. + self.clockOffset
+        else :
+            exposure = time.monotonic()
+        if self.capture_method == CAPTURE_ON_TRIGGER :
+            trigger = motor.triggerTime
+            if trigger == self.lastTrigger or exposure < trigger :
+                return None
+            self.lastTrigger = trigger
+        return exposure
+
+#End of a frame kept: queued for the sending thread like a shot of captureGenerator
+    def recordFrame(self, record, exposure) :
+        count = self.frameCounter
+        self.frameCounter = self.frameCounter + 1
+        header = {'type':HEADER_IMAGE, 'count':count, 'bracket':0, 'num':motor.frameCounter, \
+                  'shutter':self.exposure_speed, 'gains':self.awb_gains, 'timestamp':exposure}
+        trigger = motor.triggerTime if self.capture_method != CAPTURE_BASIC else None
+        self.queueShot(header, record, trigger, True, exposure)
+
+#Stage times of the shot just written by the encoder, then to the sending thread
+#exposure: time of the exposure when known (recording), else of the first bytes written
+    def queueShot(self, header, stream, trigger, last, exposure=None) :
+        stages = {'exposure':exposure if exposure != None else stream.firstWrite, 'encode':time.monotonic()}
+        if trigger != None :
+            stages['trigger'] = trigger
+        header['stages'] = stages
+        header.setdefault('timestamp', stages['encode'])
+        stream.commit()
+        flow.enqueue(stream.tell())
+        stages['enqueue'] = time.monotonic()
+        queue.put(header)
+        queue.put(stream)     #Sent from the ring and released by the sender
+        if last and trigger != None :
+            telemetry.add('capture', stages['enqueue'] - trigger)   #Trigger to the last shot of the frame
+
+#Flow control with the credits granted by the PC
+#Slow down the motor when the credits run low, wait without polling if no more room
+#(wait False: the motor is stopped, the recording drops the frames until there is room)
+#With the disk spool the capture goes on at full speed
+#The motor is also slowed down if the frames take longer to capture than the motor period
+    def flowControl(self, wait=True) :
+        factor = 1.
+        if spool == None :
+            factor = flow.speedFactor()
+            if factor == 0. and wait :
+                print('Warning send buffer full')
+                if self.capture_method == CAPTURE_ON_TRIGGER :
+                    motor.throttle(0.)
+                flow.waitResume()
+                factor = flow.speedFactor()
+        if self.capture_method == CAPTURE_ON_TRIGGER :
+            motor.throttle(min(factor, self.speedLimit()))
+
+#Motor speed factor the capture can follow from the telemetry, 1. if not known yet
+    def speedLimit(self) :
+        capture = telemetry.percentile('capture')
+        if capture == None or motor.speed == 0 :
+            return 1.
+        return min(1., 1./(capture*CAPTURE_MARGIN*motor.speed))
+
     def captureSequence(self) :
         self.capturing = True
         self.frameCounter = 0
+        setSpool(self.spool_enabled, self.spool_directory)
         startTime = time.time()
         resize = self.resolution
         if self.doResize == True :
             resize = (self.resize[0], self.resize[1])
-        self.capture_sequence(self.captureGenerator(), format="jpeg", use_video_port=self.use_video_port, resize=resize)
+        self.analysis = None
+        self.exposure = None
+        shutterSpeed = self.shutter_speed
+        exposureMode = self.exposure_mode
+        recording = self.record_mjpeg and self.bracket_steps == 1 and self.use_video_port and \
+                    self.capture_method in (CAPTURE_BASIC, CAPTURE_ON_TRIGGER)     #Auto exposure
+        if not recording and ((self.adaptive_bracket and self.bracket_steps > 1) or self.predictive_exposure) and self.use_video_port :
+            try :
+                self.analysis = ExposureAnalysis(self)
+                self.analysis.start()
+            except Exception as e :     #All the shots of the brackets, auto exposure
+                print('Frame analysis not available', e)
+                self.analysis = None
+        if self.predictive_exposure and self.analysis != None :
+            self.exposure = ExposureController(self, self.analysis, telemetry, self.exposure_delay)
+        try :
+            if recording :
+                self.recordSequence(resize)
+            else :
+                self.capture_sequence(self.captureGenerator(), format="jpeg", use_video_port=self.use_video_port, resize=resize)
+        finally :
+            ring.abort()
+            if self.analysis != None :
+                self.analysis.stop()
+                self.analysis = None
+            if self.exposure != None :
+                self.exposure = None
+                self.shutter_speed = shutterSpeed
+                self.exposure_mode = exposureMode
         stopTime = time.time()
         fps = float(self.frameCounter/(stopTime-startTime))
-        msg = "Capture terminated    Count %i    fps %f \n"%(self.frameCounter , fps)
+        stats = ring.stats()
+        msg = "Capture terminated    Count %i    fps %f    ring peak %i MB  waits %i \n"%(self.frameCounter , fps, stats['peak']>>20, stats['waits'])
         header = {'type':HEADER_MESSAGE, 'msg':msg}
         queue.put(header)
         while queue.qsize() > 1 :
@@ -213,17 +412,47 @@ class TelecineCamera(PiCamera) :
         stream = BytesIO()
         camera.capture(stream, format="jpeg", quality=90, use_video_port=self.use_video_port, resize=resize)
 #        camera.capture(stream, format="jpeg", quality=90, use_video_port=self.use_video_port)
-        stream.seek(0)
-        image = stream.getvalue()
-        header = {'type':HEADER_IMAGE, 'count':motor.frameCounter, 'bracket':0, 'shutter':self.exposure_speed,'gains':self.awb_gains}
+        image = stream
+        header = {'type':HEADER_IMAGE, 'count':motor.frameCounter, 'bracket':0, 'shutter':self.exposure_speed,'gains':self.awb_gains, 'timestamp':time.monotonic()}
         queue.put(header)
+        flow.enqueue(stream.tell())
         queue.put(image)
 
+#Bracket series of a still frame for the camera response curve (CALIBRATE_HDR)
+#count jpegs from -stops to +stops EV around the auto exposure, the gains are frozen meanwhile
+#The exposure is limited by the frame rate (video port)
+    def captureHdr(self, count, stops) :
+        while self.capturing :
+            time.sleep(1)
+        resize = self.resolution
+        if self.doResize == True :
+            resize = (self.resize[0], self.resize[1])
+        shutterSpeed = self.shutter_speed
+        exposureMode = self.exposure_mode
+        autoExposureSpeed = self.exposure_speed
+        maxSpeed = int(1000000/float(self.framerate))
+        self.exposure_mode = 'off'
+        try :
+            for i in range(count) :
+                ev = stops*(2.*i/(count - 1) - 1.) if count > 1 else 0.
+                self.shutter_speed = min(int(autoExposureSpeed*2**ev), maxSpeed)
+                time.sleep(self.shutter_speed_wait/float(self.framerate))
+                stream = BytesIO()
+                camera.capture(stream, format="jpeg", quality=90, use_video_port=self.use_video_port, resize=resize)
+                header = {'type':HEADER_HDR, 'count':count, 'num':i, 'shutter':self.exposure_speed, 'gains':self.awb_gains, 'timestamp':time.monotonic()}
+                queue.put(header)
+                flow.enqueue(stream.tell())
+                queue.put(stream)
+        finally :
+            self.shutter_speed = shutterSpeed
+            self.exposure_mode = exposureMode
+
     def captureBgr(self, type, count) :
         for i in range(count) :
             header = {'type':type, 'shutter':self.exposure_speed, 'gains':self.awb_gains, 'count':count, 'num':i}
             queue.put(header)
             image = self.get_bgr_image()
+            flow.enqueue(image.nbytes)
             queue.put(image)
 
 
@@ -284,20 +513,110 @@ class SendImageThread(Thread):
             while True:
                 object = queue.get()
                 if isinstance(object, dict) :      #Header object
-                    imageSock.sendObject(object)
+                    if object['type'] == HEADER_IMAGE or object['type'] == HEADER_HDR :
+                        self.sendImage(object, queue.get())
+                        continue
                     if object['type'] == HEADER_STOP :
+                        self.waitSpool()
+                        imageSock.sendHeader(object)
                         break;
+                    self.sendMessage(object)
                 elif isinstance(object, np.ndarray) :
+                    self.waitSpool()
+                    flow.acquire(object.nbytes)
                     imageSock.sendArray(object)
                 else :
+                    self.waitSpool()
                     imageSock.sendMsg(object) #Image buffer
             while queue.qsize() > 1 :
                 object = queue.get()
-                imageSock.sendObject(object)
+                if isinstance(object, dict) :
+                    imageSock.sendHeader(object)
         finally :
             if imageSock != None:
                 imageSock.close()
         print('SendImageThread terminated')
+
+#Header and image buffer in one send, or to the spool if the network is behind
+    def sendImage(self, header, image) :
+        n = bufferView(image).nbytes
+        if spool == None :
+            flow.acquire(n)
+            self.send(header, image)
+        elif spool.offer(encodeHeader(header), bufferView(image), lambda : flow.tryAcquire(n)) :
+            flow.dequeue(n)
+        else :
+            self.send(header, image)
+        if isinstance(image, RingRecord) :
+            image.release()
+
+    def send(self, header, image) :
+        header.setdefault('stages', {})['send'] = time.monotonic()
+        imageSock.sendHeader(header, image)
+        telemetry.record(header['stages'])
+
+#Payloads not spooled (arrays, buffers) are sent after the spool, their header may be in it
+    def waitSpool(self) :
+        if spool != None :
+            spool.waitEmpty()
+
+#Messages are spooled too when spooling to keep the order
+    def sendMessage(self, header) :
+        if spool == None or not spool.offer(encodeHeader(header), b'', lambda : True) :
+            imageSock.sendHeader(header)
+
+#Send the spooled frames in order
+class SpoolThread(Thread):
+    def __init__(self, spool):
+        Thread.__init__(self, daemon=True)
+        self.spool = spool
+
+    def run(self) :
+        while True:
+            record = self.spool.next()
+            if record == None :
+                break
+            header, payload = record
+            if payload.nbytes > 0 :     #Image or HDR shot, a message has no payload
+                decoded = decodeHeader(header)
+                flow.acquire(payload.nbytes, dequeue=False)
+                decoded['stages']['send'] = time.monotonic()
+                imageSock.sendMessages((encodeHeader(decoded), payload))
+                telemetry.record(decoded['stages'])
+            else :
+                imageSock.sendMsg(header)
+            self.spool.consumed()
+
+#Send the telemetry to the PC every second while capturing
+class TelemetryThread(Thread):
+    def __init__(self,):
+        Thread.__init__(self, daemon=True)
+
+    def run(self) :
+        while not telemetryStop.wait(1.) :
+            if camera == None or not camera.capturing :
+                continue
+            snapshot = telemetry.snapshot()
+            snapshot['ring_mb'] = ring.stats()['used'] / 1048576.
+            snapshot['credits'] = flow.available()
+            snapshot['motor_speed'] = float(motor.runningSpeed)   #A Fraction from the framerate
+            if spool != None :
+                snapshot['spooled'] = spool.stats()['count']
+            telemetrySock.sendMsg(encodeTelemetry(snapshot))
+
+#Receive the credits granted by the PC
+class CreditThread(Thread):
+    def __init__(self,):
+        Thread.__init__(self, daemon=True)
+
+    def run(self) :
+        while True:
+            buf = creditSock.receiveMsg()
+            if buf == None :
+                break
+            flow.grant(decodeCredit(buf))
+            creditSock.release(buf)
+        flow.close()
            
 def openCamera(mode, resolution, calibrationMode, hflip,vflip) :
     cam = None
@@ -359,6 +678,17 @@ def calibrateCamera(hflip, vflip) :
 
     
    
+#Enable or disable the disk spool, disabling waits until the spool is sent
+def setSpool(enabled, directory) :
+    global spool
+    if enabled and spool == None :
+        spool = Spool(directory)
+        SpoolThread(spool).start()
+    elif not enabled and spool != None :
+        spool.waitEmpty()
+        spool.close()
+        spool = None
+
 def saveCameraSettings() :
     if camera != None :
         np.savez('camera.npz', init = getSettings(camera, initSettings) , \
@@ -368,6 +698,121 @@ def saveCameraSettings() :
 def saveMotorSettings() :
     if motor != None :        
         np.savez('motor.npz', motor=getSettings(motor, motorSettings))
+
+## Commands
+## A request is (requestId, command, *args), the reply is (requestId, result, error)
+## Long commands (sleeps, captures, calibration) run on the worker thread one at a time,
+## the others are answered at once even during a long command (status, motor stop ...)
+
+def execute(requestId, function, args) :
+    try :
+        result = function(*args)
+        error = None
+    except Exception as e :
+        print(e)
+        result = None
+        error = repr(e)
+    commandSock.sendObject((requestId, result, error))
+
+def takeImage() :
+    camera.captureImage()
+
+def takeBgr(type, count) :
+    camera.captureBgr(type, count)
+
+def calibrateHdr(count, stops) :
+    camera.captureHdr(count, stops)
+
+def getCameraSettings() :
+    return getSettings(camera, initSettings+controlSettings+addedSettings+readOnlySettings)
+
+def getCameraSetting(key) :
+    return getSetting(camera, key)
+
+def getMotorSettings() :
+    return getSettings(motor, motorSettings)
+
+def setCameraSettings(settings) :
+    setSettings(camera, settings)
+
+def setMotorSettings(settings) :
+    setSettings(motor, settings)
+
+def saveSettings() :
+    saveCameraSettings()
+    saveMotorSettings()
+
+def startCapture() :
+    captureEvent.set()
+
+def stopCapture() :
+    captureEvent.clear()
+
+def pauseCapture() :
+    if restartEvent.isSet() :
+        restartEvent.clear()   #pause
+    else :
+        restartEvent.set()     #Restart
+
+def motorAdvance(direction) :
+    motor.direction = direction
+    motor.advance()  #0 forward 1 backward
+
+def motorAdvanceOne(direction) :
+    motor.direction = direction
+    motor.advanceCounted()
+
+def motorStop() :
+    motor.stop()
+
+def motorOnTrigger() :
+    motor.advanceUntilTrigger()
+
+def motorOn() :
+    motor.on()
+
+def motorOff() :
+    saveMotorSettings()
+    motor.off()
+
+def openCameraCommand(mode, resolution, calibrationMode, hflip, vflip) :
+    global camera
+    camera = openCamera(mode, resolution, calibrationMode, hflip, vflip)
+
+def calibrateCommand(hflip, vflip) :
+    calibrateCamera(hflip, vflip)
+    return 'Calibrate done'
+
+def whiteBalance() :
+    gains = camera.whiteBalance()
+    motor.off()
+    return gains
+
+#command -> (function, long)
+COMMANDS = {
+    TAKE_IMAGE : (takeImage, True),
+    TAKE_BGR : (takeBgr, True),
+    GET_CAMERA_SETTINGS : (getCameraSettings, False),
+    GET_CAMERA_SETTING : (getCameraSetting, False),
+    GET_MOTOR_SETTINGS : (getMotorSettings, False),
+    SET_CAMERA_SETTINGS : (setCameraSettings, False),
+    SET_MOTOR_SETTINGS : (setMotorSettings, False),
+    SAVE_SETTINGS : (saveSettings, False),
+    START_CAPTURE : (startCapture, False),
+    STOP_CAPTURE : (stopCapture, False),
+    PAUSE_CAPTURE : (pauseCapture, False),
+    MOTOR_ADVANCE : (motorAdvance, False),
+    MOTOR_ADVANCE_ONE : (motorAdvanceOne, True),
+    MOTOR_STOP : (motorStop, False),
+    MOTOR_ON_TRIGGER : (motorOnTrigger, True),
+    MOTOR_ON : (motorOn, False),
+    MOTOR_OFF : (motorOff, False),
+    OPEN_CAMERA : (openCameraCommand, True),    #The GUI sends the camera commands once the camera is open
+    CLOSE_CAMERA : (closeCamera, True),         #In order with the open
+    CALIBRATE_CAMERA : (calibrateCommand, True),
+    WHITE_BALANCE : (whiteBalance, True),
+    CALIBRATE_HDR : (calibrateHdr, True),
+}
 try:
     pi = pigpio.pi()
     if not pi.connected:
@@ -375,6 +820,10 @@ try:
         exit()
     
     queue = Queue() #sending queue
+    flow = CreditGate()
+    telemetry = Telemetry()
+    telemetryStop = Event()
+    ring = FrameRing(RING_BUDGET)
     triggerEvent = Event()
     motor = TelecineMotor(pi, queue)
     motor.triggerEvent = triggerEvent
@@ -388,13 +837,17 @@ try:
     listenSock = socket.socket()
     listenSock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
-    listenSock.bind(('0.0.0.0', 8000))
-    listenSock.listen(0)
-    commandSock = MessageSocket(listenSock.accept()[0])
-    print("Command sock connected")
+    listenSock.bind(('0.0.0.0', PORT))
     listenSock.listen(0)
-    imageSock = MessageSocket(listenSock.accept()[0])
-    print("Image sock connected")
+#One connection, commands replies and images are channels on it
+    mux = MultiplexSocket(listenSock.accept()[0])
+    commandSock = mux.channel(CHANNEL_REPLY, CHANNEL_COMMAND)
+    imageSock = mux.channel(CHANNEL_FRAME)
+    creditSock = mux.channel(CHANNEL_CREDIT)
+    telemetrySock = mux.channel(CHANNEL_TELEMETRY)
+    print("Connected")
+    CreditThread().start()
+    TelemetryThread().start()
 
 # Send image Thread
     sendImageThread = SendImageThread()
@@ -405,73 +858,30 @@ try:
     restartEvent = Event()
     restartEvent.set()
     
+    worker = ThreadPoolExecutor(max_workers=1)  #Long commands, one at a time in order
     while True:
         request = commandSock.receiveObject()
         if request == None :
             break
-        command = request[0]
+        requestId = request[0]
+        command = request[1]
         print('Command:%s\n' % hex(command)) #Thread safe print with NL !
-        if command == TAKE_IMAGE :
-            camera.captureImage()
-        elif command == TAKE_BGR:
-            camera.captureBgr(request[1], request[2])
-        elif command == GET_CAMERA_SETTINGS:
-            settings = getSettings(camera, initSettings+controlSettings+addedSettings+readOnlySettings)
-            commandSock.sendObject(settings)
-        elif command == GET_CAMERA_SETTING:
-            setting = getSetting(camera, request[1])
-            commandSock.sendObject(setting)
-        elif command == GET_MOTOR_SETTINGS:
-            settings = getSettings(motor, motorSettings)
-            commandSock.sendObject(settings)
-        elif command == SET_CAMERA_SETTINGS:
-            setSettings(camera, request[1])
-        elif command == SET_MOTOR_SETTINGS:
-            setSettings(motor, request[1])
-        elif command == SAVE_SETTINGS :
-            saveCameraSettings()
-            saveMotorSettings()
-        elif command == START_CAPTURE:
-            captureEvent.set()
-        elif command == STOP_CAPTURE:
-            captureEvent.clear()
-        elif command == TERMINATE:
+        if command == TERMINATE:
+            commandSock.sendObject((requestId, None, None))
             break
-        elif command == MOTOR_ADVANCE :
-            motor.direction = request[1]
-            motor.advance()  #0 forward 1 backward
-        elif command == MOTOR_ADVANCE_ONE :
-            motor.direction = request[1]
-            motor.advanceCounted()
-        elif command == MOTOR_STOP :
-            motor.stop()
-        elif command == OPEN_CAMERA :
-            camera = openCamera(request[1],request[2], request[3], request[4], request[5]) #mode, resolution, calibrationMode, hflip, vflip
-        elif command == CLOSE_CAMERA :
-             closeCamera()
-        elif command == CALIBRATE_CAMERA :
-            calibrateCamera(request[1],request[2])  #hflip vflip
-            commandSock.sendObject('Calibrate done')
-        elif command == MOTOR_ON_TRIGGER :
-            motor.advanceUntilTrigger()
-        elif command == MOTOR_ON :
-            motor.on()
-        elif command == MOTOR_OFF :
-            saveMotorSettings()
-            motor.off()
-        elif command == WHITE_BALANCE :
-            gains = camera.whiteBalance()
-            commandSock.sendObject(gains)
-            motor.off()
-        elif command == PAUSE_CAPTURE :
-            if restartEvent.isSet() :
-                restartEvent.clear()   #pause
-            else :
-                restartEvent.set()     #Restart
+        entry = COMMANDS.get(command)
+        if entry == None :
+            commandSock.sendObject((requestId, None, 'Unknown command %s' % hex(command)))
+            continue
+        function, long = entry
+        if long :
+            worker.submit(execute, requestId, function, request[2:])
         else :
-            pass            
+            execute(requestId, function, request[2:])
        
 finally:
+    if telemetryStop != None :
+        telemetryStop.set()
     if captureImageThread != None :
         exitFlag = True  #Stop Capture Thread
         if restartEvent != None :
@@ -483,6 +893,10 @@ finally:
     if sendImageThread != None:
         queue.put({'type':HEADER_STOP}) #Stop sending thread
         sendImageThread.join()
+    if worker != None :
+        worker.shutdown(wait=False)
+    if spool != None :
+        spool.close()
     if motor != None :
         saveMotorSettings()
         motor.close()
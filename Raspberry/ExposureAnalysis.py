@@ -0,0 +1,69 @@
+import time
+from threading import Lock
+
+import numpy as np
+from Backend import picamera
+
+## Low resolution analysis of the frames for the adaptive bracketing
+## A small YUV stream is recorded on the splitter port ANALYSIS_PORT of the video port while
+## capturing, for each frame the luminance plane gives the part of the pixels crushed in the
+## shadows and clipped in the highlights. Before the shots of a bracket captureGenerator reads the
+## analysis of the auto exposed frame: the light shot is taken only if the shadows are crushed,
+## the dark shot only if the highlights are clipped
+## The mean luminance is the statistic of the exposure controller (see ExposureController)
+
+ANALYSIS_PORT = 2
+ANALYSIS_SIZE = (160, 128)   #Multiple of 32x16, no padding of the YUV planes
+SHADOW_LEVEL = 8             #Luminance at or below: crushed shadow
+HIGHLIGHT_LEVEL = 247        #Luminance at or above: clipped highlight
+CLIP_THRESHOLD = 0.005       #Part of the pixels to need the light or dark shot
+SUBSAMPLE = 2
+
+class ExposureAnalysis(picamera.array.PiAnalysisOutput) :
+    def __init__(self, camera, size=ANALYSIS_SIZE):
+        super().__init__(camera, size)
+        self.lock = Lock()
+        self.shadows = None
+        self.highlights = None
+        self.mean = None
+        self.time = 0.
+
+#One frame of the stream, I420: the luminance plane (full range) first
+#The picamera base class write does not call analyze, the raw frame is analyzed here
+#without the conversion of the whole YUV frame to an array of PiYUVAnalysis
+    def write(self, b):
+        self.analyze(b)
+        return super().write(b)
+
+    def analyze(self, b):
+        w, h = self.size
+        if len(b) >= w*h :
+            y = np.frombuffer(b, np.uint8, count=w*h).reshape(h, w)[::SUBSAMPLE, ::SUBSAMPLE]
+            shadows = np.count_nonzero(y <= SHADOW_LEVEL)/y.size
+            highlights = np.count_nonzero(y >= HIGHLIGHT_LEVEL)/y.size
+            mean = float(y.mean())
+            with self.lock :
+                self.shadows = shadows
+                self.highlights = highlights
+                self.mean = mean
+                self.time = time.monotonic()
+
+#(light shot needed, dark shot needed), both without an analysis of less than maxAge seconds
+    def needs(self, maxAge=0.5):
+        with self.lock :
+            if self.shadows == None or time.monotonic() - self.time > maxAge :
+                return True, True
+            return bool(self.shadows > CLIP_THRESHOLD), bool(self.highlights > CLIP_THRESHOLD)
+
+#Mean luminance (0-255) of the last frame, None without an analysis of less than maxAge seconds
+    def luminance(self, maxAge=0.5):
+        with self.lock :
+            if self.mean == None or time.monotonic() - self.time > maxAge :
+                return None
+            return self.mean
+
+    def start(self):
+        self.camera.start_recording(self, format='yuv', resize=self.size, splitter_port=ANALYSIS_PORT)
+
+    def stop(self):
+        self.camera.stop_recording(splitter_port=ANALYSIS_PORT)
@@ -0,0 +1,72 @@
+## Predictive exposure of the capture, instead of throwing frames away for the auto exposure
+## The camera auto exposure is used once at the start of the capture: its shutter speed and the
+## mean luminance of the frame (see ExposureAnalysis) are the reference. Then the shutter is manual
+## and the gains are frozen (exposure_mode 'off', the camera AGC would correct the luminance too) :
+##   the normal exposure of the next frame is computed from the luminance of the normal shot of
+##   the current frame (the film changes slowly from a frame to the next) and programmed after
+##   the last shot of the frame, while the motor advances
+##   a shutter change reaches the frames after a delay (sensor pipeline, EXPOSURE_DELAY frames),
+##   a shot is taken once the delay is over and the exposure reported by the camera for the last
+##   frame (exposure_speed) is the one programmed
+## The wait counts of the camera (shutter_auto_wait, shutter_speed_wait) are then only the frames
+## always thrown away (motion of the advance), 0 or 1
+
+EXPOSURE_DELAY = 2          #Frames between a shutter change and the first frame exposed with it
+EXPOSURE_TOLERANCE = 0.05   #Difference of the exposure reported accepted, relative
+MAX_EXTRA_FRAMES = 8        #Frames waited after the delay before taking the shot anyway
+MAX_CORRECTION = 4.         #Largest change of the normal exposure from a frame to the next
+GAMMA = 2.2                 #Luminance to exposure
+
+class ExposureController() :
+    def __init__(self, camera, analysis, telemetry, delay=EXPOSURE_DELAY):
+        self.camera = camera
+        self.analysis = analysis
+        self.telemetry = telemetry
+        self.delay = delay
+        self.maxSpeed = int(1000000/float(camera.framerate))
+        self.reference = None   #Luminance of the auto exposure
+        self.target = None      #Shutter speed programmed
+        self.frames = 0         #Frames since the shutter speed was programmed
+
+#Reference from the camera auto exposure, then the shutter is manual and the gains frozen
+#False if there is no analysis of the frames, the camera auto exposure is kept
+#The caller restores exposure_mode and shutter_speed at the end of the capture
+    def start(self):
+        self.reference = self.analysis.luminance()
+        if self.reference == None :
+            return False
+        self.program(self.camera.exposure_speed)
+        self.camera.exposure_mode = 'off'
+        return True
+
+#Shutter speed of the next shots, limited by the frame rate
+    def program(self, speed):
+        speed = max(1, min(int(speed), self.maxSpeed))
+        if speed != self.target :
+            self.camera.shutter_speed = speed
+            self.target = speed
+            self.frames = 0
+        return speed
+
+#A frame has been captured
+    def frame(self):
+        self.frames += 1
+
+#True if the next frame is exposed with the shutter speed programmed
+    def applied(self):
+        if self.frames < self.delay :
+            return False
+        if abs(self.camera.exposure_speed - self.target) <= EXPOSURE_TOLERANCE*self.target :
+            return True
+        if self.frames >= self.delay + MAX_EXTRA_FRAMES :
+            self.telemetry.increment('exposure_late')
+            return True
+        return False
+
+#Normal exposure of the next frame from the luminance of the normal shot (speed) of this frame
+    def predict(self, speed):
+        luminance = self.analysis.luminance()
+        if luminance == None :
+            return speed
+        ratio = (self.reference/max(luminance, 1.))**GAMMA
+        return speed*min(max(ratio, 1./MAX_CORRECTION), MAX_CORRECTION)
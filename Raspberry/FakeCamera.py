@@ -0,0 +1,236 @@
+import sys
+import time
+from threading import Thread, Event
+from fractions import Fraction
+
+import numpy as np
+import cv2
+
+## Simulated picamera (see Backend)
+## Only what TelecineCamera, recalibrate and ExposureAnalysis use
+## Frames are synthetic jpegs (gradients and noise moving with the frame number)
+## encoded once and cached, the brightness follows the shutter speed so that
+## the bracket merges have something to do. capture_sequence is paced by the framerate
+
+SYNTHETIC_FRAMES = 8          #Distinct frames cycled
+AUTO_EXPOSURE = 8000          #Exposure speed in auto mode (us)
+V2_MAX_RESOLUTION = (3280, 2464)
+
+## picamera framerate is a Fraction that can be indexed as (numerator, denominator)
+class FakeFraction(Fraction) :
+    def __getitem__(self, index):
+        return (self.numerator, self.denominator)[index]
+
+def toResolution(value):
+    if isinstance(value, str) :
+        w, h = value.replace('*', 'x').split('x')
+        return (int(w), int(h))
+    return (int(value[0]), int(value[1]))
+
+class PiRGBArray() :
+    def __init__(self, camera, size=None):
+        self.camera = camera
+        self.size = size
+        self.array = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.array = None
+
+    def truncate(self, size=0):
+        self.array = None
+
+## picamera.array.PiAnalysisOutput, written one frame at a time by start_recording
+## As picamera the base class does not call analyze, its subclasses do in write
+class PiAnalysisOutput() :
+    def __init__(self, camera, size=None):
+        self.camera = camera
+        self.size = size
+
+    def write(self, b):
+        return len(b)
+
+    def analyze(self, array):
+        pass
+
+    def flush(self):
+        pass
+
+## picamera PiVideoFrame, the frame being recorded on the splitter port 1 (camera.frame)
+class FakeFrame() :
+    def __init__(self, index, timestamp):
+        self.index = index
+        self.timestamp = timestamp      #Camera clock (us)
+
+## picamera.array.PiRGBArray
+array = sys.modules[__name__]
+
+class PiCamera() :
+    MAX_RESOLUTION = V2_MAX_RESOLUTION
+
+    def __init__(self, camera_num=0, sensor_mode=0, resolution=None, framerate=None, lens_shading_table=None, **kwargs):
+        self.sensor_mode = sensor_mode
+        self._resolution = toResolution(resolution) if resolution != None else (1920, 1080)
+        self._framerate = FakeFraction(framerate if framerate != None else 30)
+        self.lens_shading_table = lens_shading_table
+        self.awb_mode = 'auto'
+        self._awb_gains = (Fraction(3, 2), Fraction(8, 5))
+        self.shutter_speed = 0
+        self.brightness = 50
+        self.contrast = 0
+        self.saturation = 0
+        self.exposure_mode = 'auto'
+        self.iso = 0
+        self.exposure_compensation = 0
+        self.zoom = (0., 0., 1., 1.)
+        self.analog_gain = Fraction(1)
+        self.digital_gain = Fraction(1)
+        self.hflip = False
+        self.vflip = False
+        self.frame = None
+        self.cache = {}
+        self.recordings = {}    #splitter port -> (thread, stop event)
+        self.closed = False
+
+    @property
+    def resolution(self):
+        return self._resolution
+
+    @resolution.setter
+    def resolution(self, value):
+        self._resolution = toResolution(value)
+
+    @property
+    def framerate(self):
+        return self._framerate
+
+    @framerate.setter
+    def framerate(self, value):
+        self._framerate = FakeFraction(value)
+
+    @property
+    def awb_gains(self):
+        return self._awb_gains
+
+    @awb_gains.setter
+    def awb_gains(self, value):
+        if not isinstance(value, tuple) :
+            value = (value, value)
+        self._awb_gains = (Fraction(value[0]).limit_denominator(256), Fraction(value[1]).limit_denominator(256))
+
+#Camera clock (us)
+    @property
+    def timestamp(self):
+        return int(time.monotonic()*1000000)
+
+    @property
+    def exposure_speed(self):
+        return self.shutter_speed if self.shutter_speed != 0 else AUTO_EXPOSURE
+
+    def _lens_shading_table_shape(self):
+        w, h = self.MAX_RESOLUTION
+        return (4, h//64 + 1, w//64 + 1)
+
+#Synthetic bgr frame for the frame index and the current exposure
+    def synthetic(self, index, size):
+        w, h = size
+        y, x = np.mgrid[:h, :w]
+        shift = index*w//SYNTHETIC_FRAMES
+        image = np.empty((h, w, 3), dtype=np.uint8)
+        image[:,:,0] = (x*200//w)
+        image[:,:,1] = (y*200//h)
+        image[:,:,2] = ((x + shift)*224//w) % 224
+        noise = np.random.RandomState(index).randint(0, 32, (h, w, 1), dtype=np.uint8)
+        image = image + noise
+        scale = self.exposure_speed / AUTO_EXPOSURE
+        if scale != 1 :
+            image = np.clip(image*scale, 0, 255).astype(np.uint8)
+        return image
+
+    def frameData(self, index, size, format):
+        key = (index % SYNTHETIC_FRAMES, size, format, self.exposure_speed)
+        data = self.cache.get(key)
+        if data is None :
+            image = self.synthetic(index % SYNTHETIC_FRAMES, size)
+            if format == 'jpeg' :
+                data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+            elif format == 'rgb' :
+                data = image[:,:,::-1].copy()
+            elif format == 'yuv' :  #I420, full range luminance as the camera, grey chroma
+                h, w = image.shape[:2]
+                data = np.full(w*h*3//2, 128, np.uint8)
+                data[:w*h] = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY).ravel()
+                data = data.tobytes()
+            else :
+                data = image
+            self.cache[key] = data
+        return data
+
+#Write a frame to a file name, a file like object or a PiRGBArray
+    def output(self, output, index, format, resize):
+        size = toResolution(resize) if resize != None else self._resolution
+        if format == None or format == 'mjpeg' :   #A MJPEG stream is the jpegs one after the other
+            format = 'jpeg'
+        data = self.frameData(index, size, format)
+        if isinstance(output, PiRGBArray) :
+            output.array = data
+        elif isinstance(output, str) :
+            with open(output, 'wb') as f :
+                f.write(data)
+        else :
+            view = memoryview(data)
+            for i in range(0, len(view), 65536) :  #The encoder writes by blocks
+                output.write(view[i:i + 65536])
+            output.flush()
+
+    def capture(self, output, format=None, use_video_port=False, resize=None, **options):
+        time.sleep(1. / float(self._framerate))
+        self.output(output, int(time.monotonic()*float(self._framerate)), format, resize)
+
+    def capture_sequence(self, outputs, format='jpeg', use_video_port=False, resize=None, **options):
+        interval = 1. / float(self._framerate)
+        nextTime = time.monotonic()
+        index = 0
+        for output in outputs :
+            nextTime += interval
+            delay = nextTime - time.monotonic()
+            if delay > 0 :
+                time.sleep(delay)
+            else :
+                nextTime = time.monotonic()   #Late, no burst to catch up
+            self.output(output, index, format, resize)
+            index += 1
+
+#Frames written to output at the frame rate by a thread until stop_recording
+    def start_recording(self, output, format=None, resize=None, splitter_port=1, **options):
+        stop = Event()
+        thread = Thread(target=self.record, args=(output, format, resize, stop, splitter_port), daemon=True)
+        self.recordings[splitter_port] = (thread, stop)
+        thread.start()
+
+    def record(self, output, format, resize, stop, splitter_port):
+        interval = 1. / float(self._framerate)
+        index = 0
+        while not stop.wait(interval) :
+            if splitter_port == 1 :
+                self.frame = FakeFrame(index, self.timestamp)
+            self.output(output, index, format, resize)
+            index += 1
+
+    def wait_recording(self, timeout=0, splitter_port=1):
+        time.sleep(timeout)
+
+    def stop_recording(self, splitter_port=1):
+        thread, stop = self.recordings.pop(splitter_port)
+        stop.set()
+        thread.join()
+        if splitter_port == 1 :
+            self.frame = None
+
+    def close(self):
+        for port in list(self.recordings) :
+            self.stop_recording(port)
+        self.closed = True
+        self.cache = {}
@@ -0,0 +1,152 @@
+import os
+import time
+from threading import Thread, Event, Lock
+
+## Simulated pigpio (see Backend)
+## Only what TelecineMotor and TelecineCamera use
+## Wave chains are emulated by a thread counting the motor steps at the wave
+## frequency, every stepsPerTrigger steps the edge callbacks are fired as the
+## optical trigger of the projector would do
+
+INPUT = 0
+OUTPUT = 1
+PUD_OFF = 0
+PUD_DOWN = 1
+PUD_UP = 2
+RISING_EDGE = 0
+FALLING_EDGE = 1
+EITHER_EDGE = 2
+
+class pulse() :
+    def __init__(self, gpio_on, gpio_off, delay):
+        self.gpio_on = gpio_on
+        self.gpio_off = gpio_off
+        self.delay = delay
+
+class _callback() :
+    def __init__(self, pi, gpio, edge, func):
+        self.pi = pi
+        self.gpio = gpio
+        self.edge = edge
+        self.func = func
+
+    def cancel(self):
+        with self.pi.lock :
+            if self in self.pi.callbacks :
+                self.pi.callbacks.remove(self)
+
+class pi() :
+    stepsPerTrigger = int(os.environ.get('YART_SIM_STEPS', 800))  #Motor steps per film frame
+
+    def __init__(self, host=None, port=None):
+        self.connected = True
+        self.lock = Lock()
+        self.levels = {}
+        self.callbacks = []
+        self.pulses = []
+        self.waves = {}      #id -> micros of one step
+        self.nextWave = 0
+        self.lastMicros = 0
+        self.chainThread = None
+        self.chainStop = Event()
+        self.steps = 0
+        self.startTick = time.monotonic()
+
+    def stop(self):
+        self.wave_tx_stop()
+        self.connected = False
+
+    def get_current_tick(self):
+        return int((time.monotonic() - self.startTick)*1000000) & 0xffffffff
+
+    def set_mode(self, gpio, mode):
+        pass
+
+    def set_pull_up_down(self, gpio, pud):
+        pass
+
+    def set_glitch_filter(self, gpio, steady):
+        pass
+
+    def write(self, gpio, level):
+        self.levels[gpio] = level
+
+    def read(self, gpio):
+        return self.levels.get(gpio, 0)
+
+    def callback(self, gpio, edge=RISING_EDGE, func=None):
+        cb = _callback(self, gpio, edge, func)
+        with self.lock :
+            self.callbacks.append(cb)
+        return cb
+
+    def wave_clear(self):
+        self.waves = {}
+        self.pulses = []
+
+    def wave_add_generic(self, pulses):
+        self.pulses += pulses
+        return len(self.pulses)
+
+    def wave_create(self):
+        wid = self.nextWave
+        self.nextWave += 1
+        self.lastMicros = sum(p.delay for p in self.pulses)
+        self.waves[wid] = self.lastMicros
+        self.pulses = []
+        return wid
+
+    def wave_delete(self, wid):
+        self.waves.pop(wid, None)
+
+    def wave_get_micros(self):
+        return self.lastMicros
+
+    def wave_tx_busy(self):
+        return 1 if self.chainThread != None and self.chainThread.is_alive() and not self.chainStop.is_set() else 0
+
+    def wave_tx_stop(self):
+        self.chainStop.set()
+
+#Parse [255 0 wave 255 1 x y] (repeat x+256y) and [255 0 wave 255 3] (forever)
+    def wave_chain(self, chain):
+        segments = []
+        i = 0
+        while i < len(chain) :
+            if chain[i] == 255 and chain[i+1] == 0 :
+                wid = chain[i+2]
+                if chain[i+4] == 1 :
+                    segments.append((self.waves.get(wid, 1000), chain[i+5] + 256*chain[i+6]))
+                    i += 7
+                else :
+                    segments.append((self.waves.get(wid, 1000), None))
+                    i += 5
+            else :
+                segments.append((self.waves.get(chain[i], 1000), 1))
+                i += 1
+        self.chainStop.set()
+        self.chainStop = Event()
+        self.chainThread = Thread(target=self.runChain, args=(segments, self.chainStop), daemon=True)
+        self.chainThread.start()
+        return 0
+
+    def runChain(self, segments, stop):
+        for micros, count in segments :
+            while count == None or count > 0 :
+                toTrigger = self.stepsPerTrigger - self.steps % self.stepsPerTrigger
+                n = toTrigger if count == None else min(toTrigger, count)
+                if stop.wait(n*micros/1000000.) :
+                    return
+                self.steps += n
+                if count != None :
+                    count -= n
+                if self.steps % self.stepsPerTrigger == 0 :
+                    self.fire()
+
+    def fire(self):
+        tick = self.get_current_tick()
+        with self.lock :
+            callbacks = [cb for cb in self.callbacks if cb.edge != EITHER_EDGE]
+        for cb in callbacks :
+            level = 0 if cb.edge == FALLING_EDGE else 1
+            cb.func(cb.gpio, level, tick)
@@ -0,0 +1,167 @@
+import time
+from collections import deque
+from threading import Condition
+
+## A byte budgeted ring of frames in one preallocated buffer
+## The camera encoder writes each jpeg directly in the ring through a RingRecord
+## (a file like object for picamera), the sender transmits from the ring and
+## releases the record. Records are contiguous and released in order, a record
+## reaching the end of the buffer is moved to the beginning if there is room.
+## Nothing is allocated in the steady state, the writer waits if the ring is full
+## (or with wait False gets None back, for a caller that must not block)
+
+class RingRecord() :
+    def __init__(self, ring):
+        self.ring = ring
+        self.start = 0
+        self.length = 0
+        self.released = False
+        self.firstWrite = 0.   #Monotonic time of the first bytes of the frame
+
+#File like interface used by picamera (and BytesIO compatible for the capture generator)
+    def write(self, data):
+        return self.ring.write(self, data)
+
+    def flush(self):
+        pass
+
+    def tell(self):
+        return self.length
+
+#Append only, seek(0) truncate(0) forget the frame written
+    def seek(self, pos):
+        self.ring.truncate(self, pos)
+
+    def truncate(self, size=None):
+        if size != None :
+            self.ring.truncate(self, size)
+        return self.length
+
+#Payload view for sending
+    def getbuffer(self):
+        return self.ring.view[self.start:self.start + self.length]
+
+#Frame complete, it is now waiting to be sent
+    def commit(self):
+        self.ring.commit(self)
+
+#Sent, give the room back
+    def release(self):
+        self.ring.release(self)
+
+#Not kept
+    def discard(self):
+        self.ring.discard(self)
+
+class FrameRing() :
+    def __init__(self, budget, maxRecords=256):
+        self.size = budget
+        self.buffer = bytearray(budget)
+        self.view = memoryview(self.buffer)
+        self.free = [RingRecord(self) for i in range(maxRecords)]
+        self.records = deque()  #Committed records oldest first
+        self.head = 0           #End of the last committed record
+        self.current = None     #Record started and not committed
+        self.condition = Condition()
+        self.used = 0
+        self.peak = 0
+        self.waits = 0
+        self.moves = 0
+        self.frames = 0
+
+#New record to write a frame, None if none free and not wait
+    def start(self, wait=True):
+        with self.condition :
+            while not self.free :
+                if not wait :
+                    return None
+                self.waits += 1
+                self.condition.wait()
+            record = self.free.pop()
+            record.start = self.head if self.records else 0
+            record.length = 0
+            record.released = False
+            self.current = record
+            return record
+
+#Make room for n more bytes in the record, return False if impossible now
+    def room(self, record, n):
+        end = record.start + record.length
+        if not self.records :
+            tail = self.size
+            wrapped = False
+        else :
+            tail = self.records[0].start
+            wrapped = record.start < tail or self.records[-1].start < tail  #Behind the oldest record
+        if wrapped :
+            return end + n <= tail
+        if end + n <= self.size :
+            return True
+        if record.length + n <= (tail if self.records else self.size) :
+            self.view[:record.length] = self.view[record.start:end]  #Move to the beginning
+            record.start = 0
+            self.moves += 1
+            return True
+        return False
+
+#Append data to the record, return None if no room and not wait
+    def write(self, record, data, wait=True):
+        n = len(data)
+        if record.length == 0 :
+            record.firstWrite = time.monotonic()
+        with self.condition :
+            if n + record.length > self.size :
+                raise ValueError('Frame larger than the ring')
+            while not self.room(record, n) :
+                if not wait :
+                    return None
+                self.waits += 1
+                self.condition.wait()
+            end = record.start + record.length
+            self.view[end:end + n] = data
+            record.length += n
+            self.used += n
+            if self.used > self.peak :
+                self.peak = self.used
+        return n
+
+    def truncate(self, record, size):
+        with self.condition :
+            if size < record.length :
+                self.used -= record.length - size
+                record.length = size
+
+    def commit(self, record):
+        with self.condition :
+            self.records.append(record)
+            self.head = record.start + record.length
+            self.current = None
+            self.frames += 1
+
+    def release(self, record):
+        with self.condition :
+            record.released = True
+            while self.records and self.records[0].released :
+                done = self.records.popleft()
+                self.used -= done.length
+                self.free.append(done)
+            self.condition.notify_all()
+
+    def discard(self, record):
+        with self.condition :
+            self.used -= record.length
+            self.free.append(record)
+            if self.current is record :
+                self.current = None
+            self.condition.notify_all()
+
+#Capture ended or failed, forget the record being written
+    def abort(self):
+        if self.current != None :
+            self.discard(self.current)
+
+#Occupancy
+    def stats(self):
+        with self.condition :
+            return {'size':self.size, 'used':self.used, 'peak':self.peak, 'records':len(self.records), \
+                    'frames':self.frames, 'waits':self.waits, 'moves':self.moves}
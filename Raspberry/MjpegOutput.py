@@ -0,0 +1,93 @@
+## Output of a continuous MJPEG recording (start_recording(format='mjpeg'))
+## The encoder stream is split on the JPEG markers SOI (FFD8) and EOI (FFD9) into frames written
+## directly in the frame ring, as the capture generator does for capture_sequence. A marker may
+## be cut between two writes of the encoder. At the start of a frame select() gives the time of
+## its exposure, or None to drop the frame (not written). At its end done(record, exposure) is
+## called with the ring record, the caller commits it or discards it
+## write() is called by the encoder thread of picamera and never blocks: a frame without room
+## in the ring is dropped and counted (overflows)
+
+SOI = b'\xff\xd8'
+EOI = b'\xff\xd9'
+
+class MjpegOutput() :
+    def __init__(self, ring, select, done):
+        self.ring = ring
+        self.select = select
+        self.done = done
+        self.inFrame = False
+        self.record = None      #Record of the frame written, None if dropped
+        self.exposure = None
+        self.lastFF = False     #The last write ended with 0xFF
+        self.frames = 0
+        self.dropped = 0
+        self.overflows = 0      #Dropped for lack of room in the ring
+
+    def write(self, b):
+        data = b if isinstance(b, bytes) else bytes(b)
+        view = memoryview(data)
+        pos = 0
+        if self.lastFF and data[:1] == b'\xd9' and self.inFrame :       #EOI cut
+            self.append(view[:1])
+            self.endFrame()
+            pos = 1
+        elif self.lastFF and data[:1] == b'\xd8' and not self.inFrame : #SOI cut
+            self.startFrame()
+            self.append(b'\xff')
+        while pos < len(data) :
+            if not self.inFrame :
+                start = data.find(SOI, pos)
+                if start < 0 :
+                    break
+                self.startFrame()
+                self.append(view[start:start + 2])
+                pos = start + 2
+                continue
+            end = data.find(EOI, pos)
+            if end < 0 :
+                self.append(view[pos:])
+                break
+            self.append(view[pos:end + 2])
+            self.endFrame()
+            pos = end + 2
+        self.lastFF = data[-1:] == b'\xff'
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def append(self, data):
+        if self.record != None and self.ring.write(self.record, data, False) == None :
+            self.overflow()
+
+    def startFrame(self):
+        self.inFrame = True
+        self.exposure = self.select()
+        if self.exposure == None :
+            self.dropped += 1
+            return
+        self.record = self.ring.start(False)
+        if self.record == None :
+            self.overflow()
+
+    def overflow(self):
+        if self.record != None :
+            self.record.discard()
+            self.record = None
+        self.dropped += 1
+        self.overflows += 1
+
+    def endFrame(self):
+        self.inFrame = False
+        record = self.record
+        self.record = None
+        if record != None :
+            self.frames += 1
+            self.done(record, self.exposure)
+
+#Recording stopped, forget a frame not complete
+    def close(self):
+        if self.record != None :
+            self.record.discard()
+            self.record = None
+        self.inFrame = False
@@ -0,0 +1,85 @@
+import os
+import glob
+from threading import Condition
+
+from SegmentFile import *
+
+## Disk spool used when the network falls behind
+## When a frame cannot be sent now (no credits) the spool becomes active:
+## this frame and all the following ones are appended to segment files on the
+## SD card or an USB disk, and the drain thread sends them in order.
+## Once everything is sent the spool is inactive again and the files are removed.
+## The order of the frames and messages is kept, so the GUI sees the same stream
+
+class Spool() :
+    def __init__(self, directory):
+        self.directory = directory
+        self.condition = Condition()
+        self.active = False
+        self.count = 0     #Records written and not sent
+        self.peak = 0
+        self.spooled = 0
+        self.writer = None
+        self.reader = None
+        self.closed = False
+
+#Spool the record if spooling or if it cannot be sent now, return True if spooled
+#Otherwise the caller sends it, nothing can be spooled meanwhile
+    def offer(self, header, payload, canSend):
+        with self.condition :
+            if not self.active and canSend() :
+                return False
+            if self.writer == None :
+                self.removeSegments()
+                self.writer = SegmentWriter(self.directory, 'spool')
+                self.reader = SegmentReader(self.directory, 'spool', deleteRead=True)
+            self.writer.append(header, payload)
+            self.writer.flush()
+            self.active = True
+            self.count += 1
+            self.spooled += 1
+            if self.count > self.peak :
+                self.peak = self.count
+            self.condition.notify_all()
+            return True
+
+#Next record to send (header bytes, payload view), wait for one, None if closed
+    def next(self):
+        with self.condition :
+            while self.count == 0 and not self.closed :
+                self.condition.wait()
+            if self.closed :
+                return None
+            reader = self.reader
+        return reader.read()
+
+#The record returned by next is sent
+    def consumed(self):
+        with self.condition :
+            self.count -= 1
+            if self.count == 0 :
+                self.active = False
+                self.writer.close()
+                self.reader.close()
+                self.writer = None
+                self.reader = None
+                self.removeSegments()
+            self.condition.notify_all()
+
+    def removeSegments(self):
+        for name in glob.glob(os.path.join(self.directory, 'spool_*.seg')) :
+            os.remove(name)
+
+    def waitEmpty(self):
+        with self.condition :
+            while self.active and not self.closed :
+                self.condition.wait()
+
+    def stats(self):
+        with self.condition :
+            return {'active':self.active, 'count':self.count, 'peak':self.peak, 'spooled':self.spooled}
+
+    def close(self):
+        with self.condition :
+            self.closed = True
+            self.condition.notify_all()
@@ -3,7 +3,7 @@ from struct import *
 import copy
 import time
 import sys
-import pigpio
+from Backend import pigpio
 from threading import Thread, Event
 from queue import Queue
 
@@ -28,8 +28,11 @@ class TelecineMotor() :
     capture_speed = 0
     play_speed = 0
     triggered = False
+    triggerTime = 0.   #Monotonic time of the last trigger
     triggerEvent = None
     direction = MOTOR_FORWARD
+    runningSpeed = 0   #Speed of the current continuous advance 0 if stopped
+    throttleStep = 0.1 #Throttle factor resolution, avoid a new chain on each frame
       
     def __init__(self, pi, queue):
         self.pi = pi
@@ -49,6 +52,7 @@ class TelecineMotor() :
                 self.pi.set_pull_up_down(self.trigger_pin, pigpio.PUD_DOWN)
 
         self.queue = queue
+        self.waves = []  #Waves of the continuous advance chain
         
     def on(self) :
         if self.ena_pin != 0 :
@@ -59,6 +63,7 @@ class TelecineMotor() :
             self.pi.write(self.ena_pin, 1 - self.ena_level)
 
     def trigger(self, gpio,level,  tick ) :
+        self.triggerTime = time.monotonic()
         if self.direction == MOTOR_FORWARD :
             self.frameCounter = self.frameCounter +1
         else :
@@ -76,27 +81,61 @@ class TelecineMotor() :
         wf.append(pigpio.pulse(0, 1 << self.pulse_pin, micros))  # pulse off
         self.pi.wave_add_generic(wf)
         return self.pi.wave_create() #return wave id and
-          
+
+#Ramping speeds from start to end by steps of 2
+    def ramp(self, start, end):
+        if end >= start :
+            return range(2*int(start/2) + 2, int(end), 2)
+        return range(2*int(-(-start//2)) - 2, int(end), -2)
 
 #Advance at speed with some ramping to obtain the desired speed
+#If already advancing ramp from the current speed without stopping
 #return immediately    
-    def advance(self):
+    def advance(self, speed=None):
+        if speed == None :
+            speed = self.speed
+        running = self.runningSpeed != 0 and self.pi.wave_tx_busy()
+        start = self.runningSpeed if running else 0
         self.triggered = False
         self.pi.write(self.dir_pin, 0 if self.direction == self.dir_level else 1)  #self.direction = 0 forward
-        self.pi.wave_clear()
+        if not running :
+            self.pi.wave_clear()
+        old = self.waves
+        self.waves = []
         chain = []
         x = self.steps_per_rev  & 255
         y = self.steps_per_rev  >> 8
-        for s in range(2,int(self.speed),2) :
-            chain += [255, 0, self.wave(s), 255, 1, x, y] #One rev for each
-        chain += [255, 0, self.wave(self.speed), 255, 3]  #Loop forever
+        for s in self.ramp(start, speed) :
+            chain += [255, 0, self.newWave(s), 255, 1, x, y] #One rev for each
+        chain += [255, 0, self.newWave(speed), 255, 3]  #Loop forever
         self.pi.wave_chain(chain)  # Transmit chain.
+        self.runningSpeed = speed
+        if running :
+            for wid in old :  #Waves of the previous chain no more used
+                self.pi.wave_delete(wid)
+
+    def newWave(self, speed):
+        wid = self.wave(speed)
+        self.waves.append(wid)
+        return wid
+
+#Flow control: scale the continuous advance speed by factor (0. stop 1. full speed)
+#The motor slows down or speeds up with ramping, it is stopped only at 0
+    def throttle(self, factor):
+        factor = round(factor/self.throttleStep)*self.throttleStep
+        speed = self.speed*factor
+        if speed < 1 :
+            if self.runningSpeed != 0 :
+                self.stop()
+        elif abs(speed - self.runningSpeed) > 1e-6 :
+            self.advance(speed)
 ##        self.pi.wave_chain(chain)  # Transmit ramping chain
 ##        self.pi.wave_send_repeat(self.wave(self.speed))
 
 #Advance count rev, return when finished (no ramping)
     def advanceCounted(self, count=1):
         self.triggered = False
+        self.runningSpeed = 0
         self.pi.write(self.dir_pin, 0 if self.direction == self.dir_level else 1)  #self.direction = 0 forward
         self.pi.wave_clear()
         chain = []
@@ -113,6 +152,7 @@ class TelecineMotor() :
     def advanceUntilTrigger(self):
         if self.trigger_pin != 0 :
             self.triggered = True
+            self.runningSpeed = 0
             self.pi.write(self.dir_pin, 0 if self.direction == self.dir_level else 1)  #self.direction = 0 forward
             self.pi.wave_clear()
 ##            chain = [255, 0, self.wave(self.speed), 255, 3]  #Loop forever but triggered without ramping
@@ -135,6 +175,7 @@ class TelecineMotor() :
         
     def stop(self) :
         print('Stop')
+        self.runningSpeed = 0
         self.pi.wave_clear()
         self.pi.wave_tx_stop()
 
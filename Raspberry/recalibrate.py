@@ -1,5 +1,4 @@
-import picamera.array
-import picamera
+from Backend import picamera
 import numpy as np
 import sys
 import time
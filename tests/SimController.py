@@ -0,0 +1,172 @@
+import os
+import sys
+import time
+import socket
+import shutil
+import tempfile
+import subprocess
+from queue import Queue, Empty
+from threading import Thread, Event, Lock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT, 'Common'))
+
+from Constants import *
+from FrameHeader import *
+from FlowControl import *
+from Telemetry import *
+from MultiplexSocket import *
+
+## The Controller with the simulated camera and pigpio (YART_BACKEND=sim) in a subprocess,
+## driven by a minimal PC side on the synchronous MultiplexSocket (no Qt)
+## The frame channel is read by a thread: headers are kept, payloads are checked and released
+## and the credits given back as the ImageThread does. The telemetry snapshots are kept too
+
+def freePort():
+    with socket.socket() as sock :
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class SimController() :
+    def __init__(self, stepsPerTrigger=200):
+        self.directory = tempfile.mkdtemp(prefix='yart_test_')
+        self.port = freePort()
+        self.log = open(os.path.join(self.directory, 'controller.log'), 'w+')
+        env = dict(os.environ, YART_BACKEND='sim', YART_PORT=str(self.port), YART_SIM_STEPS=str(stepsPerTrigger), \
+                   PYTHONPATH=os.path.join(ROOT, 'Common'), PYTHONUNBUFFERED='1')
+        self.process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'Raspberry', 'Controller.py')], \
+                                        cwd=self.directory, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+        self.mux = None
+        self.requestId = 0
+        self.replies = Queue()
+        self.lock = Lock()
+        self.headers = []
+        self.payloads = []      #(header, payload bytes)
+        self.snapshots = []
+        self.terminated = Event()
+        try :
+            self.connect()
+        except :
+            self.close()
+            raise
+
+    def connect(self):
+        deadline = time.monotonic() + 20
+        while True :
+            try :
+                sock = socket.create_connection(('127.0.0.1', self.port))
+                break
+            except OSError :
+                if time.monotonic() > deadline or self.process.poll() != None :
+                    raise RuntimeError('Controller not started\n' + self.output())
+                time.sleep(0.1)
+        self.mux = MultiplexSocket(sock)
+        self.commandSock = self.mux.channel(CHANNEL_COMMAND, CHANNEL_REPLY)
+        self.imageSock = self.mux.channel(CHANNEL_FRAME)
+        self.creditSock = self.mux.channel(CHANNEL_CREDIT)
+        self.telemetrySock = self.mux.channel(CHANNEL_TELEMETRY)
+        Thread(target=self.readReplies, daemon=True).start()
+        Thread(target=self.readFrames, daemon=True).start()
+        Thread(target=self.readTelemetry, daemon=True).start()
+        self.creditSock.sendMsg(encodeCredit(CREDIT_WINDOW))
+
+    def readReplies(self):
+        while True :
+            reply = self.commandSock.receiveObject()
+            self.replies.put(reply)
+            if reply == None :
+                break
+
+    def readFrames(self):
+        while True :
+            header = self.imageSock.receiveHeader()
+            if header == None :
+                break
+            if header['type'] in (HEADER_IMAGE, HEADER_HDR) :
+                payload = self.imageSock.receiveMsg()
+                if payload == None :
+                    break
+                with self.lock :
+                    self.payloads.append((header, bytes(payload)))
+                self.creditSock.sendMsg(encodeCredit(payload.nbytes))
+                self.imageSock.release(payload)
+            with self.lock :
+                self.headers.append(header)
+            if header['type'] == HEADER_MESSAGE and header['msg'].startswith('Capture terminated') :
+                self.terminated.set()
+
+    def readTelemetry(self):
+        while True :
+            buf = self.telemetrySock.receiveMsg()
+            if buf == None :
+                break
+            with self.lock :
+                self.snapshots.append(decodeTelemetry(buf))
+            self.telemetrySock.release(buf)
+
+#Send a command and wait for its reply, raise the error of the Controller
+    def call(self, command, *args, timeout=30.):
+        self.requestId += 1
+        self.commandSock.sendObject((self.requestId, command) + args)
+        deadline = time.monotonic() + timeout
+        while True :
+            try :
+                reply = self.replies.get(timeout=max(0., deadline - time.monotonic()))
+            except Empty :
+                raise TimeoutError('No reply to %s\n%s' % (hex(command), self.output()))
+            if reply == None :
+                raise ConnectionError('Controller closed\n' + self.output())
+            requestId, result, error = reply
+            if requestId != self.requestId :
+                continue
+            if error != None :
+                raise RuntimeError(error + '\n' + self.output())
+            return result
+
+    def openCamera(self, resolution=(320, 240)):
+        self.call(OPEN_CAMERA, 2, resolution, CALIBRATION_NONE, False, False)
+
+#Capture for duration seconds, return the payloads (header, payload bytes) received
+    def capture(self, settings, duration=2., motorSpeed=5.):
+        with self.lock :
+            first = len(self.payloads)
+        self.terminated.clear()
+        self.call(SET_MOTOR_SETTINGS, {'speed':motorSpeed})
+        self.call(SET_CAMERA_SETTINGS, settings)
+        self.call(START_CAPTURE)
+        time.sleep(duration)
+        self.call(STOP_CAPTURE)
+        if not self.terminated.wait(30) :
+            raise TimeoutError('Capture not terminated\n' + self.output())
+        with self.lock :
+            return self.payloads[first:]
+
+#Wait for n payloads of type typ, return them
+    def waitPayloads(self, typ, n, timeout=30.):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline :
+            with self.lock :
+                payloads = [p for p in self.payloads if p[0]['type'] == typ]
+            if len(payloads) >= n :
+                return payloads
+            time.sleep(0.05)
+        raise TimeoutError('%i payloads of type %i expected\n%s' % (n, typ, self.output()))
+
+    def output(self):
+        self.log.flush()
+        self.log.seek(0)
+        return self.log.read()
+
+    def close(self):
+        if self.mux != None :
+            try :
+                self.commandSock.sendObject((0, TERMINATE))
+                self.process.wait(10)
+            except subprocess.TimeoutExpired :
+                pass
+            self.mux.close()
+        if self.process.poll() == None :
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,207 @@
+import os
+import sys
+import socket
+import asyncio
+import unittest
+from threading import Thread
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+
+from Constants import *
+from AsyncMessageSocket import *
+from AsyncMultiplexSocket import *
+from MultiplexSocket import MultiplexSocket
+
+## AsyncMessageSocket: the staging of MessageProtocol, messages over a loopback connection
+## AsyncMultiplexSocket: channels interleaved on one connection, with the threaded MultiplexSocket too
+
+def payload(i, size):
+    return bytes((i + j) & 0xff for j in range(size))
+
+class FakeTransport() :
+    def __init__(self):
+        self.reading = True
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
+#The event loop side of a BufferedProtocol: get_buffer, copy, buffer_updated
+def feed(protocol, data):
+    while data :
+        buf = protocol.get_buffer(-1)
+        if buf.nbytes == 0 :
+            raise RuntimeError('Empty buffer')
+        n = min(buf.nbytes, len(data))
+        buf[:n] = data[:n]
+        protocol.buffer_updated(n)
+        data = data[n:]
+
+class MessageProtocolTest(unittest.TestCase) :
+    def protocol(self, stagingSize=16):
+        protocol = MessageProtocol(stagingSize)
+        protocol.connection_made(FakeTransport())
+        return protocol
+
+    def read(self, protocol, n):
+        view = memoryview(bytearray(n))
+        self.assertTrue(asyncio.run(protocol.readInto(view)))
+        return bytes(view)
+
+    def test_staged(self):
+        protocol = self.protocol()
+        feed(protocol, b'0123456789')
+        self.assertEqual(self.read(protocol, 4), b'0123')
+        feed(protocol, b'abcdefghij')      #Compacted to the start
+        self.assertEqual(self.read(protocol, 16), b'456789abcdefghij')
+
+    def test_full_paused(self):
+        protocol = self.protocol()
+        feed(protocol, payload(0, 16))
+        self.assertFalse(protocol.transport.reading)
+        self.assertEqual(self.read(protocol, 0), b'')
+        self.assertFalse(protocol.transport.reading)    #Still full, not resumed
+        self.assertEqual(self.read(protocol, 6), payload(0, 6))
+        self.assertTrue(protocol.transport.reading)
+
+    def test_full_never_empty(self):
+        protocol = self.protocol()
+        feed(protocol, payload(0, 16))
+        feed(protocol, payload(16, 8))      #A read still in flight when paused
+        self.assertGreater(protocol.get_buffer(-1).nbytes, 0)
+        self.assertEqual(self.read(protocol, 24), payload(0, 16) + payload(16, 8))
+
+class AsyncMessageSocketTest(unittest.TestCase) :
+    def test_messages(self):
+        sizes = [0, 1, 4, 100, 4095, 4096, 70000, 0, 300000, 3]
+
+        async def main() :
+            loop = asyncio.get_running_loop()
+            received = loop.create_future()
+
+            async def serve(protocol) :
+                sock = AsyncMessageSocket(protocol)
+                messages = []
+                for size in sizes :
+                    buf = await sock.receiveMsg()
+                    messages.append(bytes(buf))
+                    sock.release(buf)
+                obj = await sock.receiveObject()
+                header = await sock.receiveHeader()
+                end = await sock.receiveMsg()
+                received.set_result((messages, obj, header, end))
+
+            def factory() :
+                protocol = MessageProtocol(64)     #Small staging: paused and resumed often
+                loop.call_soon(lambda : asyncio.ensure_future(serve(protocol)))
+                return protocol
+
+            server = await loop.create_server(factory, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            transport, protocol = await loop.create_connection(lambda : MessageProtocol(64), '127.0.0.1', port)
+            sock = AsyncMessageSocket(protocol)
+            for i, size in enumerate(sizes) :
+                await sock.sendMsg(payload(i, size))
+            await sock.sendObject((1, 'a', [2.5]))
+            await sock.sendHeader({'type':HEADER_IMAGE, 'count':7, 'bracket':1}, b'\xff\xd8\xff\xd9')
+            sock.close()
+            result = await asyncio.wait_for(received, 10)
+            server.close()
+            return result
+
+        messages, obj, header, end = asyncio.run(main())
+        self.assertEqual(messages, [payload(i, size) for i, size in enumerate(sizes)])
+        self.assertEqual(obj, (1, 'a', [2.5]))
+        self.assertEqual(header['count'], 7)
+        self.assertEqual(bytes(end), b'\xff\xd8\xff\xd9')    #Payload sent with the header
+
+class AsyncMultiplexSocketTest(unittest.TestCase) :
+    async def pair(self):
+        loop = asyncio.get_running_loop()
+        accepted = loop.create_future()
+
+        def factory() :
+            protocol = MessageProtocol(1024)
+            loop.call_soon(lambda : accepted.set_result(AsyncMultiplexSocket(protocol)))
+            return protocol
+
+        server = await loop.create_server(factory, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        transport, protocol = await loop.create_connection(lambda : MessageProtocol(1024), '127.0.0.1', port)
+        client = AsyncMultiplexSocket(protocol)
+        return client, await asyncio.wait_for(accepted, 10), server
+
+    def test_channels(self):
+        frames = [payload(i, 100000 + 1000*i) for i in range(5)]
+
+        async def main() :
+            client, peer, server = await self.pair()
+            frameSock, commandSock = client.channel(CHANNEL_FRAME), client.channel(CHANNEL_COMMAND)
+            peerFrames, peerCommands = peer.channel(CHANNEL_FRAME), peer.channel(CHANNEL_COMMAND)
+
+            async def sendFrames() :
+                for frame in frames :
+                    await frameSock.sendMsg(frame)
+                await frameSock.sendMsg(b'')
+
+            async def sendCommands() :
+                for i in range(20) :
+                    await commandSock.sendObject((i, 'command'))
+
+            async def receive(sock, n, decode) :
+                messages = []
+                for i in range(n) :
+                    buf = await sock.receiveMsg()
+                    messages.append(decode(buf))
+                    sock.release(buf)
+                return messages
+
+            sent = asyncio.gather(sendFrames(), sendCommands())
+            received = await asyncio.wait_for(asyncio.gather(receive(peerFrames, 6, bytes), \
+                                                             receive(peerCommands, 20, lambda buf : eval(str(buf, 'utf-8'))[0])), 10)
+            await sent
+            client.close()
+            end = await asyncio.wait_for(peerFrames.receiveMsg(), 10)
+            peer.close()
+            server.close()
+            return received, end
+
+        (receivedFrames, commands), end = asyncio.run(main())
+        self.assertEqual(receivedFrames, frames + [b''])
+        self.assertEqual(commands, [(i, 'command') for i in range(20)])
+        self.assertIsNone(end)
+
+#The threaded MultiplexSocket (Pi side) and AsyncConnection (PC side) share the wire format
+    def test_threaded_peer(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        peer = []
+        accept = Thread(target=lambda : peer.append(MultiplexSocket(listener.accept()[0])), daemon=True)
+        accept.start()
+        connection = AsyncConnection('127.0.0.1', listener.getsockname()[1])
+        accept.join(10)
+        mux = peer[0]
+        try :
+            commands = connection.blockingChannel(CHANNEL_COMMAND, CHANNEL_REPLY)
+            piCommands = mux.channel(CHANNEL_REPLY, CHANNEL_COMMAND)
+            commands.sendObject((1, 'open'))
+            self.assertEqual(piCommands.receiveObject(), (1, 'open'))
+            frame = payload(3, 200000)
+            mux.channel(CHANNEL_FRAME).sendHeader({'type':HEADER_IMAGE, 'count':0, 'bracket':0}, frame)
+            frames = connection.blockingChannel(CHANNEL_FRAME)
+            self.assertEqual(frames.receiveHeader()['count'], 0)
+            buf = frames.receiveMsg()
+            self.assertEqual(bytes(buf), frame)
+            frames.release(buf)
+            piCommands.sendObject((1, None, None))
+            self.assertEqual(commands.receiveObject(), (1, None, None))
+        finally :
+            connection.close()
+            mux.close()
+            listener.close()
+
+if __name__ == '__main__':
+    unittest.main()
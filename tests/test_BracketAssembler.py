@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GUIControl'))
+
+from Telemetry import *
+from BracketAssembler import *
+
+def shot(count, bracket, shots=None):
+    header = {'count':count, 'bracket':bracket}
+    if shots != None :
+        header['shots'] = shots
+    return header, b'x'*10
+
+class BracketAssemblerTest(unittest.TestCase) :
+    def setUp(self):
+        self.telemetry = Telemetry()
+        self.assembler = BracketAssembler(self.telemetry, timeout=0.05)
+
+    def add(self, *args):
+        return self.assembler.add(*shot(*args))
+
+    def counts(self, sets):
+        return [[(header['count'], header['bracket']) for header, jpeg in shots] for shots in sets]
+
+    def test_complete(self):
+        self.assertEqual(self.add(0, 3), ([], []))
+        self.assertEqual(self.add(0, 2), ([], []))
+        ready, rejected = self.add(0, 1)
+        self.assertEqual(self.counts(ready), [[(0, 3), (0, 2), (0, 1)]])
+        self.assertEqual(self.assembler.bytes, 0)
+
+    def test_size_of_previous_set(self):
+        for bracket in (3, 2, 1) :
+            self.add(0, bracket)
+        ready, rejected = self.add(1, 2)
+        ready, rejected = self.add(1, 1)
+        self.assertEqual(ready, [])     #The shot 3 may still come
+        ready, rejected = self.add(1, 3)
+        self.assertEqual(self.counts(ready), [[(1, 3), (1, 2), (1, 1)]])
+
+    def test_shots(self):
+        ready, rejected = self.add(0, 1, 1)
+        self.assertEqual(self.counts(ready), [[(0, 1)]])
+        for bracket in (3, 2) :
+            self.add(1, bracket, 3)
+        ready, rejected = self.add(1, 1, 3)
+        self.assertEqual(len(ready), 1)
+
+    def test_count_order(self):
+        self.add(0, 2, 2)
+        ready, rejected = self.add(1, 1, 1)
+        self.assertEqual(ready, [])     #Waits for the set 0
+        ready, rejected = self.add(0, 1, 2)
+        self.assertEqual(self.counts(ready), [[(0, 2), (0, 1)], [(1, 1)]])
+
+    def test_duplicate(self):
+        self.add(0, 2, 2)
+        ready, rejected = self.add(0, 2, 2)
+        self.assertEqual(len(rejected), 1)
+        self.add(0, 1, 2)
+        ready, rejected = self.add(0, 1, 2)     #Already given back
+        self.assertEqual(len(rejected), 1)
+        self.assertEqual(self.telemetry.snapshot()['rejected'], 2)
+
+    def test_timeout(self):
+        self.add(0, 3)
+        self.add(1, 1, 1)
+        self.add(2, 3)
+        self.assertEqual(self.assembler.poll(), [])
+        time.sleep(0.1)
+        ready, rejected = self.add(3, 3)    #The set 3 is not timed out
+        self.assertEqual(self.counts(ready), [[(0, 3)], [(1, 1)], [(2, 3)]])
+        self.assertEqual(self.telemetry.snapshot()['incomplete'], 2)
+        self.assertEqual(list(self.assembler.sets), [3])
+
+    def test_max_bytes(self):
+        assembler = BracketAssembler(self.telemetry, timeout=10., maxBytes=25)
+        assembler.add(*shot(0, 3))
+        assembler.add(*shot(1, 3))
+        ready, rejected = assembler.add(*shot(2, 3))
+        self.assertEqual([shots[0][0]['count'] for shots in ready], [0])
+        self.assertEqual(assembler.bytes, 20)
+
+    def test_flush(self):
+        self.add(1, 3)
+        self.add(0, 3)
+        ready = self.assembler.flush()
+        self.assertEqual(self.counts(ready), [[(0, 3)], [(1, 3)]])
+        self.assertEqual(self.assembler.bytes, 0)
+        self.assertEqual(self.assembler.sets, {})
+
+    def test_two_captures(self):
+        for capture in range(2) :
+            for count in range(3) :
+                for bracket in (3, 2) :
+                    self.add(count, bracket)
+                ready, rejected = self.add(count, 1)
+                self.assertEqual(rejected, [])
+                self.assertEqual(self.counts(ready), [[(count, 3), (count, 2), (count, 1)]])
+            self.assertEqual(self.assembler.flush(), [])
+        ready, rejected = self.add(0, 1)    #The size of the sets is not the one of the last capture
+        self.assertEqual(self.counts(ready), [[(0, 1)]])
+        self.assertNotIn('rejected', self.telemetry.snapshot())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import sys
+import glob
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+
+from CaptureArchive import *
+
+def header(count, bracket):
+    return {'type':HEADER_IMAGE, 'count':count, 'bracket':bracket, 'shutter':1000 + count, 'gains':(1.5, 2.)}
+
+def jpeg(count, bracket):
+    return b'\xff\xd8%i_%i\xff\xd9' % (count, bracket)
+
+class CaptureArchiveTest(unittest.TestCase) :
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.temp.name, 'archive')
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def write(self, counts, brackets=(2, 1), processed=False, writer=None):
+        writer = writer or ArchiveWriter(self.directory, segmentSize=64)
+        for count in counts :
+            for bracket in brackets :
+                writer.append(header(count, bracket), jpeg(count, bracket))
+            if processed :
+                writer.append(header(count, 1), b'processed%i' % count, RECORD_PROCESSED)
+        return writer
+
+    def test_round_trip(self):
+        self.write(range(5)).close()
+        reader = ArchiveReader(self.directory)
+        self.assertEqual(len(reader), 10)
+        self.assertEqual(reader.sessions, [0])
+        h, payload = reader.shot(3, 2)
+        self.assertEqual(bytes(payload), jpeg(3, 2))
+        self.assertEqual(h['shutter'], 1003)
+        self.assertEqual(h['gains'], (1.5, 2.))
+        self.assertEqual([(h['count'], h['bracket']) for h, payload in reader][:3], [(0, 2), (0, 1), (1, 2)])
+        del h, payload
+        reader.close()
+        self.assertGreater(len(glob.glob(os.path.join(self.directory, 'capture_*.seg'))), 1)
+
+    def test_processed(self):
+        self.write(range(2), processed=True).close()
+        reader = ArchiveReader(self.directory)
+        h, payload = reader.shot(1, 1, kind=RECORD_PROCESSED)
+        self.assertEqual(bytes(payload), b'processed1')
+        self.assertEqual(bytes(reader.shot(1, 1)[1]), jpeg(1, 1))
+        self.assertEqual(exportName(reader, 2, reader.record(2)[0]), 'image_00000.jpg')
+        self.assertEqual(exportName(reader, 0, reader.record(0)[0]), 'image_00000_02.jpg')
+        del h, payload
+        reader.close()
+
+    def test_sessions(self):
+        writer = self.write(range(2))
+        writer.newSession()
+        writer.newSession()     #Empty session not counted
+        self.write(range(3), writer=writer).close()
+        self.write(range(1)).close()    #Continued archive
+        reader = ArchiveReader(self.directory)
+        self.assertEqual(reader.sessions, [0, 1, 2])
+        self.assertEqual(len(reader), 12)
+        self.assertEqual(reader.kind(4), (1, RECORD_SHOT))
+        self.assertEqual(bytes(reader.shot(2, 1, session=1)[1]), jpeg(2, 1))
+        with self.assertRaises(KeyError) :
+            reader.shot(2, 1)   #Not in the last session
+        self.assertEqual(exportName(reader, 4, reader.record(4)[0]), os.path.join('session_001', 'image_00000_02.jpg'))
+        reader.close()
+        output = os.path.join(self.temp.name, 'export')
+        self.assertEqual(export(self.directory, output), 12)
+        self.assertEqual(sorted(os.listdir(output)), ['session_000', 'session_001', 'session_002'])
+        with open(os.path.join(output, 'session_002', 'image_00000_01.jpg'), 'rb') as file :
+            self.assertEqual(file.read(), jpeg(0, 1))
+
+    def test_cut_index(self):
+        self.write(range(2)).close()
+        with open(os.path.join(self.directory, INDEX_NAME), 'ab') as file :
+            file.write(b'\x00'*5)   #Entry cut by a crash
+        self.assertEqual(len(readIndex(self.directory)), 4)
+        self.write(range(1)).close()
+        self.assertEqual(len(ArchiveReader(self.directory)), 6)
+
+if __name__ == '__main__':
+    unittest.main()
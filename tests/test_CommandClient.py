@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import unittest
+import threading
+from queue import Queue
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GUIControl'))
+
+try :
+    from PyQt5.QtCore import QCoreApplication
+    from CommandClient import *
+except ImportError :
+    QCoreApplication = None
+
+## CommandClient: replies matched by request id in any order, callbacks and errors in the GUI thread
+
+#The command channel, the test plays the Pi
+class FakeSock() :
+    def __init__(self):
+        self.sent = Queue()
+        self.replies = Queue()
+
+    def sendObject(self, obj):
+        self.sent.put(obj)
+
+    def receiveObject(self):
+        return self.replies.get()
+
+@unittest.skipUnless(QCoreApplication, 'PyQt5 not installed')
+class CommandClientTest(unittest.TestCase) :
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+
+    def setUp(self):
+        self.sock = FakeSock()
+        self.client = CommandClient(self.sock)
+
+    def tearDown(self):
+        self.sock.replies.put(None)
+        self.client.readerThread.join(5)
+
+#Process the GUI events until condition() or the timeout
+    def processEvents(self, condition, timeout=5.):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline :
+            self.app.processEvents()
+            time.sleep(0.01)
+
+    def test_out_of_order(self):
+        first = self.client.request(OPEN_CAMERA, 2)
+        second = self.client.request(GET_CAMERA_SETTINGS)
+        (firstId, command, arg), (secondId, other) = self.sock.sent.get(), self.sock.sent.get()
+        self.assertEqual((command, arg, other), (OPEN_CAMERA, 2, GET_CAMERA_SETTINGS))
+        self.assertNotEqual(firstId, secondId)
+        self.sock.replies.put((secondId, {'iso':100}, None))   #The long command ends last
+        self.assertEqual(second.result(5), {'iso':100})
+        self.assertFalse(first.done())
+        self.sock.replies.put((firstId, None, None))
+        self.assertIsNone(first.result(5))
+
+    def test_callback_in_gui_thread(self):
+        threads = []
+        self.client.request(GET_CAMERA_SETTINGS, callback=lambda result : threads.append((result, threading.current_thread())))
+        requestId = self.sock.sent.get()[0]
+        self.sock.replies.put((requestId, 'settings', None))
+        self.processEvents(lambda : threads)
+        self.assertEqual(threads, [('settings', threading.main_thread())])
+
+    def test_error(self):
+        errors = []
+        self.client.errorSignal.connect(errors.append)
+        future = self.client.request(START_CAPTURE)
+        requestId = self.sock.sent.get()[0]
+        self.sock.replies.put((requestId, None, 'Camera not open'))
+        with self.assertRaises(RuntimeError) :
+            future.result(5)
+        self.processEvents(lambda : errors)
+        self.assertEqual(errors, ['Camera not open'])
+
+    def test_unknown_reply(self):
+        future = self.client.request(STOP_CAPTURE)
+        requestId = self.sock.sent.get()[0]
+        self.sock.replies.put((requestId + 100, 'late', None))     #Not waited for, ignored
+        self.sock.replies.put((requestId, 'stopped', None))
+        self.assertEqual(future.result(5), 'stopped')
+
+    def test_closed(self):
+        future = self.client.request(START_CAPTURE)
+        self.sock.replies.put(None)
+        with self.assertRaises(ConnectionError) :
+            future.result(5)
+
+if __name__ == '__main__':
+    unittest.main()
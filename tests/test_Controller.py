@@ -0,0 +1,113 @@
+import os
+import sys
+import unittest
+import numpy as np
+import cv2
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GUIControl'))
+
+from SimController import *
+from ResponseCurve import estimateResponse
+
+## The capture chain end to end with the simulated backends (see SimController)
+
+class ControllerTest(unittest.TestCase) :
+    @classmethod
+    def setUpClass(cls):
+        cls.controller = SimController()
+        cls.controller.openCamera()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.controller.close()
+
+    def checkShots(self, payloads):
+        for header, jpeg in payloads :
+            self.assertEqual(jpeg[:2], b'\xff\xd8')
+            self.assertEqual(jpeg[-2:], b'\xff\xd9')
+
+    def test_capture_on_trigger(self):
+        payloads = self.controller.capture({'framerate':30, 'bracket_steps':1, 'shutter_auto_wait':0, \
+                                            'capture_method':CAPTURE_ON_TRIGGER})
+        self.assertGreater(len(payloads), 2, self.controller.output())
+        self.checkShots(payloads)
+        counts = [header['count'] for header, jpeg in payloads]
+        self.assertEqual(counts, list(range(len(counts))))
+        self.assertIn('trigger', payloads[0][0]['stages'])
+
+    def test_record_mjpeg(self):
+        try :
+            payloads = self.controller.capture({'framerate':30, 'bracket_steps':1, 'record_mjpeg':True, 'use_video_port':True, \
+                                                'capture_method':CAPTURE_BASIC})
+        finally :
+            self.controller.call(SET_CAMERA_SETTINGS, {'record_mjpeg':False})
+        self.assertGreater(len(payloads), 10, self.controller.output())
+        self.checkShots(payloads)
+        counts = [header['count'] for header, jpeg in payloads]
+        self.assertEqual(counts, list(range(len(counts))))
+        timestamps = [header['timestamp'] for header, jpeg in payloads]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertIn('num', payloads[0][0])    #Tagged by the recording
+
+    def test_telemetry_bracket_on_trigger(self):
+        snapshots = len(self.controller.snapshots)
+        payloads = self.controller.capture({'framerate':30, 'bracket_steps':3, 'shutter_auto_wait':1, 'shutter_speed_wait':1, \
+                                            'predictive_exposure':False, 'capture_method':CAPTURE_ON_TRIGGER}, duration=2.5)
+        self.assertGreater(len(payloads), 2, self.controller.output())
+        self.assertGreater(len(self.controller.snapshots), snapshots, self.controller.output())
+        snapshot = self.controller.snapshots[-1]
+        self.assertIsInstance(snapshot['motor_speed'], float)
+        self.assertIn('send', snapshot)
+
+    def test_predictive_bracket_on_trigger(self):
+        payloads = self.controller.capture({'framerate':30, 'bracket_steps':3, 'shutter_auto_wait':0, 'shutter_speed_wait':0, \
+                                            'bracket_light_coefficient':2., 'bracket_dark_coefficient':0.5, \
+                                            'predictive_exposure':True, 'adaptive_bracket':False, \
+                                            'capture_method':CAPTURE_ON_TRIGGER}, duration=3.)
+        self.assertGreater(len(payloads), 5, self.controller.output())
+        self.checkShots(payloads)
+        self.assertNotIn('No frame analysis', self.controller.output())
+        frames = {}
+        for header, jpeg in payloads :
+            frames.setdefault(header['count'], []).append(header)
+        for count, headers in frames.items() :
+            self.assertEqual([h['bracket'] for h in headers], [3, 2, 1][:len(headers)])
+            normal = headers[0]['shutter']
+            if len(headers) == 3 :
+                self.assertEqual([h['shutter'] for h in headers], [normal, normal*2, normal//2])
+
+    def test_adaptive_bracket(self):
+        payloads = self.controller.capture({'framerate':30, 'bracket_steps':3, 'shutter_auto_wait':0, 'shutter_speed_wait':0, \
+                                            'bracket_light_coefficient':2., 'bracket_dark_coefficient':0.1, \
+                                            'predictive_exposure':False, 'adaptive_bracket':True, \
+                                            'capture_method':CAPTURE_BASIC})
+        self.checkShots(payloads)
+        frames = {}
+        for header, jpeg in payloads :
+            frames.setdefault(header['count'], []).append(header)
+        self.assertEqual(sorted(frames), list(range(len(frames))))
+        for count, headers in frames.items() :
+            shots = headers[0]['shots']
+            self.assertEqual([h['bracket'] for h in headers], list(range(shots, 0, -1)))
+            self.assertEqual([h['shots'] for h in headers], [shots]*shots)
+        self.assertIn(1, [headers[0]['shots'] for headers in frames.values()])     #The synthetic frames fit in one exposure
+
+    def test_calibrate_hdr(self):
+        self.controller.call(SET_CAMERA_SETTINGS, {'framerate':30, 'shutter_speed_wait':1})
+        self.controller.call(CALIBRATE_HDR, 5, 1)
+        payloads = self.controller.waitPayloads(HEADER_HDR, 5)
+        self.assertEqual([header['num'] for header, jpeg in payloads], list(range(5)))
+        shutters = [header['shutter'] for header, jpeg in payloads]
+        self.assertEqual(shutters, sorted(shutters))
+        self.assertAlmostEqual(shutters[-1]/shutters[0], 4., delta=0.1)
+        settings = self.controller.call(GET_CAMERA_SETTINGS)
+        self.assertEqual(settings['exposure_mode'], 'auto')     #Restored
+        self.assertEqual(settings['shutter_speed'], 0)
+        images = [cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR) for header, jpeg in payloads]
+        response = estimateResponse(images, shutters)
+        self.assertEqual(response.shape, (256, 1, 3))
+        self.assertTrue(np.all(np.isfinite(response)))
+
+if __name__ == '__main__':
+    unittest.main()
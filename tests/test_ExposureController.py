@@ -0,0 +1,94 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Raspberry'))
+
+from Telemetry import *
+from ExposureController import *
+
+class FakeCamera() :
+    def __init__(self):
+        self.framerate = 25
+        self.exposure_speed = 10000
+        self.shutter_speed = 0
+        self.exposure_mode = 'auto'
+
+class FakeAnalysis() :
+    def __init__(self, mean):
+        self.mean = mean
+
+    def luminance(self):
+        return self.mean
+
+class ExposureControllerTest(unittest.TestCase) :
+    def setUp(self):
+        self.camera = FakeCamera()
+        self.analysis = FakeAnalysis(100.)
+        self.telemetry = Telemetry()
+        self.controller = ExposureController(self.camera, self.analysis, self.telemetry)
+
+    def test_start(self):
+        self.assertTrue(self.controller.start())
+        self.assertEqual(self.controller.reference, 100.)
+        self.assertEqual(self.camera.shutter_speed, 10000)
+        self.assertEqual(self.camera.exposure_mode, 'off')
+
+    def test_start_without_analysis(self):
+        self.analysis.mean = None
+        self.assertFalse(self.controller.start())
+        self.assertEqual(self.camera.exposure_mode, 'auto')
+        self.assertEqual(self.camera.shutter_speed, 0)
+
+    def test_program(self):
+        self.assertEqual(self.controller.maxSpeed, 40000)
+        self.assertEqual(self.controller.program(100000), 40000)
+        self.assertEqual(self.controller.program(0.2), 1)
+        self.assertEqual(self.camera.shutter_speed, 1)
+        self.controller.frame()
+        self.controller.program(1)      #Same speed, the delay goes on
+        self.assertEqual(self.controller.frames, 1)
+        self.controller.program(2000)
+        self.assertEqual(self.controller.frames, 0)
+
+    def test_applied(self):
+        self.controller.program(20000)
+        self.camera.exposure_speed = 20000
+        for i in range(EXPOSURE_DELAY) :
+            self.assertFalse(self.controller.applied())
+            self.controller.frame()
+        self.assertTrue(self.controller.applied())
+        self.camera.exposure_speed = int(20000*(1. + EXPOSURE_TOLERANCE/2))
+        self.assertTrue(self.controller.applied())
+
+    def test_late(self):
+        self.controller.program(20000)
+        self.camera.exposure_speed = 10000
+        for i in range(EXPOSURE_DELAY + MAX_EXTRA_FRAMES) :
+            self.assertFalse(self.controller.applied())
+            self.controller.frame()
+        self.assertTrue(self.controller.applied())
+        self.assertEqual(self.telemetry.snapshot()['exposure_late'], 1)
+
+    def test_delay(self):
+        controller = ExposureController(self.camera, self.analysis, self.telemetry, delay=0)
+        controller.program(10000)
+        self.assertTrue(controller.applied())
+
+    def test_predict(self):
+        self.controller.start()
+        self.assertAlmostEqual(self.controller.predict(10000), 10000)
+        self.analysis.mean = 80.
+        self.assertAlmostEqual(self.controller.predict(10000), 10000*(100./80.)**GAMMA)
+        self.analysis.mean = 1.
+        self.assertAlmostEqual(self.controller.predict(10000), 10000*MAX_CORRECTION)
+        self.analysis.mean = 150.
+        self.assertAlmostEqual(self.controller.predict(10000), 10000*(100./150.)**GAMMA)
+        self.analysis.mean = 255.
+        self.assertAlmostEqual(self.controller.predict(10000), 10000/MAX_CORRECTION)
+        self.analysis.mean = None
+        self.assertEqual(self.controller.predict(10000), 10000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import sys
+import unittest
+import numpy as np
+import cv2
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GUIControl'))
+
+from FastFusion import *
+
+## FastFusion: close to cv2.MergeMertens, buffers allocated once per size
+
+class FastFusionTest(unittest.TestCase) :
+    def test_close_to_mertens(self):
+        images = syntheticBracket(320, 240)
+        reference = cv2.createMergeMertens(1., 1., 1.).process(images)
+        result = FastFusion().process(images)
+        self.assertEqual(result.shape, reference.shape)
+        self.assertEqual(result.dtype, np.float32)
+        self.assertGreater(psnr(result, reference), 40.)
+
+    def test_odd_size(self):
+        images = syntheticBracket(161, 97)
+        reference = cv2.createMergeMertens(1., 1., 1.).process(images)
+        result = FastFusion().process(images)
+        self.assertEqual(result.shape, (97, 161, 3))
+        self.assertGreater(psnr(result, reference), 40.)
+
+    def test_two_shots(self):
+        images = syntheticBracket(128, 96)[:2]
+        result = FastFusion().process(images)
+        self.assertTrue(np.isfinite(result).all())
+
+#The result is a buffer of the engine, reallocated only when the size changes
+    def test_buffers_reused(self):
+        fusion = FastFusion()
+        images = syntheticBracket(128, 96)
+        first = fusion.process(images)
+        expected = first.copy()
+        self.assertIs(fusion.process(images), first)
+        np.testing.assert_array_equal(first, expected)
+        self.assertEqual(fusion.process(syntheticBracket(64, 48)).shape, (48, 64, 3))
+
+if __name__ == '__main__':
+    unittest.main()
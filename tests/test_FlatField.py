@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GUIControl'))
+
+from FlatField import *
+
+## FlatField: low resolution grid of gains, 8 bits gains of the frame size, calibrate.npz
+
+class FlatFieldTest(unittest.TestCase) :
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp.name, CALIBRATION_FILE)
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+#Vignetting: gains from 1 in the center to 0.6 in the corners
+    def table(self, h, w):
+        y, x = np.mgrid[:h, :w]
+        r = np.hypot((x - w/2.)/(w/2.), (y - h/2.)/(h/2.))/np.sqrt(2.)
+        return np.repeat((1. - 0.4*r*r)[..., None], 3, axis=2)
+
+    def test_grid(self):
+        grid = toGrid(self.table(100, 150))
+        self.assertEqual(grid.shape, (7, 10, 3))    #Rounded up
+        self.assertEqual(grid.dtype, np.float32)
+
+    def test_apply_uint8(self):
+        table = self.table(240, 320)
+        image = np.random.RandomState(0).randint(0, 256, (240, 320, 3)).astype(np.uint8)
+        expected = image*table
+        flatField = FlatField(toGrid(table))
+        result = flatField.apply(image)
+        self.assertIs(result, image)        #In place
+        error = np.abs(result - expected)
+        self.assertLess(error[GRID_STEP:-GRID_STEP, GRID_STEP:-GRID_STEP].max(), 2.)  #The outer half blocks extrapolated
+        self.assertLess(error.mean(), 0.6)
+
+    def test_apply_float(self):
+        table = self.table(240, 320)
+        image = np.full((240, 320, 3), 0.5, np.float32)
+        result = FlatField(toGrid(table)).apply(image)
+        self.assertEqual(result.dtype, np.float32)
+        self.assertEqual(image[0, 0, 0], 0.5)   #Not in place
+        error = np.abs(result - 0.5*table)
+        self.assertLess(error[GRID_STEP:-GRID_STEP, GRID_STEP:-GRID_STEP].max(), 0.005)
+        self.assertLess(error.mean(), 0.002)
+
+    def test_gains_cached(self):
+        flatField = FlatField(toGrid(self.table(64, 80)))
+        gains = flatField.gainsFor((64, 80, 3))
+        self.assertIs(flatField.gainsFor((64, 80, 3)), gains)
+        self.assertEqual(flatField.gainsFor((32, 40, 3)).shape, (32, 40, 3))
+
+    def test_save_load(self):
+        self.assertIsNone(loadGrid(self.path))
+        grid = toGrid(self.table(64, 80))
+        saveGrid(grid, self.path)
+        np.testing.assert_array_equal(loadGrid(self.path), grid)
+
+#calibrate.npz of the previous versions: the full size table
+    def test_load_table(self):
+        table = self.table(64, 80)
+        np.savez(self.path, table=table)
+        np.testing.assert_allclose(loadGrid(self.path), toGrid(table))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+
+from FlowControl import *
+
+class CreditGateTest(unittest.TestCase) :
+    def test_credit_message(self):
+        self.assertEqual(decodeCredit(encodeCredit(123456789)), 123456789)
+        self.assertEqual(len(encodeCredit(1)), CREDIT_STRUCT.size)
+
+    def test_try_acquire(self):
+        gate = CreditGate(1000)
+        self.assertFalse(gate.tryAcquire(10))
+        gate.grant(100)
+        self.assertTrue(gate.tryAcquire(60))
+        self.assertFalse(gate.tryAcquire(60))
+        self.assertEqual(gate.credits, 40)
+
+    def test_larger_than_window(self):
+        gate = CreditGate(1000)
+        gate.grant(1000)
+        self.assertTrue(gate.tryAcquire(5000))  #Waits for the whole window only
+        self.assertEqual(gate.credits, -4000)
+
+    def test_acquire(self):
+        gate = CreditGate(1000)
+        gate.grant(100)
+        gate.enqueue(50)
+        self.assertTrue(gate.acquire(50))
+        self.assertEqual(gate.queued, 0)
+        gate.enqueue(50)
+        self.assertTrue(gate.acquire(50, dequeue=False))
+        self.assertEqual(gate.queued, 50)
+        gate.dequeue(80)
+        self.assertEqual(gate.queued, 0)
+
+    def test_closed(self):
+        gate = CreditGate(1000)
+        gate.grant(100)
+        gate.close()
+        self.assertFalse(gate.acquire(10))
+        self.assertFalse(gate.tryAcquire(10))
+        self.assertEqual(gate.credits, 90)
+        gate.waitResume()
+
+    def test_speed_factor(self):
+        gate = CreditGate(1000)
+        gate.grant(1000)
+        self.assertEqual(gate.available(), 1.)
+        self.assertEqual(gate.speedFactor(), 1.)
+        gate.enqueue(500)
+        self.assertEqual(gate.speedFactor(), 1.)
+        gate.enqueue(200)
+        self.assertAlmostEqual(gate.speedFactor(), 0.5)
+        gate.enqueue(200)
+        self.assertEqual(gate.speedFactor(), 0.)
+
+if __name__ == '__main__':
+    unittest.main()
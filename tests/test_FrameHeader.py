@@ -0,0 +1,41 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+
+from FrameHeader import *
+
+class FrameHeaderTest(unittest.TestCase) :
+    def test_round_trip(self):
+        header = {'type':HEADER_HDR, 'bracket':3, 'shots':5, 'count':1234, 'num':7, 'shutter':12345, \
+                  'gains':(1.5, 2.25), 'timestamp':10.5, 'stages':{'trigger':1., 'send':2.}}
+        self.assertEqual(decodeHeader(encodeHeader(header)), header)
+
+    def test_defaults(self):
+        header = decodeHeader(encodeHeader({'type':HEADER_IMAGE}))
+        self.assertEqual(header, {'type':HEADER_IMAGE, 'bracket':0, 'count':0, 'num':0, 'shutter':0, \
+                                  'gains':(0., 0.), 'timestamp':0., 'stages':{}})
+
+    def test_message(self):
+        buf = encodeHeader({'type':HEADER_MESSAGE, 'msg':'Camera opened é'})
+        self.assertEqual(len(buf), HEADER_SCHEMAS[HEADER_VERSION].size + len('Camera opened é'.encode()))
+        self.assertEqual(decodeHeader(memoryview(buf))['msg'], 'Camera opened é')
+
+    def test_version1(self):
+        buf = HEADER_SCHEMAS[1].pack(1, HEADER_IMAGE, 2, 42, 3, 1000, 1.5, 2., 7.)
+        self.assertEqual(decodeHeader(buf), {'type':HEADER_IMAGE, 'bracket':2, 'count':42, 'num':3, \
+                                             'shutter':1000, 'gains':(1.5, 2.), 'timestamp':7.})
+
+    def test_version2(self):
+        buf = HEADER_SCHEMAS[2].pack(2, HEADER_IMAGE, 1, 42, 3, 1000, 1.5, 2., 7., 1., 0., 3., 0., 0.)
+        header = decodeHeader(buf)
+        self.assertEqual(header['stages'], {'trigger':1., 'encode':3.})
+        self.assertNotIn('shots', header)
+
+    def test_unknown_version(self):
+        with self.assertRaises(ValueError) :
+            decodeHeader(bytes([99]) + bytes(HEADER_SCHEMAS[HEADER_VERSION].size))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Raspberry'))
+
+from FrameRing import *
+
+## FrameRing: records contiguous in the buffer, released in order, moved to the start at the end
+
+class FrameRingTest(unittest.TestCase) :
+    def frame(self, ring, data):
+        record = ring.start()
+        record.write(data)
+        record.commit()
+        return record
+
+    def test_write_commit_release(self):
+        ring = FrameRing(100)
+        record = self.frame(ring, b'abc')
+        self.assertEqual(bytes(record.getbuffer()), b'abc')
+        self.assertEqual(record.tell(), 3)
+        self.assertEqual(ring.stats()['used'], 3)
+        record.release()
+        self.assertEqual(ring.stats()['used'], 0)
+        self.assertEqual(ring.stats()['records'], 0)
+
+    def test_records_follow(self):
+        ring = FrameRing(100)
+        first = self.frame(ring, b'a'*30)
+        second = self.frame(ring, b'b'*30)
+        self.assertEqual(second.start, 30)
+        self.assertEqual(bytes(first.getbuffer()), b'a'*30)
+        self.assertEqual(bytes(second.getbuffer()), b'b'*30)
+
+    def test_release_in_order(self):
+        ring = FrameRing(100)
+        first = self.frame(ring, b'a'*30)
+        second = self.frame(ring, b'b'*30)
+        second.release()
+        self.assertEqual(ring.stats()['used'], 60)  #Waits for the oldest
+        first.release()
+        self.assertEqual(ring.stats()['used'], 0)
+
+    def test_move_to_start(self):
+        ring = FrameRing(100)
+        first = self.frame(ring, b'a'*40)
+        second = self.frame(ring, b'b'*40)
+        first.release()
+        record = ring.start()
+        record.write(b'c'*10)
+        record.write(b'd'*20)       #Does not fit at the end, moved to the beginning
+        self.assertEqual(ring.stats()['moves'], 1)
+        self.assertEqual(record.start, 0)
+        self.assertEqual(bytes(record.getbuffer()), b'c'*10 + b'd'*20)
+        record.commit()
+        self.assertEqual(bytes(second.getbuffer()), b'b'*40)
+        second.release()
+        record.release()
+        self.assertEqual(ring.stats()['used'], 0)
+
+    def test_wrapped_stays_behind_oldest(self):
+        ring = FrameRing(100)
+        first = self.frame(ring, b'a'*40)
+        second = self.frame(ring, b'b'*40)
+        first.release()
+        third = self.frame(ring, b'c'*30)   #Moved to the beginning
+        record = ring.start()
+        self.assertEqual(record.start, 30)
+        self.assertTrue(ring.room(record, 10))
+        self.assertFalse(ring.room(record, 11))  #Would overwrite the second record
+
+    def test_too_large(self):
+        ring = FrameRing(100)
+        record = ring.start()
+        with self.assertRaises(ValueError) :
+            record.write(b'x'*101)
+
+    def test_truncate(self):
+        ring = FrameRing(100)
+        record = ring.start()
+        record.write(b'abcdef')
+        record.seek(0)
+        record.truncate(0)
+        self.assertEqual(record.tell(), 0)
+        self.assertEqual(ring.stats()['used'], 0)
+        record.write(b'xy')
+        self.assertEqual(bytes(record.getbuffer()), b'xy')
+
+    def test_discard_abort(self):
+        ring = FrameRing(100, maxRecords=2)
+        record = ring.start()
+        record.write(b'abc')
+        record.discard()
+        self.assertEqual(ring.stats()['used'], 0)
+        self.assertEqual(len(ring.free), 2)
+        ring.start().write(b'abc')
+        ring.abort()
+        self.assertIsNone(ring.current)
+        self.assertEqual(ring.stats()['used'], 0)
+        self.assertEqual(len(ring.free), 2)
+
+    def test_no_wait(self):
+        ring = FrameRing(100, maxRecords=2)
+        first = self.frame(ring, b'a'*60)
+        record = ring.start(False)
+        self.assertIsNone(ring.write(record, b'b'*50, False))     #Full
+        self.assertEqual(ring.write(record, b'b'*40, False), 40)
+        record.commit()
+        self.assertIsNone(ring.start(False))    #No record free
+        self.assertEqual(ring.stats()['waits'], 0)
+        first.release()
+        self.assertIsNotNone(ring.start(False))
+
+if __name__ == '__main__':
+    unittest.main()
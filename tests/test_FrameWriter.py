@@ -0,0 +1,109 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+import cv2
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GUIControl'))
+
+from Telemetry import *
+from CaptureArchive import *
+from FrameWriter import *
+import FrameWriter as FrameWriterModule
+
+def jpeg(count, bracket):
+    return b'\xff\xd8%i_%i\xff\xd9' % (count, bracket)
+
+class FrameWriterTest(unittest.TestCase) :
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.directory = self.temp.name
+        self.telemetry = Telemetry()
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_write(self):
+        writer = FrameWriter(self.telemetry)
+        image = np.full((48, 64, 3), 128, np.uint8)
+        futures = [writer.write(self.path('a.jpg'), data=memoryview(jpeg(0, 0))), writer.write(self.path('b.jpg'), image=image)]
+        for future in futures :
+            self.assertIsInstance(future.result(5), float)
+        writer.close()
+        with open(self.path('a.jpg'), 'rb') as file :
+            self.assertEqual(file.read(), jpeg(0, 0))
+        self.assertEqual(cv2.imread(self.path('b.jpg')).shape, image.shape)
+        self.assertIn('write_queue', self.telemetry.snapshot())
+
+    def test_error(self):
+        writer = FrameWriter(self.telemetry)
+        future = writer.write(self.path('missing/a.jpg'), data=b'x')
+        with self.assertRaises(OSError) :
+            future.result(5)
+        writer.close()
+
+    def test_closed(self):
+        writer = FrameWriter(self.telemetry)
+        writer.close()
+        with self.assertRaises(RuntimeError) :
+            writer.write(self.path('a.jpg'), data=b'x').result(1)
+
+    def test_archive_sets(self):
+        writer = FrameWriter(self.telemetry, threads=4)
+        archive = ArchiveWriter(self.path('archive'))
+        image = np.full((48, 64, 3), 128, np.uint8)
+        futures = []
+        for count in range(40) :
+            shots = [({'type':HEADER_IMAGE, 'count':count, 'bracket':bracket}, jpeg(count, bracket)) for bracket in (3, 2, 1)]
+            futures.append(writer.append(archive, shots, image))
+        for future in futures :
+            future.result(5)
+        writer.close()
+        archive.close()
+        reader = ArchiveReader(self.path('archive'))
+        entries = [(entry[1], entry[2], entry[3]) for entry in reader.entries]
+        self.assertEqual(len(entries), 160)
+        for i in range(0, 160, 4) :     #The records of a frame one after the other
+            count = entries[i][0]
+            self.assertEqual(entries[i:i + 4], [(count, 3, RECORD_SHOT), (count, 2, RECORD_SHOT), (count, 1, RECORD_SHOT), \
+                                                (count, 1, RECORD_PROCESSED)])
+        self.assertEqual(bytes(reader.shot(7, 2)[1]), jpeg(7, 2))
+        reader.close()
+
+    def test_sync(self):
+        synced = []
+        fsync = FrameWriterModule.os.fsync
+        FrameWriterModule.os.fsync = lambda fd : synced.append(fd) or fsync(fd)
+        try :
+            writer = FrameWriter(self.telemetry, threads=1, syncEvery=3)
+            futures = []
+            for i in range(4) :
+                future = writer.write(self.path('%i.jpg' % i), data=jpeg(i, 0))
+                future.add_done_callback(lambda f : futures.append(len(synced)))
+            writer.write(self.path('image.jpg'), image=np.zeros((16, 16, 3), np.uint8)).result(5)
+            writer.close()
+        finally :
+            FrameWriterModule.os.fsync = fsync
+        self.assertEqual(len(futures), 4)
+        self.assertNotIn(0, futures)    #Set once flushed to the disk
+        self.assertGreaterEqual(len(synced), 5)
+        for i in range(4) :
+            with open(self.path('%i.jpg' % i), 'rb') as file :
+                self.assertEqual(file.read(), jpeg(i, 0))
+
+    def test_sync_archive(self):
+        archive = ArchiveWriter(self.path('archive'))
+        writer = FrameWriter(self.telemetry, threads=2, syncEvery=2)
+        shots = [({'type':HEADER_IMAGE, 'count':0, 'bracket':0}, jpeg(0, 0))]
+        writer.append(archive, shots).result(5)     #Alone in the queue, synced
+        writer.close()
+        archive.close()
+        self.assertEqual(len(ArchiveReader(self.path('archive'))), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GUIControl'))
+
+from HistogramOverlay import *
+
+class HistogramOverlayTest(unittest.TestCase) :
+    def setUp(self):
+        self.overlay = HistogramOverlay()
+        self.image = np.zeros((480, 640, 3), np.uint8)
+        self.image[:, 320:] = (10, 100, 255)
+
+    def test_compute(self):
+        histos = self.overlay.compute(self.image)
+        total = SAMPLE_SIZE[0]*SAMPLE_SIZE[1]
+        self.assertEqual(histos.shape, (256, 3))
+        self.assertEqual(list(histos.sum(axis=0)), [total]*3)
+        self.assertEqual(list(histos[0]), [total/2]*3)
+        self.assertEqual([histos[10, 0], histos[100, 1], histos[255, 2]], [total/2]*3)
+
+    def test_render(self):
+        buffer = self.overlay.render(self.overlay.compute(self.image))
+        self.assertEqual(buffer.shape, (HEIGHT, WIDTH, 3))
+        self.assertEqual(list(buffer[:, :CLIP_WIDTH].min(axis=(0, 1))), [255]*3)      #Shadows clipped
+        self.assertEqual(list(buffer[:, -CLIP_WIDTH:].max(axis=(0, 1))), [BACKGROUND, BACKGROUND, 255])
+        self.assertEqual(list(buffer[:, 100].min(axis=0)), [BACKGROUND, 255, BACKGROUND])   #Full column
+        self.assertEqual(list(buffer[:, 200].max(axis=0)), [BACKGROUND]*3)
+
+    def test_draw(self):
+        image = self.image.copy()
+        self.overlay.draw(image)
+        hh = HEIGHT*160//WIDTH      #A quarter of the width
+        self.assertEqual(list(image[hh//2, 0]), [255, 255, 255])     #Shadows clipped stripe
+        np.testing.assert_array_equal(image[hh:], self.image[hh:])
+        np.testing.assert_array_equal(image[:, 160:], self.image[:, 160:])
+
+if __name__ == '__main__':
+    unittest.main()
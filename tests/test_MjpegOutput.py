@@ -0,0 +1,110 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Raspberry'))
+
+from FrameRing import *
+from MjpegOutput import *
+
+def frame(i, size):
+    body = bytes(random.Random(i).randrange(256) for j in range(size)).replace(b'\xff\xd9', b'\xff\x00')
+    return SOI + body + EOI
+
+class MjpegOutputTest(unittest.TestCase) :
+    def setUp(self):
+        self.ring = FrameRing(1024*1024)
+        self.frames = []
+        self.exposures = []
+        self.selected = iter(range(1000))
+
+    def select(self):
+        return next(self.selected)
+
+    def done(self, record, exposure):
+        self.frames.append(bytes(record.getbuffer()))
+        self.exposures.append(exposure)
+        record.commit()
+        record.release()
+
+    def output(self):
+        return MjpegOutput(self.ring, self.select, self.done)
+
+    def stream(self, n=20):
+        return [frame(i, 100 + 37*i) for i in range(n)]
+
+    def test_one_write(self):
+        frames = self.stream()
+        output = self.output()
+        self.assertEqual(output.write(b''.join(frames)), sum(len(f) for f in frames))
+        self.assertEqual(self.frames, frames)
+        self.assertEqual(self.exposures, list(range(20)))
+
+    def test_random_writes(self):
+        frames = self.stream()
+        data = b''.join(frames)
+        rand = random.Random(0)
+        output = self.output()
+        pos = 0
+        while pos < len(data) :
+            n = rand.randrange(1, 200)
+            output.write(memoryview(data)[pos:pos + n])
+            pos += n
+        self.assertEqual(self.frames, frames)
+
+    def test_byte_writes(self):
+        frames = self.stream(5)
+        output = self.output()
+        for b in b''.join(frames) :
+            output.write(bytes([b]))
+        self.assertEqual(self.frames, frames)
+        self.assertEqual(output.frames, 5)
+
+    def test_dropped(self):
+        frames = self.stream(6)
+        self.selected = iter([0, None, 2, None, 4, 5])
+        output = self.output()
+        output.write(b''.join(frames))
+        self.assertEqual(self.frames, [frames[i] for i in (0, 2, 4, 5)])
+        self.assertEqual(self.exposures, [0, 2, 4, 5])
+        self.assertEqual(output.dropped, 2)
+        self.assertEqual(self.ring.stats()['used'], 0)
+
+    def test_close(self):
+        frames = self.stream(2)
+        output = self.output()
+        output.write(frames[0] + frames[1][:50])
+        output.close()
+        self.assertEqual(self.frames, frames[:1])
+        self.assertEqual(self.ring.stats()['used'], 0)
+        self.assertIsNone(self.ring.current)
+
+    def test_ring_full(self):
+        self.ring = FrameRing(1300)
+        kept = []
+        self.done = lambda record, exposure : (record.commit(), kept.append(record))    #Not sent yet
+        frames = [frame(i, 400) for i in range(6)]
+        output = self.output()
+        output.write(b''.join(frames[:4]))      #The 4th has no room, dropped without waiting
+        self.assertEqual([bytes(record.getbuffer()) for record in kept], frames[:3])
+        self.assertEqual(output.overflows, 1)
+        self.assertEqual(output.dropped, 1)
+        for record in kept :
+            record.release()
+        output.write(b''.join(frames[4:]))
+        self.assertEqual(bytes(kept[-1].getbuffer()), frames[5])
+        self.assertEqual(output.frames, 5)
+        self.assertEqual(self.ring.stats()['waits'], 0)
+
+    def test_no_free_record(self):
+        self.ring = FrameRing(1024*1024, maxRecords=2)
+        self.done = lambda record, exposure : record.commit()
+        output = self.output()
+        output.write(b''.join(self.stream(4)))
+        self.assertEqual(output.frames, 2)
+        self.assertEqual(output.overflows, 2)
+        self.assertEqual(self.ring.stats()['waits'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import socket
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+
+from Constants import *
+from MultiplexSocket import *
+
+## MultiplexSocket: channels interleaved on one connection, commands ahead of the frames
+
+def payload(i, size):
+    return bytes((i + j) & 0xff for j in range(size))
+
+class MultiplexSocketTest(unittest.TestCase) :
+    def setUp(self):
+        with socket.socket() as listener :      #TCP, not socketpair: TCP_NODELAY is set
+            listener.bind(('127.0.0.1', 0))
+            listener.listen(1)
+            pc = socket.create_connection(listener.getsockname())
+            self.pc = MultiplexSocket(pc)
+            self.pi = MultiplexSocket(listener.accept()[0])
+
+    def tearDown(self):
+        self.pc.close()
+        self.pi.close()
+
+    def test_messages(self):
+        sock, peer = self.pi.channel(CHANNEL_FRAME), self.pc.channel(CHANNEL_FRAME)
+        sizes = [0, 1, MultiplexSocket.chunkSize, MultiplexSocket.chunkSize + 1, 200000]
+        for i, size in enumerate(sizes) :
+            sock.sendMsg(payload(i, size))
+        for i, size in enumerate(sizes) :
+            buf = peer.receiveMsg()
+            self.assertEqual(bytes(buf), payload(i, size))
+            peer.release(buf)
+        sock.sendHeader({'type':HEADER_IMAGE, 'count':3, 'bracket':1}, payload(9, 5000))
+        self.assertEqual(peer.receiveHeader()['count'], 3)
+        self.assertEqual(bytes(peer.receiveMsg()), payload(9, 5000))
+
+    def test_request_reply(self):
+        commands = self.pc.channel(CHANNEL_COMMAND, CHANNEL_REPLY)
+        controller = self.pi.channel(CHANNEL_REPLY, CHANNEL_COMMAND)
+        commands.sendObject((1, 'open', (640, 480)))
+        self.assertEqual(controller.receiveObject(), (1, 'open', (640, 480)))
+        controller.sendObject((1, None, None))
+        self.assertEqual(commands.receiveObject(), (1, None, None))
+
+#A command queued after a large frame is not sent after the whole frame
+    def test_priority(self):
+        frame = payload(0, 4*1024*1024)
+        sent = self.pi.send(CHANNEL_FRAME, [memoryview(frame)])
+        self.pi.channel(CHANNEL_REPLY).sendObject('reply')
+        self.assertEqual(self.pc.channel(CHANNEL_REPLY).receiveObject(), 'reply')
+        self.assertTrue(self.pc.queue(CHANNEL_FRAME).empty())
+        sent.wait(10)
+        self.assertEqual(bytes(self.pc.channel(CHANNEL_FRAME).receiveMsg()), frame)
+
+    def test_closed(self):
+        channel = self.pc.channel(CHANNEL_TELEMETRY)
+        self.pi.shutdown()
+        self.pi.close()
+        self.assertIsNone(channel.receiveMsg())
+        self.assertIsNone(channel.receiveMsg())     #For every later call
+        self.assertIsNone(self.pc.channel(CHANNEL_FRAME).receiveMsg())
+        self.assertTrue(self.pc.send(CHANNEL_COMMAND, [memoryview(b'x')]).wait(10))    #Not blocked
+
+if __name__ == '__main__':
+    unittest.main()
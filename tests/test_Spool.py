@@ -0,0 +1,89 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Raspberry'))
+
+from SegmentFile import *
+from Spool import *
+
+class SegmentFileTest(unittest.TestCase) :
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.directory = self.temp.name
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def test_round_trip(self):
+        writer = SegmentWriter(self.directory, 'test', segmentSize=100)
+        records = [(b'h%i' % i, bytes([i])*(i*20)) for i in range(10)]
+        positions = [writer.append(header, payload) for header, payload in records]
+        writer.close()
+        self.assertGreater(positions[-1][0], 0)     #Several segments
+        self.assertEqual(positions[0], (0, len(SEGMENT_MAGIC)))
+        reader = SegmentReader(self.directory, 'test')
+        for header, payload in records :
+            h, p = reader.read()
+            self.assertEqual(h, header)
+            self.assertEqual(bytes(p), payload)
+        self.assertIsNone(reader.read())
+        reader.close()
+
+    def test_delete_read(self):
+        writer = SegmentWriter(self.directory, 'test', segmentSize=10)
+        for i in range(3) :
+            writer.append(b'h', b'x'*20)
+        writer.close()
+        reader = SegmentReader(self.directory, 'test', deleteRead=True)
+        while reader.read() != None :
+            pass
+        reader.close()
+        self.assertEqual(len(os.listdir(self.directory)), 1)   #The last one is kept
+
+    def test_bad_magic(self):
+        with open(segmentName(self.directory, 'test', 0), 'wb') as file :
+            file.write(b'XXXX')
+        reader = SegmentReader(self.directory, 'test')
+        with self.assertRaises(ValueError) :
+            reader.read()
+        reader.close()
+
+class SpoolTest(unittest.TestCase) :
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.spool = Spool(self.temp.name)
+
+    def tearDown(self):
+        self.spool.close()
+        self.temp.cleanup()
+
+    def test_not_spooled(self):
+        self.assertFalse(self.spool.offer(b'h', b'payload', lambda : True))
+        self.assertFalse(self.spool.stats()['active'])
+
+    def test_order(self):
+        self.assertTrue(self.spool.offer(b'h0', b'p0', lambda : False))
+        self.assertTrue(self.spool.offer(b'h1', b'p1', lambda : True))  #Active, spooled after the first
+        self.assertTrue(self.spool.offer(b'h2', memoryview(b''), lambda : True))
+        self.assertEqual(self.spool.stats()['count'], 3)
+        for i in range(3) :
+            header, payload = self.spool.next()
+            self.assertEqual(header, b'h%i' % i)
+            self.assertEqual(bytes(payload), b'p%i' % i if i < 2 else b'')
+            self.spool.consumed()
+        stats = self.spool.stats()
+        self.assertFalse(stats['active'])
+        self.assertEqual(stats['peak'], 3)
+        self.assertEqual(os.listdir(self.temp.name), [])
+        self.spool.waitEmpty()
+        self.assertFalse(self.spool.offer(b'h', b'p', lambda : True))
+
+    def test_closed(self):
+        self.spool.close()
+        self.assertIsNone(self.spool.next())
+
+if __name__ == '__main__':
+    unittest.main()